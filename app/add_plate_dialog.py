@@ -114,6 +114,12 @@ class AddPlateDialog(QtWidgets.QDialog):
 
         self.apply_modern_style()
 
+        completer = getattr(parent, "plate_completer", None)
+        if completer is not None:
+            completer.attach(self.plate_part1_line_edit, "part1")
+            completer.attach(self.plate_part2_line_edit, "part2")
+            completer.attach(self.phone_number_line_edit, "phone")
+
     def resizeEvent(self, event):
         self.adjust_font_size()
         super(AddPlateDialog, self).resizeEvent(event)
@@ -121,6 +127,9 @@ class AddPlateDialog(QtWidgets.QDialog):
     def adjust_font_size(self):
         base_font_size = 30
         font_size = max(base_font_size, int(self.height() * 0.03))
+        if font_size == getattr(self, "_font_size", None):
+            return  # Unchanged; skip re-laying out the line edits on every resize step
+        self._font_size = font_size
         font = QtGui.QFont()
         font.setPointSize(font_size)
         self.plate_part1_line_edit.setFont(font)
@@ -144,7 +153,7 @@ class AddPlateDialog(QtWidgets.QDialog):
     def accept(self) -> None:
         """Handle the accept event."""
         plate_info = self.get_plate_info()
-        logger.debug(f"Plate Info: {plate_info}")
+        logger.debug("Plate Info: %s", plate_info)
 
         if self.plate_type == 'add':
             if plate_and_phone_exists(plate_info[0], plate_info[1], plate_info[2]):
@@ -180,7 +189,7 @@ class AddPlateDialog(QtWidgets.QDialog):
                 error_dialog.addButton("確定", QtWidgets.QMessageBox.AcceptRole)
                 error_dialog.exec_()
             else:
-                add_plate_info(plate_info[0], plate_info[1], plate_info[2], plate_info[3])
+                # The caller applies the edit to the original contact with update_plate_info
                 self.done(QtWidgets.QDialog.Accepted)
 
     def reject(self) -> None:
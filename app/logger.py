@@ -1,29 +1,108 @@
+import atexit
+import json
 import logging
-from logging.handlers import RotatingFileHandler
+import os
+import queue
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+# Logging calls only put records on a queue; a background listener thread does the
+# formatting and file writes. Use %-style arguments (logger.info("x %s", y)) so messages
+# are never built for filtered-out levels.
+#
+# Environment overrides:
+#   NEW_AGAIN_LOG_LEVEL=INFO   minimum level passed to the handlers (default DEBUG)
+#   NEW_AGAIN_LOG_JSON=1       write one JSON object per line instead of plain text
+
+class JsonFormatter(logging.Formatter):
+    """Format records as single-line JSON objects."""
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "logger": record.name,
+            "level": record.levelname,
+            "message": record.getMessage(),
+            "module": record.module,
+            "line": record.lineno,
+            "thread": record.threadName,
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+def _make_formatter(json_format: bool) -> logging.Formatter:
+    if json_format:
+        return JsonFormatter()
+    return logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 
 # Configure logging
 logger = logging.getLogger("app_logger")
-logger.setLevel(logging.DEBUG)
+logger.setLevel(os.environ.get("NEW_AGAIN_LOG_LEVEL", "DEBUG").upper())
+logger.propagate = False
+
+_json_format = os.environ.get("NEW_AGAIN_LOG_JSON", "") not in ("", "0")
 
 # Create a rotating file handler for info level
-info_handler = RotatingFileHandler("info.log", maxBytes=10*1024*1024, backupCount=5, encoding='utf-8')
+info_handler = RotatingFileHandler("info.log", maxBytes=10*1024*1024, backupCount=5, encoding='utf-8', delay=True)
 info_handler.setLevel(logging.INFO)
-info_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-info_handler.setFormatter(info_formatter)
 
 # Create a rotating file handler for debug level
-debug_handler = RotatingFileHandler("debug.log", maxBytes=10*1024*1024, backupCount=5, encoding='utf-8')
+debug_handler = RotatingFileHandler("debug.log", maxBytes=10*1024*1024, backupCount=5, encoding='utf-8', delay=True)
 debug_handler.setLevel(logging.DEBUG)
-debug_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-debug_handler.setFormatter(debug_formatter)
 
 # Create a rotating file handler for error level
-error_handler = RotatingFileHandler("error.log", maxBytes=10*1024*1024, backupCount=5, encoding='utf-8')
+error_handler = RotatingFileHandler("error.log", maxBytes=10*1024*1024, backupCount=5, encoding='utf-8', delay=True)
 error_handler.setLevel(logging.ERROR)
-error_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-error_handler.setFormatter(error_formatter)
 
-# Add the handlers to the logger
-logger.addHandler(info_handler)
-logger.addHandler(debug_handler)
-logger.addHandler(error_handler)
+file_handlers = (info_handler, debug_handler, error_handler)
+for _handler in file_handlers:
+    _handler.setFormatter(_make_formatter(_json_format))
+
+# Route the logger through a queue so the calling thread never touches the files
+log_queue = queue.SimpleQueue()
+logger.addHandler(QueueHandler(log_queue))
+listener = QueueListener(log_queue, *file_handlers, respect_handler_level=True)
+listener.start()
+atexit.register(listener.stop)
+
+def set_log_level(level) -> None:
+    """Change the minimum level at runtime, e.g. set_log_level("WARNING")."""
+    logger.setLevel(level.upper() if isinstance(level, str) else level)
+
+def set_json_format(enabled: bool) -> None:
+    """Switch the log files between plain text and JSON lines at runtime."""
+    for handler in file_handlers:
+        handler.setFormatter(_make_formatter(enabled))
+
+def measure_log_overhead(calls: int = 2000) -> dict:
+    """Time DB calls on a scratch database with logging at DEBUG and with logging off, in microseconds per call."""
+    import tempfile
+    import time
+    from db import database
+    from db.initialize_db import initialize_database
+    previous_level, previous_file = logger.level, database.DATABASE_FILE
+    results = {}
+    with tempfile.TemporaryDirectory() as scratch:
+        database.DATABASE_FILE = os.path.join(scratch, "log_overhead.db")
+        initialize_database(database.DATABASE_FILE)
+        try:
+            for name, level in (("debug", logging.DEBUG), ("off", logging.CRITICAL + 1)):
+                set_log_level(level)
+                start = time.perf_counter()
+                for i in range(calls):
+                    database.plate_exists("LOG", str(i))
+                results[f"lookup_{name}_us"] = (time.perf_counter() - start) / calls * 1e6
+                start = time.perf_counter()
+                for i in range(calls // 10):
+                    database.add_plate_info(name, str(i), "0000000000", "log overhead benchmark")
+                results[f"add_{name}_us"] = (time.perf_counter() - start) / (calls // 10) * 1e6
+        finally:
+            set_log_level(previous_level)
+            database.DATABASE_FILE = previous_file
+    return results
+
+if __name__ == "__main__":
+    for key, value in measure_log_overhead().items():
+        print(f"{key}: {value:.1f}")
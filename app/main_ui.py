@@ -39,7 +39,7 @@ class UiMainWindow(object):
         font.setWeight(75)
         self.table_view.setFont(font)
         self.table_view.setSelectionBehavior(QtWidgets.QTableView.SelectRows)
-        self.table_view.setSelectionMode(QtWidgets.QTableView.SingleSelection)
+        self.table_view.setSelectionMode(QtWidgets.QTableView.ExtendedSelection)
         self.table_view.verticalHeader().setVisible(False)
         self.table_view.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
         self.grid_layout.addWidget(self.table_view, 0, 0, 1, 1)
@@ -93,6 +93,16 @@ class UiMainWindow(object):
         self.view_all_button.setObjectName("view_all_button")
         self.grid_layout_3.addWidget(self.view_all_button, 1, 0, 1, 1)
 
+        # Only shown while the table lists rows found in the archive
+        self.restore_button = QtWidgets.QPushButton(self.grid_layout_widget_2)
+        size_policy = QtWidgets.QSizePolicy(QtWidgets.QSizePolicy.Minimum, QtWidgets.QSizePolicy.Ignored)
+        size_policy.setHeightForWidth(self.restore_button.sizePolicy().hasHeightForWidth())
+        self.restore_button.setSizePolicy(size_policy)
+        self.restore_button.setFont(font)
+        self.restore_button.setObjectName("restore_button")
+        self.restore_button.hide()
+        self.grid_layout_3.addWidget(self.restore_button, 5, 0, 1, 1)
+
         self.grid_layout_widget_3 = QtWidgets.QWidget(self.central_widget)
         self.grid_layout_widget_3.setGeometry(QtCore.QRect(margin, 400 + margin, 750 - margin, 100 - bottom_margin))
         self.grid_layout_widget_3.setObjectName("grid_layout_widget_3")
@@ -131,6 +141,7 @@ class UiMainWindow(object):
         self.search_combo_box.setObjectName("search_combo_box")
         self.search_combo_box.addItem("")
         self.search_combo_box.addItem("")
+        self.search_combo_box.addItem("")
         self.grid_layout_5.addWidget(self.search_combo_box, 0, 0, 1, 1)
 
         self.grid_layout_widget_6 = QtWidgets.QWidget(self.central_widget)
@@ -167,6 +178,12 @@ class UiMainWindow(object):
         self.action_adjust_font_size = QtWidgets.QAction(main_window)
         self.action_adjust_font_size.setObjectName("action_adjust_font_size")
         self.menu_other.addAction(self.action_adjust_font_size)
+        self.action_maintenance = QtWidgets.QAction(main_window)
+        self.action_maintenance.setObjectName("action_maintenance")
+        self.menu_other.addAction(self.action_maintenance)
+        self.action_archive = QtWidgets.QAction(main_window)
+        self.action_archive.setObjectName("action_archive")
+        self.menu_other.addAction(self.action_archive)
         self.menu_bar.addAction(self.menu_other.menuAction())
 
         self.retranslate_ui(main_window)
@@ -193,12 +210,16 @@ class UiMainWindow(object):
         self.connect_button.setText(_translate("MainWindow", "連接資料庫"))
         self.delete_button.setText(_translate("MainWindow", "刪除所選資料"))
         self.view_all_button.setText(_translate("MainWindow", "瀏覽全部資料"))
+        self.restore_button.setText(_translate("MainWindow", "還原所選資料"))
         self.search_combo_box.setItemText(0, _translate("MainWindow", "車牌查詢"))
         self.search_combo_box.setItemText(1, _translate("MainWindow", "電話查詢"))
+        self.search_combo_box.setItemText(2, _translate("MainWindow", "備註查詢"))
         self.backup_button.setText(_translate("MainWindow", "備份資料庫"))
         self.menu_other.setTitle(_translate("MainWindow", "其他"))
         self.action_about.setText(_translate("MainWindow", "關於"))
         self.action_adjust_font_size.setText(_translate("MainWindow", "調整字體大小"))
+        self.action_maintenance.setText(_translate("MainWindow", "資料庫維護"))
+        self.action_archive.setText(_translate("MainWindow", "封存久未來店資料"))
         self.table_view.horizontalHeaderItem(0).setText(_translate("MainWindow", "車牌號碼"))
         self.table_view.horizontalHeaderItem(1).setText(_translate("MainWindow", "電話號碼"))
         self.table_view.horizontalHeaderItem(2).setText(_translate("MainWindow", "備註"))
@@ -218,7 +239,7 @@ class UiMainWindow(object):
                 QtWidgets.QMessageBox.Yes | QtWidgets.QMessageBox.No, QtWidgets.QMessageBox.No
             )
             if (reply == QtWidgets.QMessageBox.Yes):
-                self.table_handler.delete_selected_row()
+                self.table_handler.delete_selected_rows()
 
     def reset_table_view(self):
         self.plate_line_edit.clear()
@@ -0,0 +1,83 @@
+import threading
+import time
+from collections import deque
+from PyQt5 import QtCore, QtWidgets
+from app.logger import logger
+from app.prefix_index import PrefixIndex
+from db import database
+
+FIELDS = ("part1", "part2", "phone")
+
+class PlateCompleter:
+    """Suggest part1, part2 and phone values while typing, from in-memory PrefixIndex objects.
+
+    The indexes are filled on a background thread in batches at startup and kept current
+    through database write listeners, so suggestions never query the database.
+    """
+
+    def __init__(self, limit: int = 10):
+        self.limit = limit
+        self.indexes = {field: PrefixIndex() for field in FIELDS}
+        self.ready = threading.Event()
+        self.latencies = deque(maxlen=1000)  # seconds from keystroke to suggestions
+        database.add_write_listener(self._on_write)
+        self._thread = threading.Thread(target=self._build, name="plate_completer", daemon=True)
+        self._thread.start()
+
+    def _build(self) -> None:
+        start = time.perf_counter()
+        rows = 0
+        for batch in database.iter_all_plate_info(batch_size=20000):
+            plates = [plate.split("-", 1) for plate, _, _ in batch]
+            self.indexes["part1"].add_many(part1 for part1, _ in plates)
+            self.indexes["part2"].add_many(part2 for _, part2 in plates)
+            self.indexes["phone"].add_many(phone_number for _, phone_number, _ in batch)
+            rows += len(batch)
+        for index in self.indexes.values():
+            index.warm()
+        self.ready.set()
+        logger.info("Completion indexes built from %d rows in %.2fs", rows, time.perf_counter() - start)
+
+    def _on_write(self, removed: list, added: list) -> None:
+        for part1, part2, phone_number in removed:
+            self.indexes["part1"].remove(part1)
+            self.indexes["part2"].remove(part2)
+            self.indexes["phone"].remove(phone_number)
+        for part1, part2, phone_number in added:
+            self.indexes["part1"].add(part1)
+            self.indexes["part2"].add(part2)
+            self.indexes["phone"].add(phone_number)
+
+    def suggestions(self, field: str, prefix: str) -> list:
+        if field != "phone":
+            prefix = prefix.upper()
+        return self.indexes[field].complete(prefix, self.limit)
+
+    def attach(self, line_edit: QtWidgets.QLineEdit, field) -> QtWidgets.QCompleter:
+        """Show suggestions under line_edit; field is a FIELDS name or a callable returning one (None for no suggestions)."""
+        model = QtCore.QStringListModel(line_edit)
+        completer = QtWidgets.QCompleter(model, line_edit)
+        # The index already filtered and ranked the values; the completer must not filter again
+        completer.setCompletionMode(QtWidgets.QCompleter.UnfilteredPopupCompletion)
+        completer.setMaxVisibleItems(self.limit)
+        line_edit.setCompleter(completer)
+
+        def on_text_edited(text):
+            name = field() if callable(field) else field
+            if not text or name is None or not self.ready.is_set():
+                completer.popup().hide()
+                return
+            start = time.perf_counter()
+            values = self.suggestions(name, text)
+            self.latencies.append(time.perf_counter() - start)
+            if values == [text.upper()] or not values:
+                completer.popup().hide()
+                return
+            model.setStringList(values)
+            completer.complete()
+
+        line_edit.textEdited.connect(on_text_edited)
+        return completer
+
+    def close(self) -> None:
+        database.remove_write_listener(self._on_write)
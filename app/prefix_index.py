@@ -0,0 +1,140 @@
+import bisect
+import heapq
+import threading
+from collections import Counter
+
+class PrefixIndex:
+    """Sorted-array prefix index over strings, returning the most frequent completions of a prefix.
+
+    Values are kept in one sorted list, so a prefix is a contiguous slice found with two
+    binary searches. Small slices are ranked on the spot; results for large slices (short
+    prefixes) are cached and dropped again when a value under that prefix changes.
+    Safe to use from several threads.
+    """
+
+    def __init__(self, cache_threshold: int = 256):
+        self.cache_threshold = cache_threshold
+        self._counts = Counter()
+        self._keys = []
+        self._pending = []  # added keys not yet merged into _keys
+        self._cache = {}
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._counts)
+
+    def count(self, value: str) -> int:
+        return self._counts.get(value, 0)
+
+    def add_many(self, values) -> None:
+        """Count each value once more; new values are merged into the sorted array on the next lookup."""
+        with self._lock:
+            for value in values:
+                if not value:
+                    continue
+                if value not in self._counts:
+                    self._pending.append(value)
+                self._counts[value] += 1
+                self._invalidate(value)
+
+    def add(self, value: str) -> None:
+        self.add_many((value,))
+
+    def remove(self, value: str) -> None:
+        """Count value once less, dropping it when it is no longer used."""
+        with self._lock:
+            if not self._counts.get(value):
+                return
+            self._counts[value] -= 1
+            if self._counts[value] == 0:
+                del self._counts[value]
+                self._merge()
+                index = bisect.bisect_left(self._keys, value)
+                if index < len(self._keys) and self._keys[index] == value:
+                    del self._keys[index]
+            self._invalidate(value)
+
+    def _invalidate(self, value: str) -> None:
+        if self._cache:
+            for length in range(len(value) + 1):
+                self._cache.pop(value[:length], None)
+
+    def _merge(self) -> None:
+        if self._pending:
+            # The list is two sorted runs after sorting the new keys, which Timsort merges in linear time
+            self._pending.sort()
+            self._keys.extend(self._pending)
+            self._keys.sort()
+            self._pending = []
+
+    def complete(self, prefix: str, limit: int = 10) -> list:
+        """Return up to limit values starting with prefix, most frequent first, then alphabetical."""
+        with self._lock:
+            self._merge()
+            cached = self._cache.get(prefix)
+            if cached is not None and len(cached) >= limit:
+                return cached[:limit]
+            start = bisect.bisect_left(self._keys, prefix)
+            end = bisect.bisect_left(self._keys, prefix + "\U0010ffff", start)
+            counts = self._counts
+            if end - start <= limit:
+                candidates = self._keys[start:end]
+                return sorted(candidates, key=lambda value: (-counts[value], value))
+            result = heapq.nsmallest(limit, self._keys[start:end], key=lambda value: (-counts[value], value))
+            if end - start > self.cache_threshold:
+                self._cache[prefix] = result
+            return result
+
+    def warm(self, limit: int = 10) -> None:
+        """Rank every prefix that would be cached anyway now, so first keystrokes are as fast as later ones."""
+        with self._lock:
+            self._merge()
+            keys = list(self._keys)
+        pending = [("", 0, len(keys))]
+        while pending:
+            prefix, start, end = pending.pop()
+            if end - start <= self.cache_threshold:
+                continue
+            self.complete(prefix, limit)
+            # Walk the distinct one-character extensions of prefix inside its slice
+            length = len(prefix) + 1
+            index = start
+            while index < end:
+                if len(keys[index]) < length:
+                    index += 1
+                    continue
+                child = keys[index][:length]
+                child_end = bisect.bisect_left(keys, child + "\U0010ffff", index, end)
+                pending.append((child, index, child_end))
+                index = child_end
+
+
+def measure_latency(entries: int = 1_000_000, lookups: int = 5000) -> dict:
+    """Time keystroke-style lookups (each prefix of random phone numbers) on an index of random entries."""
+    import random
+    import string
+    import time
+    values = ["09" + "".join(random.choices(string.digits, k=8)) for _ in range(entries)]
+    index = PrefixIndex()
+    start = time.perf_counter()
+    for offset in range(0, len(values), 20000):
+        index.add_many(values[offset:offset + 20000])
+    index.warm()
+    build_seconds = time.perf_counter() - start
+    latencies = []
+    for value in random.sample(values, min(lookups, len(values))):
+        for length in range(1, len(value) + 1):
+            start = time.perf_counter()
+            index.complete(value[:length])
+            latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    return {
+        "entries": len(index),
+        "build_seconds": build_seconds,
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99)] * 1000,
+        "max_ms": latencies[-1] * 1000,
+    }
+
+if __name__ == "__main__":
+    print(measure_latency())
@@ -0,0 +1,108 @@
+"""Startup timing for `start.py --startup-profile`.
+
+Splits launch-to-first-paint into the phases a packaged build can change: unpacking the
+one-file archive, interpreter start, module imports, window setup and the first paint.
+Each run appends one JSON line to startup_profile.jsonl next to config.json.
+"""
+import json
+import os
+import sys
+import time
+from PyQt5 import QtCore, QtWidgets
+from app.logger import logger
+from db.config import base_dir
+
+PROFILE_FILE = os.path.join(base_dir(), "startup_profile.jsonl")
+
+def build_mode() -> str:
+    """'onefile', 'onedir' or 'source'."""
+    if not getattr(sys, "frozen", False):
+        return "source"
+    # A one-file build runs from the temporary directory its bootloader unpacked it to
+    bundle_dir = os.path.abspath(getattr(sys, "_MEIPASS", ""))
+    executable_dir = os.path.dirname(os.path.abspath(sys.executable))
+    return "onedir" if bundle_dir.startswith(executable_dir) else "onefile"
+
+def process_start_time(pid: int) -> float:
+    """Creation time of a process as a time.time() value, or None where it cannot be read."""
+    try:
+        if sys.platform == "win32":
+            import ctypes
+            from ctypes import wintypes
+            kernel32 = ctypes.windll.kernel32
+            handle = kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+            if not handle:
+                return None
+            times = [wintypes.FILETIME() for _ in range(4)]
+            try:
+                if not kernel32.GetProcessTimes(handle, *(ctypes.byref(value) for value in times)):
+                    return None
+            finally:
+                kernel32.CloseHandle(handle)
+            created = (times[0].dwHighDateTime << 32) | times[0].dwLowDateTime
+            return created / 10 ** 7 - 11644473600  # 100 ns ticks since 1601 to the Unix epoch
+        with open(f"/proc/{pid}/stat") as f:
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return time.time() - uptime + start_ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+class StartupProfile(QtCore.QObject):
+    """Collect the startup phases; finish() runs after the window's first paint."""
+
+    def __init__(self, script_started: float, imports_done: float):
+        super().__init__()
+        self.mode = build_mode()
+        self.marks = {"script_started": script_started, "imports_done": imports_done}
+        self.marks["process_started"] = process_start_time(os.getpid())
+        if self.mode == "onefile":
+            # The bootloader process unpacks the archive, then starts this one
+            self.marks["launched"] = process_start_time(os.getppid())
+        else:
+            self.marks["launched"] = self.marks["process_started"]
+        self._window = None
+
+    def mark(self, name: str) -> None:
+        self.marks[name] = time.time()
+
+    def watch_first_paint(self, window: QtWidgets.QWidget) -> None:
+        self._window = window
+        window.installEventFilter(self)
+
+    def eventFilter(self, watched, event):
+        if watched is self._window and event.type() == QtCore.QEvent.Paint:
+            self._window.removeEventFilter(self)
+            # Runs once the paint event, and so the first frame, has been handled
+            QtCore.QTimer.singleShot(0, self.finish)
+        return False
+
+    def report(self) -> dict:
+        marks = self.marks
+
+        def seconds(start, end):
+            if marks.get(start) is None or marks.get(end) is None:
+                return None
+            return round(marks[end] - marks[start], 3)
+
+        return {
+            "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "mode": self.mode,
+            "unpack": seconds("launched", "process_started") if self.mode == "onefile" else 0.0,
+            "interpreter": seconds("process_started", "script_started"),
+            "imports": seconds("script_started", "imports_done"),
+            "window": seconds("imports_done", "window_shown"),
+            "first_paint": seconds("window_shown", "first_paint"),
+            "total": seconds("launched", "first_paint"),
+        }
+
+    def finish(self) -> None:
+        self.mark("first_paint")
+        report = self.report()
+        logger.info("Startup profile: %s", report)
+        with open(PROFILE_FILE, "a", encoding="utf-8") as f:
+            f.write(json.dumps(report) + "\n")
+        if sys.stdout is not None:  # windowed builds have no console
+            print(json.dumps(report))
+        QtWidgets.QApplication.instance().quit()
@@ -0,0 +1,89 @@
+import time
+from collections import deque
+from PyQt5 import QtCore, QtWidgets
+from app.logger import logger
+
+class FontStyleEngine:
+    """Apply font sizes and the style sheet to a widget tree in one pass, skipping unchanged work.
+
+    Call request_update() on every resize; the fonts are recomputed once the resizing has
+    paused for delay_ms. Each widget's font is set at most once per pass, and only when its
+    point size actually differs, and the style sheet is only re-applied when its text changes.
+    """
+
+    def __init__(self, root: QtWidgets.QWidget, compute_sizes, delay_ms: int = 80):
+        """compute_sizes() returns (base_size, {widget: size}); each override also covers the widget's children."""
+        self.root = root
+        self.compute_sizes = compute_sizes
+        self._style_sheet = None
+        self._applied_signature = None
+        self._timer = QtCore.QTimer()
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(delay_ms)
+        self._timer.timeout.connect(self.apply_fonts)
+        self.frame_times = deque(maxlen=500)  # seconds spent in each resize event
+        self.apply_times = deque(maxlen=50)  # seconds spent in each font pass
+
+    def request_update(self) -> None:
+        self._timer.start()  # restarting the timer is the debounce
+
+    def set_style_sheet(self, window: QtWidgets.QWidget, style_sheet: str) -> bool:
+        """Apply style_sheet unless it is already in effect. Returns True if it was applied."""
+        if style_sheet == self._style_sheet:
+            return False
+        window.setStyleSheet(style_sheet)
+        self._style_sheet = style_sheet
+        self._applied_signature = None  # a new style sheet re-polishes every widget
+        return True
+
+    def _plan(self) -> tuple:
+        """Return (signature, {widget: size}); an unchanged signature means nothing needs setting."""
+        base_size, overrides = self.compute_sizes()
+        plan = {}
+        for widget in [self.root] + self.root.findChildren(QtWidgets.QWidget):
+            plan[widget] = base_size
+        # Overrides are applied after the base so that they also cover their children
+        for widget, size in overrides.items():
+            plan[widget] = size
+            for child in widget.findChildren(QtWidgets.QWidget):
+                plan[child] = size
+        signature = (base_size, tuple(sorted(overrides.values())), len(plan))
+        return signature, plan
+
+    def apply_fonts(self) -> int:
+        """Run one font pass now. Returns the number of widgets whose font changed."""
+        self._timer.stop()
+        start = time.perf_counter()
+        signature, plan = self._plan()
+        if signature == self._applied_signature:
+            self.apply_times.append(time.perf_counter() - start)
+            return 0
+        changed = 0
+        for widget, size in plan.items():
+            font = widget.font()
+            if font.pointSize() != size:
+                font.setPointSize(size)
+                widget.setFont(font)
+                changed += 1
+        self._applied_signature = signature
+        elapsed = time.perf_counter() - start
+        self.apply_times.append(elapsed)
+        logger.debug("Font pass: %d of %d widgets changed in %.1f ms", changed, len(plan), elapsed * 1000)
+        return changed
+
+    def record_frame(self, seconds: float) -> None:
+        self.frame_times.append(seconds)
+
+    def frame_stats(self) -> dict:
+        """Percentiles of recent resize handling and font pass times, in milliseconds."""
+        def percentiles(samples):
+            ordered = sorted(samples)
+            if not ordered:
+                return {"count": 0, "p50": 0.0, "p95": 0.0, "max": 0.0}
+            return {
+                "count": len(ordered),
+                "p50": ordered[len(ordered) // 2] * 1000,
+                "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000,
+                "max": ordered[-1] * 1000,
+            }
+        return {"resize": percentiles(self.frame_times), "font_pass": percentiles(self.apply_times)}
@@ -1,5 +1,10 @@
-from PyQt5 import QtCore, QtWidgets
-from db.database import get_all_plate_info, delete_plate_info, filter_plate_info
+from PyQt5 import QtCore, QtGui, QtWidgets
+from db.archive import filter_archived
+from db.database import get_all_plate_info, delete_plate_infos, update_plate_infos, filter_plate_info, record_selection, NOTE_SEARCH
+from db.note_search import highlight
+
+# Sort key passed to the database for each table column
+COLUMN_SORT_KEYS = ("plate", "phone", "note")
 
 class TableViewHandler:
     def __init__(self, table_view, plate_line_edit, plate_line_edit2, search_combo_box):
@@ -7,15 +12,65 @@ class TableViewHandler:
         self.plate_line_edit = plate_line_edit
         self.plate_line_edit2 = plate_line_edit2
         self.search_combo_box = search_combo_box
+        self.sort_column = 0
+        self.sort_order = QtCore.Qt.AscendingOrder
+        # Search results are ranked until a column header is clicked: note searches by relevance,
+        # plate and phone searches by how often each plate is looked up, so regulars come first
+        self.rank_results = True
+        self.note_search_text = ""
+        # True while the table shows archived rows because the search found nothing in the database;
+        # on_archive_shown, if set, is called with it after every search
+        self.showing_archive = False
+        self.on_archive_shown = None
         self.plate_line_edit.textChanged.connect(self.filter_table)
         self.plate_line_edit2.textChanged.connect(self.filter_table)
-        self.search_combo_box.currentIndexChanged.connect(self.filter_table)
+        self.search_combo_box.currentIndexChanged.connect(self.change_search_mode)
         self.table_view.verticalHeader().setVisible(False)  # Hide row numbers
+        # Sorting happens in the database; header clicks re-query instead of sorting items
+        self.table_view.setSortingEnabled(False)
+        header = self.table_view.horizontalHeader()
+        header.setSectionsClickable(True)
+        header.setSortIndicatorShown(not self.rank_results)
+        header.setSortIndicator(self.sort_column, self.sort_order)
+        header.sectionClicked.connect(self.sort_by_column)
+        self.table_view.clicked.connect(self.record_selection)
         self.load_data()
 
+    def _sort_args(self, ranking=None):
+        if self.rank_results and ranking:
+            return {"order_by": ranking, "descending": False}
+        return {
+            "order_by": COLUMN_SORT_KEYS[self.sort_column],
+            "descending": self.sort_order == QtCore.Qt.DescendingOrder,
+        }
+
+    def sort_by_column(self, column):
+        if column == self.sort_column and not self.rank_results:
+            self.sort_order = QtCore.Qt.DescendingOrder if self.sort_order == QtCore.Qt.AscendingOrder else QtCore.Qt.AscendingOrder
+        else:
+            self.sort_column = column
+            self.sort_order = QtCore.Qt.AscendingOrder
+        self.rank_results = False
+        self.table_view.horizontalHeader().setSortIndicatorShown(True)
+        self.table_view.horizontalHeader().setSortIndicator(self.sort_column, self.sort_order)
+        self.filter_table()
+
+    def change_search_mode(self):
+        self.rank_results = True
+        self.table_view.horizontalHeader().setSortIndicatorShown(False)
+        self.filter_table()
+
+    def record_selection(self, index):
+        """Count a clicked row as a selection of its plate, which raises it in later searches."""
+        part1, part2, _ = self.row_key(index.row())
+        record_selection(part1, part2)
+
     def load_data(self):
-        data = get_all_plate_info()
+        data = get_all_plate_info(**self._sort_args())
+        self.showing_archive = False
         self._populate_table(data)
+        if self.on_archive_shown is not None:
+            self.on_archive_shown(False)
         self.table_view.resizeRowsToContents()  # Ensure rows are resized to fit content
         self._set_minimum_column_widths()
 
@@ -26,39 +81,93 @@ class TableViewHandler:
     def _populate_table(self, data):
         self.table_view.setRowCount(len(data))
         for row, (plate, phone_number, note) in enumerate(data):
-            formatted_phone_number = self._format_phone_number(phone_number)
-            self.table_view.setItem(row, 0, QtWidgets.QTableWidgetItem(plate))
-            self.table_view.setItem(row, 1, QtWidgets.QTableWidgetItem(formatted_phone_number))
-            note_item = QtWidgets.QTableWidgetItem(note)
-            note_item.setToolTip(f"<span style='font-size: 14pt;'>{note}</span>")  # Add tooltip with larger font
-            self.table_view.setItem(row, 2, note_item)
+            self.update_row(row, plate, phone_number, note)
 
     def update_row(self, row, plate, phone_number, note):
         formatted_phone_number = self._format_phone_number(phone_number)
         self.table_view.setItem(row, 0, QtWidgets.QTableWidgetItem(plate))
-        self.table_view.setItem(row, 1, QtWidgets.QTableWidgetItem(formatted_phone_number))
+        phone_item = QtWidgets.QTableWidgetItem(formatted_phone_number)
+        phone_item.setData(QtCore.Qt.UserRole, phone_number)  # Keep the stored value for batch operations
+        self.table_view.setItem(row, 1, phone_item)
         note_item = QtWidgets.QTableWidgetItem(note)
-        note_item.setToolTip(f"<span style='font-size: 14pt;'>{note}</span>")  # Update tooltip with larger font
+        if self.note_search_text:
+            note_item.setToolTip(f"<span style='font-size: 14pt;'>{highlight(note, self.note_search_text)}</span>")
+        else:
+            note_item.setToolTip(f"<span style='font-size: 14pt;'>{note}</span>")  # Update tooltip with larger font
         self.table_view.setItem(row, 2, note_item)
+        if self.showing_archive:
+            for column in range(3):
+                item = self.table_view.item(row, column)
+                item.setForeground(QtGui.QBrush(QtCore.Qt.gray))
+                if column < 2:
+                    item.setToolTip("已封存，可按「還原所選資料」移回資料庫")
 
     def filter_table(self):
         part1_filter_text = phone_filter_text = \
             self.plate_line_edit.text().lower()
         part2_filter_text = self.plate_line_edit2.text().lower()
         search_mode = self.search_combo_box.currentText()
-        if search_mode == "電話查詢":
-            data = filter_plate_info("", "", phone_filter_text, search_mode)
+        self.note_search_text = ""
+        if search_mode == NOTE_SEARCH:
+            self.note_search_text = self.plate_line_edit.text().strip()
+            data = filter_plate_info("", "", "", search_mode, note_filter=self.note_search_text, **self._sort_args("relevance"))
+        elif search_mode == "電話查詢":
+            data = filter_plate_info("", "", phone_filter_text, search_mode,
+                                     **self._sort_args("frequency" if phone_filter_text else None))
         else:
-            data = filter_plate_info(part1_filter_text, part2_filter_text, "", search_mode)
+            ranking = "frequency" if part1_filter_text or part2_filter_text else None
+            data = filter_plate_info(part1_filter_text, part2_filter_text, "", search_mode, **self._sort_args(ranking))
+        self.showing_archive = False
+        if not data:
+            # Nothing in the database: look among the customers archived for not coming in
+            data = filter_archived(part1_filter_text, part2_filter_text, phone_filter_text, search_mode, self.note_search_text)
+            self.showing_archive = bool(data)
         self._populate_table(data)
+        if self.on_archive_shown is not None:
+            self.on_archive_shown(self.showing_archive)
+
+    def selected_rows(self):
+        """Return the indexes of all selected rows in ascending order."""
+        return sorted(index.row() for index in self.table_view.selectionModel().selectedRows())
+
+    def row_key(self, row):
+        """Return the (part1, part2, phone_number) stored for a table row."""
+        part1, part2 = self.table_view.item(row, 0).text().split('-', 1)
+        phone_number = self.table_view.item(row, 1).data(QtCore.Qt.UserRole)
+        return part1, part2, phone_number
+
+    def delete_selected_rows(self):
+        """Delete every selected row in one transaction and return the number of rows deleted."""
+        rows = self.selected_rows()
+        if not rows or self.showing_archive:  # archived rows are only in the archive; restore them first
+            return 0
+        deleted = delete_plate_infos([self.row_key(row) for row in rows])
+        self._remove_rows(rows)
+        return deleted
+
+    def update_selected_rows(self, new_phone_number=None, new_note=None):
+        """Apply a phone number and/or note to every selected row and return the number updated."""
+        rows = self.selected_rows()
+        if not rows or self.showing_archive:
+            return 0
+        keys = [self.row_key(row) for row in rows]
+        updated = update_plate_infos(keys, new_phone_number, new_note)
+        if updated:
+            for row, (part1, part2, phone_number) in zip(rows, keys):
+                note = self.table_view.item(row, 2).text() if new_note is None else new_note
+                self.update_row(row, f"{part1}-{part2}", new_phone_number or phone_number, note)
+        return updated
 
-    def delete_selected_row(self):
-        selected_row = self.table_view.currentRow()
-        if selected_row >= 0:
-            plate_info = self.table_view.item(selected_row, 0).text()
-            part1, part2 = plate_info.split('-')
-            delete_plate_info(part1, part2)
-            self.table_view.removeRow(selected_row)
+    def _remove_rows(self, rows):
+        # Remove contiguous runs from the bottom up so one model call covers each run
+        model = self.table_view.model()
+        end = len(rows)
+        while end > 0:
+            start = end - 1
+            while start > 0 and rows[start - 1] == rows[start] - 1:
+                start -= 1
+            model.removeRows(rows[start], end - start)
+            end = start
 
     def _format_phone_number(self, phone_number):
         if '-' in phone_number:
@@ -0,0 +1,242 @@
+"""Command-line access to the plate database without the PyQt5 GUI.
+
+Examples:
+    python cli.py query ABC 1234
+    python cli.py query --phone 0912
+    python cli.py query --note 白色豐田
+    python cli.py add ABC 1234 0912345678 "white car"
+    python cli.py import plates.csv
+    python cli.py export plates.csv
+    python cli.py backup 20250301_backup.db
+    python cli.py stats
+    python cli.py lookup < plates.txt   # one "ABC-1234" or "ABC 1234" per line
+    python cli.py lookup --snapshot database.snapshot < plates.txt
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+from db import database
+
+CSV_HEADER = ("part1", "part2", "phone_number", "note")
+
+def _print_rows(rows, as_json: bool, out=sys.stdout) -> None:
+    for plate, phone_number, note in rows:
+        if as_json:
+            out.write(json.dumps({"plate": plate, "phone_number": phone_number, "note": note}, ensure_ascii=False) + "\n")
+        else:
+            out.write(f"{plate}\t{phone_number}\t{note or ''}\n")
+
+def _split_plate(text: str) -> tuple:
+    text = text.strip().upper()
+    for separator in ("-", " ", "\t"):
+        if separator in text:
+            part1, part2 = text.split(separator, 1)
+            return part1.strip(), part2.strip()
+    return text, ""
+
+def cmd_query(args) -> int:
+    if args.all_branches:
+        return _query_branches(args)
+    if args.note is not None:
+        rows = database.filter_plate_info("", "", "", database.NOTE_SEARCH, args.order or "relevance", args.desc, args.limit,
+                                          note_filter=args.note)
+    elif args.phone is not None:
+        rows = database.filter_plate_info("", "", args.phone, "電話查詢", args.order or "plate", args.desc, args.limit)
+    else:
+        rows = database.filter_plate_info(args.part1 or "", args.part2 or "", "", "車牌查詢", args.order or "plate", args.desc, args.limit)
+    if not rows:
+        from db.archive import filter_archived
+        search_mode = database.NOTE_SEARCH if args.note is not None else "電話查詢" if args.phone is not None else "車牌查詢"
+        rows = filter_archived(args.part1 or "", args.part2 or "", args.phone or "", search_mode, args.note or "", args.limit)
+        if rows:
+            print("Found only in the archive; restore with: python -m db.archive restore PART1 PART2", file=sys.stderr)
+    _print_rows(rows, args.json)
+    return 0 if rows else 1
+
+def _query_branches(args) -> int:
+    from db import federation
+    from db.config import branch_databases
+    branches = branch_databases()
+    branches[next(iter(branches))] = database.DATABASE_FILE  # --db replaces the local entry
+    if args.note is not None:
+        search_mode = database.NOTE_SEARCH
+    else:
+        search_mode = "電話查詢" if args.phone is not None else "車牌查詢"
+    errors = {}
+    rows = federation.filter_plate_info(args.part1 or "", args.part2 or "", args.phone or "", search_mode,
+                                        args.order or "plate", args.desc, args.limit, branches=branches, errors=errors,
+                                        note_filter=args.note or "")
+    for source, error in errors.items():
+        print(f"Skipped {source}: {error}", file=sys.stderr)
+    for source, plate, phone_number, note in rows:
+        if args.json:
+            print(json.dumps({"source": source, "plate": plate, "phone_number": phone_number, "note": note}, ensure_ascii=False))
+        else:
+            print(f"{source}\t{plate}\t{phone_number}\t{note or ''}")
+    return 0 if rows else 1
+
+def cmd_add(args) -> int:
+    if database.add_plate_info(args.part1, args.part2, args.phone_number, args.note):
+        return 0
+    print(f"{args.part1.upper()}-{args.part2.upper()} already has phone number {args.phone_number}", file=sys.stderr)
+    return 1
+
+def cmd_delete(args) -> int:
+    if args.phone:
+        deleted = database.delete_plate_infos([(args.part1, args.part2, phone) for phone in args.phone])
+    else:
+        deleted = database.delete_plate_info(args.part1, args.part2)
+    print(f"Deleted {deleted} rows", file=sys.stderr)
+    return 0 if deleted else 1
+
+def cmd_import(args) -> int:
+    with open(args.file, newline="", encoding="utf-8-sig") as f:
+        reader = csv.reader(f)
+        rows = [row[:4] + [""] * (4 - len(row[:4])) for row in reader if row]
+    if rows and tuple(rows[0]) == CSV_HEADER:
+        rows = rows[1:]
+    added = database.add_plate_infos(rows)
+    print(f"Imported {added} of {len(rows)} rows", file=sys.stderr)
+    return 0
+
+def cmd_export(args) -> int:
+    out = open(args.file, "w", newline="", encoding="utf-8") if args.file != "-" else sys.stdout
+    try:
+        writer = csv.writer(out)
+        writer.writerow(CSV_HEADER)
+        for batch in database.iter_all_plate_info():
+            writer.writerows((*plate.split("-", 1), phone_number, note) for plate, phone_number, note in batch)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    return 0
+
+def cmd_backup(args) -> int:
+    database.backup_database(args.destination)
+    return 0
+
+def cmd_stats(args) -> int:
+    from db.maintenance import database_stats
+    conn = database.get_read_connection()
+    try:
+        stats = {
+            "database": os.path.abspath(database.DATABASE_FILE),
+            "plates": conn.execute("SELECT COUNT(*) FROM plates").fetchone()[0],
+            "contacts": conn.execute("SELECT COUNT(*) FROM contacts").fetchone()[0],
+        }
+        stats.update(database_stats(conn, database.DATABASE_FILE))
+    finally:
+        conn.close()
+    if args.json:
+        print(json.dumps(stats, ensure_ascii=False))
+    else:
+        for key, value in stats.items():
+            print(f"{key}\t{value}")
+    return 0
+
+def cmd_lookup(args) -> int:
+    """Answer one exact plate lookup per input line, writing each answer before reading the next line.
+
+    A plate that is not found is looked up in the archive of long-idle customers.
+    """
+    from db.archive import lookup_archived
+    if args.snapshot:
+        from db.snapshot import Snapshot
+        source = Snapshot(args.snapshot)
+        find = lambda part1, part2: source.lookup(part1, part2) or []
+    else:
+        source = database.get_read_connection()
+        sql = f"{database.PLATE_INFO_SELECT} WHERE plates.part1 = ? AND plates.part2 = ? ORDER BY contacts.phone_number"
+        find = lambda part1, part2: [row[2:] for row in source.execute(sql, (part1, part2)).fetchall()]
+    out = sys.stdout
+    try:
+        for line in sys.stdin:
+            if not line.strip():
+                continue
+            part1, part2 = _split_plate(line)
+            contacts = find(part1, part2)
+            archived = False
+            if not contacts:
+                archived_contacts = lookup_archived([(part1, part2)]).get((part1, part2))
+                if archived_contacts:
+                    contacts, archived = archived_contacts, True
+            if args.json:
+                out.write(json.dumps({"plate": f"{part1}-{part2}", "found": bool(contacts), "archived": archived,
+                                      "contacts": [list(contact) for contact in contacts]}, ensure_ascii=False) + "\n")
+            else:
+                status = "archived" if archived else "found" if contacts else "missing"
+                text = "\t".join(f"{phone_number}\t{note or ''}" for phone_number, note in contacts)
+                out.write(f"{part1}-{part2}\t{status}\t{text}\n".replace("\t\n", "\n"))
+            out.flush()
+    finally:
+        source.close()
+    return 0
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Plate database command-line tool (no GUI).")
+    parser.add_argument("--db", default=database.DATABASE_FILE, help="database file (default: %(default)s)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    query = commands.add_parser("query", help="search by plate parts, phone number or note")
+    query.add_argument("part1", nargs="?")
+    query.add_argument("part2", nargs="?")
+    query.add_argument("--phone", help="search phone numbers containing this text")
+    query.add_argument("--note", help="search notes for this text, best matches first")
+    query.add_argument("--order", choices=sorted([*database.SORT_COLUMNS, "frequency"]),
+                       help="sort order (default: relevance with --note, otherwise plate)")
+    query.add_argument("--desc", action="store_true")
+    query.add_argument("--limit", type=int)
+    query.add_argument("--json", action="store_true", help="print JSON lines")
+    query.add_argument("--all-branches", action="store_true", help="search every branch in config.json, tagging rows with their source")
+    query.set_defaults(func=cmd_query)
+
+    add = commands.add_parser("add", help="add a plate with a phone number")
+    add.add_argument("part1")
+    add.add_argument("part2")
+    add.add_argument("phone_number")
+    add.add_argument("note", nargs="?", default="")
+    add.set_defaults(func=cmd_add)
+
+    delete = commands.add_parser("delete", help="delete a plate, or only some of its phone numbers")
+    delete.add_argument("part1")
+    delete.add_argument("part2")
+    delete.add_argument("--phone", action="append", help="only delete this phone number (repeatable)")
+    delete.set_defaults(func=cmd_delete)
+
+    import_ = commands.add_parser("import", help="add rows from a CSV file (part1,part2,phone_number,note)")
+    import_.add_argument("file")
+    import_.set_defaults(func=cmd_import)
+
+    export = commands.add_parser("export", help="write all rows to a CSV file ('-' for stdout)")
+    export.add_argument("file")
+    export.set_defaults(func=cmd_export)
+
+    backup = commands.add_parser("backup", help="copy the database with the SQLite backup API")
+    backup.add_argument("destination")
+    backup.set_defaults(func=cmd_backup)
+
+    stats = commands.add_parser("stats", help="show row counts and file statistics")
+    stats.add_argument("--json", action="store_true")
+    stats.set_defaults(func=cmd_stats)
+
+    lookup = commands.add_parser("lookup", help="answer exact plate lookups read line by line from stdin")
+    lookup.add_argument("--json", action="store_true", help="print JSON lines")
+    lookup.add_argument("--snapshot", help="answer from a snapshot file written by db/snapshot.py instead of the database")
+    lookup.set_defaults(func=cmd_lookup)
+    return parser
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    database.DATABASE_FILE = args.db
+    if args.command in ("add", "import"):
+        from db.initialize_db import initialize_database
+        initialize_database(args.db)
+    elif not os.path.exists(args.db) and not getattr(args, "snapshot", None):
+        print(f"Database not found: {os.path.abspath(args.db)}", file=sys.stderr)
+        return 2
+    return args.func(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,263 @@
+"""Move plates that have not been seen for a long time to a separate archive database.
+
+Every contact records when it was created and last seen (added, edited, looked up or
+picked in the table). archive_idle() moves each plate whose contacts were all last seen
+more than archive_after_days ago (config.json, default two years) from the local database
+into the archive file (config "archive_file", default database_archive.db next to it),
+so the tables and indexes every search walks only hold customers who still come in.
+A search that finds nothing locally falls through to the archive with filter_archived(),
+exact lookups (database.get_plate() and lookup_plates()) check it for the plates they miss
+with lookup_archived(), and restore() moves a plate back.
+
+Archiving is local to this station: with db/sync.py installed, the moves are not sent to
+the other stations as deletions.
+
+    python -m db.archive run --days 730
+    python -m db.archive restore ABC 1234
+"""
+import argparse
+import json
+import os
+import pathlib
+import sqlite3
+import sys
+import time
+from app.logger import logger
+from db import database
+from db.config import archive_path, load_config
+
+DEFAULT_ARCHIVE_AFTER_DAYS = 730
+
+ARCHIVE_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS archive.plates (
+        id INTEGER PRIMARY KEY,
+        part1 TEXT NOT NULL,
+        part2 TEXT NOT NULL,
+        UNIQUE(part1, part2)
+    );
+    CREATE TABLE IF NOT EXISTS archive.contacts (
+        id INTEGER PRIMARY KEY,
+        plate_id INTEGER NOT NULL REFERENCES plates(id),
+        phone_number TEXT NOT NULL,
+        note TEXT,
+        created_at TEXT,
+        last_seen_at TEXT,
+        archived_at TEXT NOT NULL,
+        UNIQUE(plate_id, phone_number)
+    );
+'''
+
+ARCHIVE_PLATE_ID = '(SELECT id FROM archive.plates WHERE part1 = ? AND part2 = ?)'
+
+def _attach(cursor, archive_file: str) -> None:
+    cursor.execute("ATTACH DATABASE ? AS archive", (archive_file,))
+    cursor.executescript(ARCHIVE_SCHEMA)
+
+def _detach(conn) -> None:
+    # Pooled connections are used again after close(), so leave them as they were
+    if not conn.in_transaction and any(row[1] == "archive" for row in conn.execute("PRAGMA database_list")):
+        conn.execute("DETACH DATABASE archive")
+
+def _set_sync_recording(cursor, enabled: bool) -> None:
+    # The sync triggers stand aside while 'applying' is 1 (see db/sync.py)
+    if cursor.execute("SELECT 1 FROM main.sqlite_master WHERE name = 'sync_state'").fetchone() is not None:
+        database._execute_write(cursor, "UPDATE sync_state SET value = ? WHERE key = 'applying'", (0 if enabled else 1,))
+
+def archive_idle(days: float = None, archive_file: str = None) -> dict:
+    """Move every plate not seen for days into the archive in one transaction."""
+    if days is None:
+        days = load_config().get("archive_after_days", DEFAULT_ARCHIVE_AFTER_DAYS)
+    archive_file = archive_file or archive_path()
+    stamp = database.now()
+    cutoff = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(time.time() - days * 86400))
+    conn = database.get_connection()
+    cursor = conn.cursor()
+    try:
+        _attach(cursor, archive_file)
+        cursor.execute("BEGIN IMMEDIATE")
+        # Contacts from before last_seen_at existed start their idle time at the first run
+        database._execute_write(cursor, '''
+            UPDATE contacts SET created_at = coalesce(created_at, ?), last_seen_at = ? WHERE last_seen_at IS NULL
+        ''', (stamp, stamp))
+        idle = cursor.execute('''
+            SELECT contacts.id, plates.part1, plates.part2, contacts.phone_number, contacts.note,
+                   contacts.created_at, contacts.last_seen_at
+            FROM contacts JOIN plates ON plates.id = contacts.plate_id
+            WHERE contacts.plate_id IN (SELECT plate_id FROM contacts GROUP BY plate_id HAVING max(last_seen_at) < ?)
+            ORDER BY plates.part1, plates.part2, contacts.phone_number
+        ''', (cutoff,)).fetchall()
+        if idle:
+            cursor.executemany("INSERT OR IGNORE INTO archive.plates (part1, part2) VALUES (?, ?)",
+                               sorted({(part1, part2) for _, part1, part2, _, _, _, _ in idle}))
+            cursor.executemany(f'''
+                INSERT INTO archive.contacts (plate_id, phone_number, note, created_at, last_seen_at, archived_at)
+                VALUES ({ARCHIVE_PLATE_ID}, ?, ?, ?, ?, ?)
+                ON CONFLICT (plate_id, phone_number) DO UPDATE SET
+                    note = excluded.note, created_at = excluded.created_at,
+                    last_seen_at = excluded.last_seen_at, archived_at = excluded.archived_at
+            ''', [row[1:] + (stamp,) for row in idle])
+            _set_sync_recording(cursor, False)
+            # By id, so the memory mirror can replay it without the archive attached
+            database._execute_write_many(cursor, "DELETE FROM contacts WHERE id = ?", [(row[0],) for row in idle])
+            _set_sync_recording(cursor, True)
+        database._commit(conn)
+    except BaseException:
+        conn.rollback()
+        if database._mirror is not None:
+            database._mirror.invalidate()
+        raise
+    finally:
+        _detach(conn)
+        conn.close()
+    plates = len({(part1, part2) for _, part1, part2, _, _, _, _ in idle})
+    logger.info("Archived %d contacts of %d plates not seen since %s to %s", len(idle), plates, cutoff, archive_file)
+    database._notify([(part1, part2, phone_number) for _, part1, part2, phone_number, _, _, _ in idle], [])
+    return {"plates": plates, "contacts": len(idle), "cutoff": cutoff}
+
+def filter_archived(part1_filter: str, part2_filter: str, phone_filter: str, search_mode: str,
+                    note_filter: str = "", limit: int = None, archive_file: str = None) -> list:
+    """database.filter_plate_info() on the archive, in plate order; [] when there is nothing to search for.
+
+    The archive has no note index, so a note search matches notes containing every word.
+    """
+    archive_file = archive_file or archive_path()
+    if not os.path.exists(archive_file):
+        return []
+    if search_mode == database.NOTE_SEARCH:
+        words = note_filter.split()
+        where = "WHERE " + " AND ".join("contacts.note LIKE ?" for _ in words)
+        params = tuple(f"%{word}%" for word in words)
+    else:
+        searched = phone_filter if search_mode == "電話查詢" else part1_filter or part2_filter
+        where, params = database._filter_where(part1_filter, part2_filter, phone_filter, search_mode)
+        params = params if searched else ()
+    if not params:
+        return []  # only a search for something falls through, not an empty filter
+    conn = sqlite3.connect(pathlib.Path(archive_file).resolve().as_uri() + "?mode=ro", uri=True)
+    try:
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'contacts'").fetchone() is None:
+            return []
+        rows = conn.execute(f'''
+            {database.PLATE_INFO_SELECT}
+            {where}
+            ORDER BY plates.part1, plates.part2, contacts.phone_number
+            LIMIT ?
+        ''', params + (-1 if limit is None else limit,)).fetchall()
+    finally:
+        conn.close()
+    return [(f"{row[0]}-{row[1]}", row[2], row[3]) for row in rows]
+
+def lookup_archived(keys: list, archive_file: str = None) -> dict:
+    """{(part1, part2): [(phone_number, note), ...]} of the given upper-case plates that are in the archive."""
+    archive_file = archive_file or archive_path()
+    if not keys or not os.path.exists(archive_file):
+        return {}
+    conn = sqlite3.connect(pathlib.Path(archive_file).resolve().as_uri() + "?mode=ro", uri=True)
+    try:
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'contacts'").fetchone() is None:
+            return {}
+        rows = conn.execute('''
+            SELECT plates.part1, plates.part2, contacts.phone_number, contacts.note
+            FROM json_each(?) AS wanted
+            JOIN plates ON plates.part1 = json_extract(wanted.value, '$[0]') AND plates.part2 = json_extract(wanted.value, '$[1]')
+            JOIN contacts ON contacts.plate_id = plates.id
+            ORDER BY plates.part1, plates.part2, contacts.phone_number
+        ''', (json.dumps(list(keys)),)).fetchall()
+    finally:
+        conn.close()
+    found = {}
+    for part1, part2, phone_number, note in rows:
+        found.setdefault((part1, part2), []).append((phone_number, note))
+    return found
+
+def restore(plates: list, archive_file: str = None) -> int:
+    """Move the given (part1, part2) plates back from the archive. Returns the number of contacts restored.
+
+    A contact that was added again since it was archived keeps its current phone number and note.
+    """
+    keys = sorted({(part1.upper(), part2.upper()) for part1, part2 in plates})
+    archive_file = archive_file or archive_path()
+    if not keys or not os.path.exists(archive_file):
+        return 0
+    seen_at = database.now()
+    added = []
+    conn = database.get_connection()
+    cursor = conn.cursor()
+    try:
+        _attach(cursor, archive_file)
+        cursor.execute("BEGIN IMMEDIATE")
+        archived = []
+        for part1, part2 in keys:
+            archived += cursor.execute(f'''
+                SELECT id, ?, ?, phone_number, note, created_at FROM archive.contacts
+                WHERE plate_id = {ARCHIVE_PLATE_ID} ORDER BY phone_number
+            ''', (part1, part2, part1, part2)).fetchall()
+        database._execute_write_many(cursor, "INSERT OR IGNORE INTO plates (part1, part2) VALUES (?, ?)",
+                                     sorted({(part1, part2) for _, part1, part2, _, _, _ in archived}))
+        for _, part1, part2, phone_number, note, created_at in archived:
+            # Restoring counts as being seen, or the next run would archive the plate again
+            database._execute_write(cursor, f'''
+                INSERT OR IGNORE INTO contacts (plate_id, phone_number, note, created_at, last_seen_at)
+                VALUES ({database.PLATE_ID}, ?, ?, ?, ?)
+            ''', (part1, part2, phone_number, note, created_at, seen_at))
+            if cursor.rowcount > 0:
+                added.append((part1, part2, phone_number))
+        cursor.executemany("DELETE FROM archive.contacts WHERE id = ?", [(row[0],) for row in archived])
+        cursor.executemany(f'''
+            DELETE FROM archive.plates WHERE id = {ARCHIVE_PLATE_ID}
+                AND NOT EXISTS (SELECT 1 FROM archive.contacts WHERE plate_id = archive.plates.id)
+        ''', keys)
+        database._commit(conn)
+    except BaseException:
+        conn.rollback()
+        if database._mirror is not None:
+            database._mirror.invalidate()
+        raise
+    finally:
+        _detach(conn)
+        conn.close()
+    logger.info("Restored %d contacts of %d plates from %s", len(added), len(keys), archive_file)
+    database._notify([], added)
+    return len(added)
+
+def status(archive_file: str = None) -> dict:
+    archive_file = archive_file or archive_path()
+    if not os.path.exists(archive_file):
+        return {"archive_file": archive_file, "plates": 0, "contacts": 0}
+    conn = sqlite3.connect(pathlib.Path(archive_file).resolve().as_uri() + "?mode=ro", uri=True)
+    try:
+        plates, contacts, oldest = conn.execute('''
+            SELECT (SELECT COUNT(*) FROM plates), COUNT(*), min(last_seen_at) FROM contacts
+        ''').fetchone()
+    finally:
+        conn.close()
+    return {"archive_file": archive_file, "plates": plates, "contacts": contacts, "oldest_last_seen": oldest}
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Move long-idle plates to the archive database and back.")
+    parser.add_argument("--db", default=database.DATABASE_FILE)
+    parser.add_argument("--archive", help='archive file (default: "archive_file" in config.json)')
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    run_parser = subparsers.add_parser("run", help="archive the plates not seen for --days")
+    run_parser.add_argument("--days", type=float, help=f'idle days (default: "archive_after_days" in config.json, or {DEFAULT_ARCHIVE_AFTER_DAYS})')
+    restore_parser = subparsers.add_parser("restore", help="move a plate back from the archive")
+    restore_parser.add_argument("part1")
+    restore_parser.add_argument("part2")
+    subparsers.add_parser("status")
+    args = parser.parse_args(argv)
+    database.DATABASE_FILE = args.db
+
+    if args.command == "run":
+        print(json.dumps(archive_idle(args.days, args.archive)))
+    elif args.command == "restore":
+        restored = restore([(args.part1, args.part2)], args.archive)
+        if not restored:
+            print(f"{args.part1.upper()}-{args.part2.upper()} is not in the archive", file=sys.stderr)
+            return 1
+        print(f"Restored {restored} contacts")
+    else:
+        print(json.dumps(status(args.archive), ensure_ascii=False, indent=2))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
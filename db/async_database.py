@@ -0,0 +1,158 @@
+import asyncio
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from db import database
+from db.pool import ConnectionPool
+
+class AsyncDatabase:
+    """An asyncio front end for db/database.py.
+
+    Calls run on a bounded thread pool whose workers use dedicated pooled SQLite
+    connections. Every method takes an optional timeout in seconds; on timeout or
+    cancellation a query that is already running is interrupted inside SQLite.
+    """
+
+    def __init__(self, database_file: str = None, max_workers: int = 4, max_iterators: int = 2):
+        self.database_file = database_file or database.DATABASE_FILE
+        self._cancel_state = threading.local()
+        # Workers hold at most one connection each and every open iterator holds one more,
+        # so the pool can never run dry.
+        self._pool = ConnectionPool(self.database_file, size=max_workers + max_iterators, on_connect=self._install_interrupt)
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix="async_db", initializer=database.use_connection_pool, initargs=(self._pool, True))
+        self._iterator_slots = asyncio.Semaphore(max_iterators)
+
+    def _install_interrupt(self, conn: sqlite3.Connection) -> None:
+        database.configure_connection(conn)
+        def check_cancelled():
+            event = getattr(self._cancel_state, "event", None)
+            return 1 if event is not None and event.is_set() else 0
+        conn.set_progress_handler(check_cancelled, 1000)
+
+    async def _run(self, func, *args, timeout: float = None):
+        cancelled = threading.Event()
+
+        def job():
+            self._cancel_state.event = cancelled
+            try:
+                return func(*args)
+            finally:
+                self._cancel_state.event = None
+
+        future = asyncio.get_running_loop().run_in_executor(self._executor, job)
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except (asyncio.CancelledError, asyncio.TimeoutError):
+            cancelled.set()
+            raise
+
+    async def add_plate_info(self, part1: str, part2: str, phone_number: str, note: str, timeout: float = None) -> bool:
+        return await self._run(database.add_plate_info, part1, part2, phone_number, note, timeout=timeout)
+
+    async def get_all_plate_info(self, order_by: str = "plate", descending: bool = False, limit: int = None, offset: int = 0, timeout: float = None) -> list:
+        return await self._run(database.get_all_plate_info, order_by, descending, limit, offset, timeout=timeout)
+
+    async def get_plate(self, part1: str, part2: str, timeout: float = None) -> dict:
+        return await self._run(database.get_plate, part1, part2, timeout=timeout)
+
+    async def lookup_plates(self, pairs, timeout: float = None) -> dict:
+        return await self._run(database.lookup_plates, list(pairs), timeout=timeout)
+
+    async def update_plate_info(self, part1: str, part2: str, new_phone_number: str, new_note: str, old_phone_number: str = None, timeout: float = None) -> bool:
+        return await self._run(database.update_plate_info, part1, part2, new_phone_number, new_note, old_phone_number, timeout=timeout)
+
+    async def move_plate_info(self, part1: str, part2: str, phone_number: str, new_part1: str, new_part2: str,
+                              new_phone_number: str, new_note: str, timeout: float = None) -> bool:
+        return await self._run(database.move_plate_info, part1, part2, phone_number, new_part1, new_part2,
+                               new_phone_number, new_note, timeout=timeout)
+
+    async def delete_plate_info(self, part1: str, part2: str, timeout: float = None) -> int:
+        return await self._run(database.delete_plate_info, part1, part2, timeout=timeout)
+
+    async def add_plate_infos(self, rows: list, timeout: float = None) -> int:
+        return await self._run(database.add_plate_infos, rows, timeout=timeout)
+
+    async def delete_plate_infos(self, rows: list, timeout: float = None) -> int:
+        return await self._run(database.delete_plate_infos, rows, timeout=timeout)
+
+    async def update_plate_infos(self, rows: list, new_phone_number: str = None, new_note: str = None, timeout: float = None) -> int:
+        return await self._run(database.update_plate_infos, rows, new_phone_number, new_note, timeout=timeout)
+
+    async def filter_plate_info(self, part1_filter: str, part2_filter: str, phone_filter: str, search_mode: str,
+                                order_by: str = "plate", descending: bool = False, limit: int = None, offset: int = 0, note_filter: str = "", timeout: float = None) -> list:
+        return await self._run(database.filter_plate_info, part1_filter, part2_filter, phone_filter, search_mode, order_by, descending, limit, offset, note_filter, timeout=timeout)
+
+    async def plate_exists(self, part1: str, part2: str, timeout: float = None) -> bool:
+        return await self._run(database.plate_exists, part1, part2, timeout=timeout)
+
+    async def plate_and_phone_exists(self, part1: str, part2: str, phone_number: str, timeout: float = None) -> bool:
+        return await self._run(database.plate_and_phone_exists, part1, part2, phone_number, timeout=timeout)
+
+    async def plate_and_phone_note_exists(self, part1: str, part2: str, phone_number: str, note: str, timeout: float = None) -> bool:
+        return await self._run(database.plate_and_phone_note_exists, part1, part2, phone_number, note, timeout=timeout)
+
+    async def iter_all_plate_info(self, batch_size: int = 1000, timeout: float = None):
+        """Asynchronously iterate over all plate info, fetching batch_size rows per worker call."""
+        async with self._iterator_slots:
+            batches = database.iter_all_plate_info(batch_size)
+            try:
+                while True:
+                    batch = await self._run(next, batches, None, timeout=timeout)
+                    if batch is None:
+                        break
+                    for row in batch:
+                        yield row
+            finally:
+                try:
+                    await self._run(batches.close)
+                except ValueError:
+                    # Cancelled while a batch was still being fetched; the generator
+                    # closes its connection when it is garbage collected.
+                    pass
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        self._pool.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await asyncio.get_running_loop().run_in_executor(None, self.close)
+
+async def benchmark(database_file: str = None, lookups: int = 5000, concurrency: int = 32, max_workers: int = 4) -> dict:
+    """Compare plate_exists throughput of the sync API against AsyncDatabase under concurrent load."""
+    database_file = database_file or database.DATABASE_FILE
+    previous_file, database.DATABASE_FILE = database.DATABASE_FILE, database_file
+    try:
+        keys = [row[0].split('-', 1) for row in database.get_all_plate_info(limit=lookups)] or [("ABC", "1234")]
+        keys = (keys * (lookups // len(keys) + 1))[:lookups]
+
+        start = time.perf_counter()
+        for part1, part2 in keys:
+            database.plate_exists(part1, part2)
+        sync_seconds = time.perf_counter() - start
+
+        async with AsyncDatabase(database_file, max_workers=max_workers) as adb:
+            limit = asyncio.Semaphore(concurrency)
+
+            async def lookup(part1, part2):
+                async with limit:
+                    return await adb.plate_exists(part1, part2)
+
+            start = time.perf_counter()
+            await asyncio.gather(*(lookup(part1, part2) for part1, part2 in keys))
+            async_seconds = time.perf_counter() - start
+    finally:
+        database.DATABASE_FILE = previous_file
+    return {
+        "lookups": lookups,
+        "sync_per_second": lookups / sync_seconds,
+        "async_per_second": lookups / async_seconds,
+    }
+
+if __name__ == "__main__":
+    import sys
+    result = asyncio.run(benchmark(sys.argv[1] if len(sys.argv) > 1 else None))
+    print(f"{result['lookups']} lookups: sync {result['sync_per_second']:.0f}/s, async {result['async_per_second']:.0f}/s")
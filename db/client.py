@@ -0,0 +1,165 @@
+import builtins
+import json
+import socket
+import sqlite3
+import threading
+
+def _rows(result) -> list:
+    return [tuple(row) for row in result]
+
+def _plate(result):
+    if result is None:
+        return None
+    return {**result, "contacts": _rows(result["contacts"])}
+
+def _lookup(result) -> dict:
+    return {**result, "found": {plate: _rows(contacts) for plate, contacts in result["found"].items()}}
+
+def _error(error: dict) -> Exception:
+    # The server's sqlite3 and builtin exception types (ValueError, TypeError, ...) are raised as they are
+    name = error.get("type", "")
+    exc_type = getattr(sqlite3, name, None) or getattr(builtins, name, None)
+    if not (isinstance(exc_type, type) and issubclass(exc_type, Exception)):
+        exc_type = sqlite3.Error
+    return exc_type(error.get("message", ""))
+
+class _DatabaseApi:
+    """The db/database.py functions, with the same signatures, routed through _call()."""
+
+    def _call(self, method, args, kwargs, convert=None):
+        raise NotImplementedError
+
+    def add_plate_info(self, part1: str, part2: str, phone_number: str, note: str) -> bool:
+        return self._call("add_plate_info", (part1, part2, phone_number, note), {})
+
+    def add_plate_infos(self, rows: list) -> int:
+        return self._call("add_plate_infos", ([list(row) for row in rows],), {})
+
+    def get_all_plate_info(self, order_by: str = "plate", descending: bool = False, limit: int = None, offset: int = 0) -> list:
+        return self._call("get_all_plate_info", (order_by, descending, limit, offset), {}, _rows)
+
+    def get_plate(self, part1: str, part2: str) -> dict:
+        return self._call("get_plate", (part1, part2), {}, _plate)
+
+    def lookup_plates(self, pairs) -> dict:
+        return self._call("lookup_plates", ([list(pair) for pair in pairs],), {}, _lookup)
+
+    def update_plate_info(self, part1: str, part2: str, new_phone_number: str, new_note: str, old_phone_number: str = None) -> bool:
+        return self._call("update_plate_info", (part1, part2, new_phone_number, new_note, old_phone_number), {})
+
+    def move_plate_info(self, part1: str, part2: str, phone_number: str, new_part1: str, new_part2: str,
+                        new_phone_number: str, new_note: str) -> bool:
+        return self._call("move_plate_info", (part1, part2, phone_number, new_part1, new_part2, new_phone_number, new_note), {})
+
+    def delete_plate_info(self, part1: str, part2: str) -> int:
+        return self._call("delete_plate_info", (part1, part2), {})
+
+    def delete_plate_infos(self, rows: list) -> int:
+        return self._call("delete_plate_infos", ([list(row) for row in rows],), {})
+
+    def update_plate_infos(self, rows: list, new_phone_number: str = None, new_note: str = None) -> int:
+        return self._call("update_plate_infos", ([list(row) for row in rows], new_phone_number, new_note), {})
+
+    def filter_plate_info(self, part1_filter: str, part2_filter: str, phone_filter: str, search_mode: str,
+                          order_by: str = "plate", descending: bool = False, limit: int = None, offset: int = 0,
+                          note_filter: str = "") -> list:
+        return self._call("filter_plate_info", (part1_filter, part2_filter, phone_filter, search_mode, order_by, descending, limit, offset, note_filter), {}, _rows)
+
+    def plate_exists(self, part1: str, part2: str) -> bool:
+        return self._call("plate_exists", (part1, part2), {})
+
+    def plate_and_phone_exists(self, part1: str, part2: str, phone_number: str) -> bool:
+        return self._call("plate_and_phone_exists", (part1, part2, phone_number), {})
+
+    def plate_and_phone_note_exists(self, part1: str, part2: str, phone_number: str, note: str) -> bool:
+        return self._call("plate_and_phone_note_exists", (part1, part2, phone_number, note), {})
+
+class DatabaseClient(_DatabaseApi):
+    """Talk to a db/server.py process instead of opening database.db directly.
+
+    address is a (host, port) tuple for TCP or a path string for a Unix socket.
+    """
+
+    def __init__(self, address, timeout: float = 30.0):
+        if isinstance(address, str):
+            self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        else:
+            self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._sock.settimeout(timeout)
+        self._sock.connect(address)
+        self._reader = self._sock.makefile("rb")
+        self._lock = threading.Lock()
+        self._next_id = 0
+
+    def _roundtrip(self, calls: list) -> list:
+        """Send every call before reading any response, then return results in call order."""
+        with self._lock:
+            lines = []
+            for method, args, kwargs, _ in calls:
+                self._next_id += 1
+                request = {"id": self._next_id, "method": method, "args": list(args), "kwargs": kwargs}
+                lines.append(json.dumps(request, ensure_ascii=False).encode("utf-8") + b"\n")
+            self._sock.sendall(b"".join(lines))
+            responses = []
+            for _ in calls:
+                line = self._reader.readline()
+                if not line:
+                    raise ConnectionError("Query server closed the connection.")
+                responses.append(json.loads(line))
+        results = []
+        for (_, _, _, convert), response in zip(calls, responses):
+            if "error" in response:
+                results.append(_error(response["error"]))
+            else:
+                result = response["result"]
+                results.append(convert(result) if convert else result)
+        return results
+
+    def _call(self, method, args, kwargs, convert=None):
+        result = self._roundtrip([(method, args, kwargs, convert)])[0]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def pipeline(self) -> "Pipeline":
+        """Queue several calls and send them in one write; see Pipeline."""
+        return Pipeline(self)
+
+    def close(self) -> None:
+        self._reader.close()
+        self._sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+class Pipeline(_DatabaseApi):
+    """Collect calls without waiting for replies; execute() returns their results in order.
+
+    Failed calls come back as exception instances instead of raising, so one bad
+    request does not hide the results of the others.
+    """
+
+    def __init__(self, client: DatabaseClient):
+        self._client = client
+        self._calls = []
+        self.results = None
+
+    def _call(self, method, args, kwargs, convert=None):
+        self._calls.append((method, args, kwargs, convert))
+        return len(self._calls) - 1
+
+    def execute(self) -> list:
+        calls, self._calls = self._calls, []
+        self.results = self._client._roundtrip(calls) if calls else []
+        return self.results
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.execute()
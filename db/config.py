@@ -0,0 +1,73 @@
+"""Where the databases live: one place for the local database path and the branch registry.
+
+config.json (next to start.py, or next to the executable when frozen) may contain:
+
+    {
+        "database_file": "database.db",
+        "branch_name": "本店",
+        "branches": {"台中店": "//server/share/taichung.db", "高雄店": "branches/kaohsiung.db"},
+        "archive_file": "database_archive.db",
+        "archive_after_days": 730,
+        "snapshot_file": "database.snapshot"
+    }
+
+Relative paths are resolved against that same directory, so the working directory
+no longer decides which database is opened. NEW_AGAIN_DB overrides database_file, and
+NEW_AGAIN_CONFIG names another config.json to use.
+"""
+import json
+import os
+import sys
+
+def base_dir() -> str:
+    """Directory holding config.json and the default database."""
+    if getattr(sys, "frozen", False):
+        return os.path.dirname(os.path.abspath(sys.executable))
+    return os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CONFIG_FILE = os.environ.get("NEW_AGAIN_CONFIG") or os.path.join(base_dir(), "config.json")
+
+def load_config() -> dict:
+    if not os.path.exists(CONFIG_FILE):
+        return {}
+    with open(CONFIG_FILE, "r", encoding="utf-8") as file:
+        return json.load(file)
+
+def save_config(updates: dict) -> None:
+    """Write updates into config.json, keeping the keys that are not being changed."""
+    config = load_config()
+    config.update(updates)
+    with open(CONFIG_FILE, "w", encoding="utf-8") as file:
+        json.dump(config, file, ensure_ascii=False, indent=4)
+
+def resolve_path(path: str) -> str:
+    return os.path.normpath(os.path.join(base_dir(), os.path.expanduser(path)))
+
+def database_path(config: dict = None) -> str:
+    """Absolute path of the local database."""
+    config = load_config() if config is None else config
+    return resolve_path(os.environ.get("NEW_AGAIN_DB") or config.get("database_file", "database.db"))
+
+def archive_path(config: dict = None) -> str:
+    """Absolute path of the archive holding contacts moved out of the local database by db/archive.py."""
+    config = load_config() if config is None else config
+    if "archive_file" in config:
+        return resolve_path(config["archive_file"])
+    return os.path.splitext(database_path(config))[0] + "_archive.db"
+
+def snapshot_path(config: dict = None) -> str:
+    """Absolute path of the read-only lookup snapshot written by db/snapshot.py: a small file naming its current generation."""
+    config = load_config() if config is None else config
+    if "snapshot_file" in config:
+        return resolve_path(config["snapshot_file"])
+    return os.path.splitext(database_path(config))[0] + ".snapshot"
+
+def branch_databases(config: dict = None, include_local: bool = True) -> dict:
+    """Registered databases as {source name: absolute path}, the local one first."""
+    config = load_config() if config is None else config
+    branches = {}
+    if include_local:
+        branches[config.get("branch_name", "本店")] = database_path(config)
+    for name, path in config.get("branches", {}).items():
+        branches[name] = resolve_path(path)
+    return branches
@@ -1,152 +1,706 @@
+import json
 import sqlite3
+import threading
+import time
 from app.logger import logger
+from db.config import database_path
+from db.note_search import search_terms
+from db.storage import configured_profile, connection_pragmas
 
-DATABASE_FILE = "database.db"
+DATABASE_FILE = database_path()
+
+# PRAGMAs of the storage profile chosen in config.json, run on every new connection
+_connection_pragmas = connection_pragmas(configured_profile())
+
+def configure_connection(conn) -> None:
+    for statement in _connection_pragmas:
+        conn.execute(statement)
+
+def set_storage_profile(name: str) -> None:
+    """Use the given db/storage.py profile for connections opened from now on."""
+    global _connection_pragmas
+    _connection_pragmas = connection_pragmas(name)
+
+# Set by use_connection_pool() when a long-running process (e.g. db/server.py) owns the database.
+_pool = None
+_thread_state = threading.local()
 
 def get_connection():
-    return sqlite3.connect(DATABASE_FILE)
+    pool = getattr(_thread_state, "pool", None) or _pool
+    if pool is not None:
+        return pool.acquire()
+    conn = sqlite3.connect(DATABASE_FILE)
+    configure_connection(conn)
+    return conn
+
+def use_connection_pool(pool, current_thread_only: bool = False) -> None:
+    """Serve get_connection() calls from the given pool, or None to go back to plain connections.
+
+    With current_thread_only the pool is bound to the calling thread alone, which is how
+    worker threads get dedicated connections without affecting the rest of the process.
+    """
+    global _pool
+    if current_thread_only:
+        _thread_state.pool = pool
+    else:
+        _pool = pool
+
+# Set by enable_memory_mirror(); reads are then served from an in-memory copy of the database.
+_mirror = None
+
+def get_read_connection():
+    if _mirror is not None:
+        return _mirror.acquire()
+    return get_connection()
+
+def enable_memory_mirror() -> None:
+    """Copy DATABASE_FILE into memory and serve reads from the copy; writes go to both."""
+    global _mirror
+    from db.memory_mirror import MemoryMirror
+    mirror = MemoryMirror(DATABASE_FILE)
+    mirror.load()
+    _mirror = mirror
+
+def disable_memory_mirror() -> bool:
+    """Stop using the in-memory mirror. Returns False if it had diverged from the disk file."""
+    global _mirror
+    mirror, _mirror = _mirror, None
+    if mirror is None:
+        return True
+    consistent = mirror.verify()
+    mirror.close()
+    return consistent
+
+# Set by enable_parallel_scan(); filter_plate_info() is then served by a ParallelScanner.
+_scanner = None
+
+def enable_parallel_scan(processes: int = None) -> None:
+    """Export the contacts to shared memory and run filter_plate_info() on a pool of processes."""
+    global _scanner
+    from db.parallel_scan import ParallelScanner
+    scanner = ParallelScanner(processes)
+    try:
+        scanner.load()
+    except BaseException:
+        scanner.close()
+        raise
+    _scanner = scanner
+
+def disable_parallel_scan() -> None:
+    global _scanner
+    scanner, _scanner = _scanner, None
+    if scanner is not None:
+        scanner.close()
+
+# Set by enable_hit_tracking(); counts plate lookups and serves the most looked-up plates from memory.
+_hits = None
+
+def enable_hit_tracking(flush_interval: float = 30.0, hot_size: int = 1000) -> None:
+    """Count lookups and selections per plate, writing the counts every flush_interval seconds."""
+    global _hits
+    from db.hits import HitTracker
+    tracker = HitTracker(flush_interval, hot_size)
+    tracker.start()
+    _hits = tracker
+
+def disable_hit_tracking() -> None:
+    """Stop counting and write the counts not yet flushed."""
+    global _hits
+    tracker, _hits = _hits, None
+    if tracker is not None:
+        tracker.close()
+
+def record_selection(part1: str, part2: str) -> None:
+    """Count that the user picked this plate from search results."""
+    if _hits is not None:
+        _hits.record(part1, part2, selection=True)
+
+def _execute_write(cursor, sql: str, params: tuple) -> None:
+    """Run a write statement and, with the memory mirror on, replay it there before the disk commit."""
+    cursor.execute(sql, params)
+    if _mirror is not None and cursor.rowcount > 0:
+        _mirror.apply(sql, params)
+
+def _execute_write_many(cursor, sql: str, seq_of_params: list) -> None:
+    """Batch form of _execute_write()."""
+    cursor.executemany(sql, seq_of_params)
+    if _mirror is not None and cursor.rowcount > 0:
+        _mirror.apply(sql, seq_of_params, many=True)
+
+# Called as listener(removed, added) after each committed write, with lists of
+# (part1, part2, phone_number) contacts; used to keep in-memory indexes current. A contact
+# whose note changed is reported as removed and added again.
+_write_listeners = []
+
+def add_write_listener(listener) -> None:
+    _write_listeners.append(listener)
+
+def remove_write_listener(listener) -> None:
+    _write_listeners.remove(listener)
+
+def _notify(removed: list, added: list) -> None:
+    for listener in list(_write_listeners):
+        try:
+            listener(removed, added)
+        except Exception:
+            logger.exception("Write listener %r failed", listener)
+
+def _commit(conn) -> None:
+    try:
+        conn.commit()
+    except sqlite3.Error:
+        if _mirror is not None:
+            _mirror.invalidate()
+        raise
+
+def _rollback(conn) -> None:
+    """Undo a failed write. The memory mirror may already hold some of its statements, so it reloads."""
+    conn.rollback()
+    if _mirror is not None:
+        _mirror.invalidate()
 
-def add_plate_info(part1: str, part2: str, phone_number: str, note: str) -> None:
-    """Add a new plate info to the database."""
+# Shared SELECT for the flat (plate, phone, note) rows the UI works with
+PLATE_INFO_SELECT = '''
+    SELECT plates.part1, plates.part2, contacts.phone_number, contacts.note
+    FROM contacts JOIN plates ON plates.id = contacts.plate_id
+'''
+
+# Resolves a plate id from (part1, part2) through the UNIQUE(part1, part2) index
+PLATE_ID = '(SELECT id FROM plates WHERE part1 = ? AND part2 = ?)'
+
+def now() -> str:
+    """Local time in the format of contacts.created_at and last_seen_at.
+
+    Timestamps are passed to the statements as parameters rather than computed by SQLite,
+    so the memory mirror stores exactly what the disk file does when it replays a write.
+    """
+    return time.strftime("%Y-%m-%d %H:%M:%S")
+
+def add_plate_info(part1: str, part2: str, phone_number: str, note: str) -> bool:
+    """Add a new plate info to the database. Returns False if the plate already has this phone number."""
     conn = get_connection()
     cursor = conn.cursor()
     try:
-        cursor.execute('''
-            INSERT INTO plate_info (part1, part2, phone_number, note)
-            VALUES (?, ?, ?, ?)
-        ''', (part1.upper(), part2.upper(), phone_number, note))
-        conn.commit()
-        logger.info(f"Added plate info: {part1.upper()}-{part2.upper()} with phone number: {phone_number}")
+        _execute_write(cursor, '''
+            INSERT OR IGNORE INTO plates (part1, part2)
+            VALUES (?, ?)
+        ''', (part1.upper(), part2.upper()))
+        _execute_write(cursor, f'''
+            INSERT INTO contacts (plate_id, phone_number, note, created_at, last_seen_at)
+            VALUES ({PLATE_ID}, ?, ?, ?, ?)
+        ''', (part1.upper(), part2.upper(), phone_number, note) + (now(),) * 2)
+        _commit(conn)
+        logger.info("Added plate info: %s-%s with phone number: %s", part1.upper(), part2.upper(), phone_number)
+        _notify([], [(part1.upper(), part2.upper(), phone_number)])
+        return True
     except sqlite3.IntegrityError as e:
-        logger.warning(f"Failed to add plate info: {e}")
+        _rollback(conn)
+        logger.warning("Failed to add plate info: %s", e)
+        return False
+    except BaseException:
+        _rollback(conn)
+        raise
     finally:
         conn.close()
 
-def get_all_plate_info() -> list:
-    """Get all plate info from the database."""
+def add_plate_infos(rows: list) -> int:
+    """Add several (part1, part2, phone_number, note) rows in one transaction, skipping existing ones.
+
+    Returns the number of rows added.
+    """
+    added_at = now()
+    rows = [(part1.upper(), part2.upper(), phone_number, note, added_at, added_at) for part1, part2, phone_number, note in rows]
     conn = get_connection()
     cursor = conn.cursor()
-    cursor.execute('SELECT part1, part2, phone_number, note FROM plate_info ORDER BY part1 ASC, part2 ASC')
+    try:
+        _execute_write_many(cursor, '''
+            INSERT OR IGNORE INTO plates (part1, part2)
+            VALUES (?, ?)
+        ''', [(part1, part2) for part1, part2, _, _, _, _ in rows])
+        insert = f'''
+            INSERT OR IGNORE INTO contacts (plate_id, phone_number, note, created_at, last_seen_at)
+            VALUES ({PLATE_ID}, ?, ?, ?, ?)
+        '''
+        if _write_listeners:
+            # Row by row, so listeners only hear about the rows that were not already there
+            added_rows = []
+            for row in rows:
+                _execute_write(cursor, insert, row)
+                if cursor.rowcount > 0:
+                    added_rows.append(row[:3])
+            added = len(added_rows)
+        else:
+            _execute_write_many(cursor, insert, rows)
+            added = cursor.rowcount
+        _commit(conn)
+    except BaseException:
+        _rollback(conn)
+        raise
+    finally:
+        conn.close()
+    logger.info("Added %d of %d plate info rows", added, len(rows))
+    if _write_listeners:
+        _notify([], added_rows)
+    return added
+
+# ORDER BY terms for each sortable column. Every list ends in a unique key so paging is stable,
+# and each matches an index from initialize_db.py so SQLite can walk the index instead of sorting.
+SORT_COLUMNS = {
+    "plate": ("plates.part1", "plates.part2", "contacts.phone_number"),
+    "phone": ("contacts.phone_number", "contacts.plate_id"),
+    "note": ("contacts.note", "contacts.plate_id", "contacts.phone_number"),
+    # Note search only: bm25() is lower for better matches, so ascending puts the best first
+    "relevance": ("note_hits.relevance", "plates.part1", "plates.part2", "contacts.phone_number"),
+}
+
+def _order_clause(order_by: str, descending: bool, limit: int, offset: int) -> tuple:
+    if order_by not in SORT_COLUMNS:
+        raise ValueError(f"Cannot sort by {order_by!r}; expected one of {', '.join(SORT_COLUMNS)}")
+    direction = "DESC" if descending else "ASC"
+    clause = "ORDER BY " + ", ".join(f"{column} {direction}" for column in SORT_COLUMNS[order_by])
+    return clause + " LIMIT ? OFFSET ?", (-1 if limit is None else limit, offset)
+
+def get_all_plate_info(order_by: str = "plate", descending: bool = False, limit: int = None, offset: int = 0) -> list:
+    """Get all plate info from the database, sorted by plate, phone or note and optionally paged."""
+    order_by = _search_order(order_by, "", "")
+    order_clause, page_params = _order_clause(order_by, descending, limit, offset)
+    conn = get_read_connection()
+    cursor = conn.cursor()
+    cursor.execute(f'{PLATE_INFO_SELECT} {order_clause}', page_params)
     data = cursor.fetchall()
     conn.close()
     return [(f"{row[0]}-{row[1]}", row[2], row[3]) for row in data]
 
-def update_plate_info(part1: str, part2: str, new_phone_number: str, new_note: str) -> None:
-    """Update the phone number and note for an existing plate info."""
+def iter_all_plate_info(batch_size: int = 1000):
+    """Yield all plate info in batches of at most batch_size rows, without loading the whole table."""
     conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(f'{PLATE_INFO_SELECT} ORDER BY plates.part1 ASC, plates.part2 ASC')
+        while True:
+            data = cursor.fetchmany(batch_size)
+            if not data:
+                break
+            yield [(f"{row[0]}-{row[1]}", row[2], row[3]) for row in data]
+    finally:
+        conn.close()
+
+def get_plate(part1: str, part2: str) -> dict:
+    """Get one plate with all of its contacts aggregated in a single query, or None if it does not exist."""
+    part1, part2 = part1.upper(), part2.upper()
+    if _hits is not None:
+        _hits.record(part1, part2)
+        contacts = _hits.hot_contacts(part1, part2)
+        if contacts is not None:
+            return {"plate": f"{part1}-{part2}", "contacts": list(contacts)}
+    conn = get_read_connection()
     cursor = conn.cursor()
+    cursor.execute('''
+        SELECT plates.part1, plates.part2,
+               json_group_array(json_array(contacts.phone_number, contacts.note))
+        FROM plates JOIN contacts ON contacts.plate_id = plates.id
+        WHERE plates.part1 = ? AND plates.part2 = ?
+        GROUP BY plates.id
+    ''', (part1, part2))
+    row = cursor.fetchone()
+    conn.close()
+    if row is None:
+        from db.archive import lookup_archived
+        archived = lookup_archived([(part1, part2)]).get((part1, part2))
+        if archived is None:
+            return None
+        # A customer archived for not coming in for a long time (see db/archive.py)
+        return {"plate": f"{part1}-{part2}", "contacts": archived, "archived": True}
+    return {"plate": f"{row[0]}-{row[1]}", "contacts": [tuple(contact) for contact in json.loads(row[2])]}
+
+def lookup_plates(pairs) -> dict:
+    """Look up many (part1, part2) plates with one indexed join instead of one query per plate.
+
+    Returns {"found": {"P1-P2": [(phone_number, note), ...]}, "missing": ["P1-P2", ...],
+    "archived": ["P1-P2", ...]}, all in the order the plates were first given. Plates not in the
+    database are looked up in the archive (db/archive.py); those found there are both in
+    "found" and in "archived".
+    """
+    keys = list(dict.fromkeys((part1.upper(), part2.upper()) for part1, part2 in pairs))
+    contacts = {}
+    if _hits is not None:
+        for seq, (part1, part2) in enumerate(keys):
+            _hits.record(part1, part2)
+            hot = _hits.hot_contacts(part1, part2)
+            if hot is not None:
+                contacts[seq] = list(hot)
+    if len(contacts) == len(keys):
+        return _lookup_result(keys, contacts)
+    conn = get_read_connection()
+    try:
+        conn.execute('''
+            CREATE TEMP TABLE IF NOT EXISTS lookup_keys (
+                seq INTEGER PRIMARY KEY,
+                part1 TEXT NOT NULL,
+                part2 TEXT NOT NULL
+            )
+        ''')
+        conn.executemany("INSERT INTO temp.lookup_keys (seq, part1, part2) VALUES (?, ?, ?)",
+                         ((seq, part1, part2) for seq, (part1, part2) in enumerate(keys) if seq not in contacts))
+        # The key table drives the loop; each key is resolved through UNIQUE(part1, part2)
+        rows = conn.execute('''
+            SELECT lookup_keys.seq, contacts.phone_number, contacts.note
+            FROM temp.lookup_keys
+            JOIN plates ON plates.part1 = lookup_keys.part1 AND plates.part2 = lookup_keys.part2
+            JOIN contacts ON contacts.plate_id = plates.id
+            ORDER BY lookup_keys.seq, contacts.phone_number
+        ''').fetchall()
+        # Only the temp table changed, so this commit never touches the database file
+        conn.execute("DELETE FROM temp.lookup_keys")
+        conn.commit()
+    finally:
+        conn.close()
+    for seq, phone_number, note in rows:
+        contacts.setdefault(seq, []).append((phone_number, note))
+    from db.archive import lookup_archived
+    archived = lookup_archived([key for seq, key in enumerate(keys) if seq not in contacts])
+    return _lookup_result(keys, contacts, archived)
+
+def _lookup_result(keys: list, contacts: dict, archived: dict = None) -> dict:
+    found, missing, from_archive = {}, [], []
+    for seq, (part1, part2) in enumerate(keys):
+        if seq in contacts:
+            found[f"{part1}-{part2}"] = contacts[seq]
+        elif archived and (part1, part2) in archived:
+            found[f"{part1}-{part2}"] = archived[(part1, part2)]
+            from_archive.append(f"{part1}-{part2}")
+        else:
+            missing.append(f"{part1}-{part2}")
+    return {"found": found, "missing": missing, "archived": from_archive}
+
+def backup_database(destination: str) -> None:
+    """Copy the database to destination with the SQLite backup API, which is safe while others use it."""
+    source = sqlite3.connect(DATABASE_FILE)
+    target = sqlite3.connect(destination)
     try:
-        cursor.execute('''
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+    logger.info("Backed up %s to %s", DATABASE_FILE, destination)
+
+def update_plate_info(part1: str, part2: str, new_phone_number: str, new_note: str, old_phone_number: str = None) -> bool:
+    """Update the phone number and note of one contact of a plate, or of all its contacts if old_phone_number is None.
+
+    Returns False, changing nothing, if the contact is gone or the plate already has the new phone number.
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f'''
             SELECT COUNT(*)
-            FROM plate_info
-            WHERE part1 = ? AND part2 = ? AND phone_number = ?
-        ''', (part1.upper(), part2.upper(), new_phone_number))
+            FROM contacts
+            WHERE plate_id = {PLATE_ID} AND phone_number = ? AND phone_number IS NOT ?
+        ''', (part1.upper(), part2.upper(), new_phone_number, old_phone_number))
         if cursor.fetchone()[0] > 0:
-            raise sqlite3.IntegrityError("UNIQUE constraint failed: plate_info.part1, plate_info.part2, plate_info.phone_number")
-        
-        cursor.execute('''
-            UPDATE plate_info
-            SET phone_number = ?, note = ?
-            WHERE part1 = ? AND part2 = ?
-        ''', (new_phone_number, new_note, part1.upper(), part2.upper()))
-        if cursor.rowcount > 0:
-            conn.commit()
-            logger.info(f"Updated plate info: {part1.upper()}-{part2.upper()}")
+            raise sqlite3.IntegrityError("UNIQUE constraint failed: contacts.plate_id, contacts.phone_number")
+
+        if old_phone_number is not None:
+            old_phone_numbers = [old_phone_number]
+        elif _write_listeners:
+            cursor.execute(f'SELECT phone_number FROM contacts WHERE plate_id = {PLATE_ID}', (part1.upper(), part2.upper()))
+            old_phone_numbers = [row[0] for row in cursor.fetchall()]
+        if old_phone_number is None:
+            _execute_write(cursor, f'''
+                UPDATE contacts
+                SET phone_number = ?, note = ?, last_seen_at = ?
+                WHERE plate_id = {PLATE_ID}
+            ''', (new_phone_number, new_note, now(), part1.upper(), part2.upper()))
         else:
+            _execute_write(cursor, f'''
+                UPDATE contacts
+                SET phone_number = ?, note = ?, last_seen_at = ?
+                WHERE plate_id = {PLATE_ID} AND phone_number = ?
+            ''', (new_phone_number, new_note, now(), part1.upper(), part2.upper(), old_phone_number))
+        if cursor.rowcount > 0:
+            _commit(conn)
+            logger.info("Updated plate info: %s-%s", part1.upper(), part2.upper())
+            if _write_listeners:
+                plate = (part1.upper(), part2.upper())
+                _notify([plate + (phone,) for phone in old_phone_numbers], [plate + (new_phone_number,)] * cursor.rowcount)
+            return True
+        logger.error("Plate info not found in the database.")
+        return False
+    except sqlite3.IntegrityError as e:
+        _rollback(conn)
+        logger.error("Failed to update plate info: %s", e)
+        return False
+    except BaseException:
+        _rollback(conn)
+        raise
+    finally:
+        conn.close()
+
+def move_plate_info(part1: str, part2: str, phone_number: str, new_part1: str, new_part2: str,
+                    new_phone_number: str, new_note: str) -> bool:
+    """Move one contact to another plate, with a new phone number and note, in one transaction.
+
+    Returns False, changing nothing, if the contact is gone or the new plate already has the new phone number.
+    """
+    old = (part1.upper(), part2.upper(), phone_number)
+    new = (new_part1.upper(), new_part2.upper(), new_phone_number)
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        _execute_write(cursor, '''
+            INSERT OR IGNORE INTO plates (part1, part2)
+            VALUES (?, ?)
+        ''', new[:2])
+        _execute_write(cursor, f'''
+            UPDATE contacts
+            SET plate_id = {PLATE_ID}, phone_number = ?, note = ?, last_seen_at = ?
+            WHERE plate_id = {PLATE_ID} AND phone_number = ?
+        ''', new + (new_note, now()) + old)
+        if cursor.rowcount == 0:
+            _rollback(conn)
             logger.error("Plate info not found in the database.")
+            return False
+        _commit(conn)
+        logger.info("Moved %s-%s %s to %s-%s", *old, *new[:2])
+        _notify([old], [new])
+        return True
     except sqlite3.IntegrityError as e:
-        logger.error(f"Failed to update plate info: {e}")
+        _rollback(conn)
+        logger.warning("Failed to move plate info: %s", e)
+        return False
+    except BaseException:
+        _rollback(conn)
+        raise
     finally:
         conn.close()
 
-def delete_plate_info(part1: str, part2: str) -> None:
-    """Delete a plate info from the database."""
+def delete_plate_info(part1: str, part2: str) -> int:
+    """Delete every contact of a plate. Returns the number of contacts deleted."""
     conn = get_connection()
     cursor = conn.cursor()
-    cursor.execute('''
-        DELETE FROM plate_info
-        WHERE part1 = ? AND part2 = ?
-    ''', (part1.upper(), part2.upper()))
-    if cursor.rowcount > 0:
-        conn.commit()
-        logger.info(f"Deleted plate info: {part1.upper()}-{part2.upper()}")
+    removed = []
+    if _write_listeners:
+        cursor.execute(f'SELECT phone_number FROM contacts WHERE plate_id = {PLATE_ID}', (part1.upper(), part2.upper()))
+        removed = [(part1.upper(), part2.upper(), row[0]) for row in cursor.fetchall()]
+    try:
+        _execute_write(cursor, f'''
+            DELETE FROM contacts
+            WHERE plate_id = {PLATE_ID}
+        ''', (part1.upper(), part2.upper()))
+        deleted = cursor.rowcount
+        if deleted > 0:
+            _commit(conn)
+    except BaseException:
+        _rollback(conn)
+        raise
+    finally:
+        conn.close()
+    if deleted > 0:
+        logger.info("Deleted plate info: %s-%s", part1.upper(), part2.upper())
+        _notify(removed, [])
     else:
         logger.error("Plate info not found in the database.")
-    conn.close()
+    return deleted
 
-def filter_plate_info(part1_filter: str, part2_filter: str, phone_filter: str, search_mode: str) -> list:
-    """Filter plate info based on the given filters."""
+def delete_plate_infos(rows: list) -> int:
+    """Delete several (part1, part2, phone_number) rows in one transaction. Returns the number deleted."""
+    params = [(part1.upper(), part2.upper(), phone_number) for part1, part2, phone_number in rows]
     conn = get_connection()
     cursor = conn.cursor()
-    if search_mode == "電話查詢":
-        cursor.execute('''
-            SELECT part1, part2, phone_number, note
-            FROM plate_info
-            WHERE phone_number LIKE ?
-        ''', (f"%{phone_filter}%",))
-    else:
-        if part1_filter and part2_filter:
-            cursor.execute('''
-                SELECT part1, part2, phone_number, note
-                FROM plate_info
-                WHERE part1 LIKE ? AND part2 LIKE ?
-            ''', (f"%{part1_filter}%", f"%{part2_filter}%"))
-        elif part1_filter:
-            cursor.execute('''
-                SELECT part1, part2, phone_number, note
-                FROM plate_info
-                WHERE part1 LIKE ?
-            ''', (f"%{part1_filter}%",))
-        elif part2_filter:
-            cursor.execute('''
-                SELECT part1, part2, phone_number, note
-                FROM plate_info
-                WHERE part2 LIKE ?
-            ''', (f"%{part2_filter}%",))
+    delete = f'''
+        DELETE FROM contacts
+        WHERE plate_id = {PLATE_ID} AND phone_number = ?
+    '''
+    try:
+        if _write_listeners:
+            removed = []
+            for row in params:
+                _execute_write(cursor, delete, row)
+                if cursor.rowcount > 0:
+                    removed.append(row)
+            deleted = len(removed)
         else:
-            cursor.execute('''
-                SELECT part1, part2, phone_number, note
-                FROM plate_info
-            ''')
+            _execute_write_many(cursor, delete, params)
+            deleted = cursor.rowcount
+        _commit(conn)
+    except BaseException:
+        _rollback(conn)
+        raise
+    finally:
+        conn.close()
+    logger.info("Deleted %d of %d selected plate info rows", deleted, len(params))
+    if _write_listeners:
+        _notify(removed, [])
+    return deleted
+
+def update_plate_infos(rows: list, new_phone_number: str = None, new_note: str = None) -> int:
+    """Set a new phone number and/or note on several (part1, part2, phone_number) rows in one transaction.
+
+    None leaves that column unchanged. Returns the number of rows updated, or 0 if the
+    change would duplicate a plate and phone number, in which case nothing is updated.
+    """
+    updated_at = now()
+    params = [(new_phone_number, new_note, updated_at, part1.upper(), part2.upper(), phone_number) for part1, part2, phone_number in rows]
+    conn = get_connection()
+    cursor = conn.cursor()
+    update = f'''
+        UPDATE contacts
+        SET phone_number = COALESCE(?, phone_number), note = COALESCE(?, note), last_seen_at = ?
+        WHERE plate_id = {PLATE_ID} AND phone_number = ?
+    '''
+    try:
+        changed = []
+        if _write_listeners:
+            for row in params:
+                _execute_write(cursor, update, row)
+                if cursor.rowcount > 0:
+                    changed.append(row[3:])
+            updated = len(changed)
+        else:
+            _execute_write_many(cursor, update, params)
+            updated = cursor.rowcount
+        _commit(conn)
+        logger.info("Updated %d of %d selected plate info rows", updated, len(params))
+        if changed:
+            _notify(changed, [(part1, part2, phone_number if new_phone_number is None else new_phone_number)
+                              for part1, part2, phone_number in changed])
+        return updated
+    except sqlite3.IntegrityError as e:
+        _rollback(conn)
+        logger.error("Failed to update plate info rows: %s", e)
+        return 0
+    except BaseException:
+        _rollback(conn)
+        raise
+    finally:
+        conn.close()
+
+NOTE_SEARCH = "備註查詢"
+
+def _filter_where(part1_filter: str, part2_filter: str, phone_filter: str, search_mode: str,
+                  note_filter: str = "") -> tuple:
+    """Return the WHERE clause and its parameters for filter_plate_info().
+
+    A note search joins the matching rows of contacts_note_fts instead, which also provides
+    the relevance column, looks two-ideograph words up in contacts_note_bigrams and matches
+    other words too short for the index with LIKE; empty search text matches every row.
+    """
+    if search_mode == NOTE_SEARCH:
+        query, bigrams, patterns = search_terms(note_filter)
+        conditions = ["contacts.id IN (SELECT contact_id FROM contacts_note_bigrams WHERE bigram = ?)" for _ in bigrams]
+        if patterns:
+            likes = " AND ".join("contacts.note LIKE ? ESCAPE '\\'" for _ in patterns)
+            if query is None and not bigrams:
+                # Through the id so SQLite scans the note index rather than every plate in plate order
+                likes = f"contacts.id IN (SELECT id FROM contacts WHERE {likes})"
+            conditions.append(likes)
+        where = "WHERE " + " AND ".join(conditions) if conditions else ""
+        if query is None:
+            return where, (*bigrams, *patterns)
+        return f'''
+            JOIN (SELECT rowid AS contact_id, bm25(contacts_note_fts) AS relevance
+                  FROM contacts_note_fts WHERE contacts_note_fts MATCH ?) AS note_hits
+              ON note_hits.contact_id = contacts.id
+            {where}
+        ''', (query, *bigrams, *patterns)
+    if search_mode == "電話查詢":
+        return "WHERE contacts.phone_number LIKE ?", (f"%{phone_filter}%",)
+    if part1_filter and part2_filter:
+        return "WHERE plates.part1 LIKE ? AND plates.part2 LIKE ?", (f"%{part1_filter}%", f"%{part2_filter}%")
+    if part1_filter:
+        return "WHERE plates.part1 LIKE ?", (f"%{part1_filter}%",)
+    if part2_filter:
+        return "WHERE plates.part2 LIKE ?", (f"%{part2_filter}%",)
+    return "", ()
+
+def _search_order(order_by: str, search_mode: str, note_filter: str) -> str:
+    """order_by, with relevance replaced by plate order where there is no note search to rank by."""
+    if order_by == "relevance" and (search_mode != NOTE_SEARCH or search_terms(note_filter)[0] is None):
+        return "plate"
+    return order_by
+
+def filter_plate_info(part1_filter: str, part2_filter: str, phone_filter: str, search_mode: str,
+                      order_by: str = "plate", descending: bool = False, limit: int = None, offset: int = 0,
+                      note_filter: str = "") -> list:
+    """Filter plate info based on the given filters, sorted by plate, phone, note, note search relevance
+    or lookup frequency and optionally paged.
+
+    "frequency" puts the plates looked up and selected most often (see db/hits.py) first, in
+    plate order among equals; descending puts them last.
+    """
+    order_by = _search_order(order_by, search_mode, note_filter)
+    if order_by == "frequency":
+        rows = _rank_by_hits(filter_plate_info(part1_filter, part2_filter, phone_filter, search_mode,
+                                               note_filter=note_filter), descending)
+        return rows[offset:] if limit is None else rows[offset:offset + limit]
+    if _scanner is not None and search_mode != NOTE_SEARCH:
+        return _scanner.filter_plate_info(part1_filter, part2_filter, phone_filter, search_mode,
+                                          order_by, descending, limit, offset)
+    where, params = _filter_where(part1_filter, part2_filter, phone_filter, search_mode, note_filter)
+    order_clause, page_params = _order_clause(order_by, descending, limit, offset)
+    conn = get_read_connection()
+    cursor = conn.cursor()
+    cursor.execute(f'''
+        {PLATE_INFO_SELECT}
+        {where}
+        {order_clause}
+    ''', params + page_params)
     data = cursor.fetchall()
     conn.close()
     return [(f"{row[0]}-{row[1]}", row[2], row[3]) for row in data]
 
+def _rank_by_hits(rows: list, descending: bool) -> list:
+    # Ranked after the query: an ORDER BY on the counts makes SQLite scan contacts before plates,
+    # which is many times slower than filtering in plate order and sorting the hits here
+    plates = list(dict.fromkeys(row[0] for row in rows))
+    conn = get_read_connection()
+    try:
+        counts = dict(conn.execute('''
+            SELECT plates.part1 || '-' || plates.part2, plate_hits.lookups + plate_hits.selections
+            FROM json_each(?) AS wanted
+            JOIN plates ON plates.part1 = json_extract(wanted.value, '$[0]') AND plates.part2 = json_extract(wanted.value, '$[1]')
+            JOIN plate_hits ON plate_hits.plate_id = plates.id
+        ''', (json.dumps([plate.split("-", 1) for plate in plates]),)).fetchall())
+    finally:
+        conn.close()
+    # sort() is stable, also with reverse=True, so equal counts keep their plate order
+    return sorted(rows, key=lambda row: counts.get(row[0], 0), reverse=not descending)
+
 def plate_exists(part1: str, part2: str) -> bool:
     """Check if the plate info already exists in the database."""
-    conn = get_connection()
+    conn = get_read_connection()
     cursor = conn.cursor()
     cursor.execute('''
-        SELECT COUNT(*)
-        FROM plate_info
+        SELECT 1
+        FROM plates
         WHERE part1 = ? AND part2 = ?
     ''', (part1.upper(), part2.upper()))
-    exists = cursor.fetchone()[0] > 0
+    exists = cursor.fetchone() is not None
     conn.close()
     return exists
 
 def plate_and_phone_exists(part1: str, part2: str, phone_number: str) -> bool:
     """Check if both plate number and phone number are duplicated in the database."""
-    conn = get_connection()
+    conn = get_read_connection()
     cursor = conn.cursor()
-    cursor.execute('''
-        SELECT COUNT(*)
-        FROM plate_info
-        WHERE part1 = ? AND part2 = ? AND phone_number = ?
+    cursor.execute(f'''
+        SELECT 1
+        FROM contacts
+        WHERE plate_id = {PLATE_ID} AND phone_number = ?
     ''', (part1.upper(), part2.upper(), phone_number))
-    exists = cursor.fetchone()[0] > 0
+    exists = cursor.fetchone() is not None
     conn.close()
     return exists
 
 def plate_and_phone_note_exists(part1: str, part2: str, phone_number: str, note: str) -> bool:
     """Check if both plate number and phone number are duplicated in the database."""
-    conn = get_connection()
+    conn = get_read_connection()
     cursor = conn.cursor()
-    cursor.execute('''
-        SELECT COUNT(*)
-        FROM plate_info
-        WHERE part1 = ? AND part2 = ? AND phone_number = ? AND note = ?
+    cursor.execute(f'''
+        SELECT 1
+        FROM contacts
+        WHERE plate_id = {PLATE_ID} AND phone_number = ? AND note = ?
     ''', (part1.upper(), part2.upper(), phone_number, note))
-    exists = cursor.fetchone()[0] > 0
+    exists = cursor.fetchone() is not None
     conn.close()
     return exists
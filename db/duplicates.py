@@ -0,0 +1,255 @@
+"""Find phone numbers entered more than once, and merge the redundant ones after a preview.
+
+Phones are compared by their digits only (PHONE_KEY strips dashes, spaces, dots and
+brackets), so "0912-345-678" and "0912345678" are the same number.
+
+    python -m db.duplicates            # print the report and the merge preview
+    python -m db.duplicates --merge    # apply the preview in one transaction
+"""
+import argparse
+import json
+import sqlite3
+import sys
+import time
+from app.logger import logger
+from db import database
+
+# Digits-only form of contacts.phone_number, computed in SQL so grouping never leaves SQLite
+PHONE_KEY = ("replace(replace(replace(replace(replace(replace(contacts.phone_number, "
+             "'-', ''), ' ', ''), '.', ''), '(', ''), ')', ''), '/', '')")
+
+def _load_formatted(conn) -> int:
+    """Fill temp.formatted_phones with the contacts whose phone is not in digits-only form.
+
+    Only these rows can make two numbers equal after normalization; the cheap GLOB test
+    skips computing PHONE_KEY for the digits-only majority.
+    """
+    conn.execute('''
+        CREATE TEMP TABLE IF NOT EXISTS formatted_phones (
+            id INTEGER PRIMARY KEY, plate_id INTEGER, phone_number TEXT, phone_key TEXT
+        )
+    ''')
+    conn.execute("DELETE FROM temp.formatted_phones")
+    return conn.execute(f'''
+        INSERT INTO temp.formatted_phones
+        SELECT * FROM (
+            SELECT contacts.id, contacts.plate_id, contacts.phone_number, {PHONE_KEY} AS phone_key
+            FROM contacts
+            WHERE contacts.phone_number GLOB '*[^0-9]*'
+        ) WHERE phone_number != phone_key
+    ''').rowcount
+
+def _find_within_plate(conn) -> list:
+    """Contacts of one plate whose phones only differ in formatting, one group per plate and number."""
+    rows = conn.execute('''
+        WITH keyed AS (
+            SELECT contacts.id, contacts.plate_id, contacts.phone_number, contacts.note,
+                   COALESCE(formatted_phones.phone_key, contacts.phone_number) AS phone_key
+            FROM contacts LEFT JOIN temp.formatted_phones ON formatted_phones.id = contacts.id
+            WHERE contacts.plate_id IN (SELECT plate_id FROM temp.formatted_phones)
+        ), ranked AS (
+            SELECT keyed.*,
+                   COUNT(*) OVER (PARTITION BY plate_id, phone_key) AS copies,
+                   -- keep the copy already in digits-only form, otherwise the oldest
+                   ROW_NUMBER() OVER (PARTITION BY plate_id, phone_key
+                                      ORDER BY phone_number = phone_key DESC, id) AS position
+            FROM keyed
+        )
+        SELECT ranked.id, plates.part1, plates.part2, ranked.phone_number, ranked.note, ranked.phone_key, ranked.position
+        FROM ranked JOIN plates ON plates.id = ranked.plate_id
+        WHERE ranked.copies > 1
+        ORDER BY plates.part1, plates.part2, ranked.phone_key, ranked.position
+    ''').fetchall()
+    groups = []
+    for contact_id, part1, part2, phone_number, note, phone_key, position in rows:
+        if position == 1:
+            groups.append({"plate": f"{part1}-{part2}", "phone_key": phone_key,
+                           "keep": [contact_id, phone_number, note], "merge": []})
+        else:
+            groups[-1]["merge"].append([contact_id, phone_number, note])
+    return groups
+
+def _find_shared_phones(conn, limit: int) -> tuple:
+    """Return (numbers used on more than one plate, the plate/phone clusters they connect)."""
+    rows = conn.execute('''
+        WITH candidates AS (
+            -- UNIQUE(plate_id, phone_number) makes every repeat a different plate; this walks idx_contacts_phone
+            SELECT phone_number AS phone_key FROM contacts GROUP BY phone_number HAVING COUNT(*) > 1
+            UNION
+            SELECT phone_key FROM temp.formatted_phones
+        ), members AS (
+            SELECT contacts.plate_id, contacts.phone_number, contacts.phone_number AS phone_key
+            FROM candidates JOIN contacts ON contacts.phone_number = candidates.phone_key
+            UNION
+            SELECT plate_id, phone_number, phone_key FROM temp.formatted_phones
+        ), shared AS (
+            SELECT phone_key FROM members GROUP BY phone_key HAVING COUNT(DISTINCT plate_id) > 1
+        )
+        SELECT members.phone_key, members.plate_id, plates.part1 || '-' || plates.part2, members.phone_number
+        FROM members JOIN shared USING (phone_key) JOIN plates ON plates.id = members.plate_id
+        ORDER BY members.phone_key, members.plate_id
+    ''').fetchall()
+
+    # Union-find over plate ids joined by shared numbers; only the shared rows take part
+    parent = {}
+
+    def find(node):
+        root = node
+        while parent.setdefault(root, root) != root:
+            root = parent[root]
+        while parent[node] != root:
+            parent[node], node = root, parent[node]
+        return root
+
+    shared = {}
+    plate_names = {}
+    for phone_key, plate_id, plate, phone_number in rows:
+        entry = shared.setdefault(phone_key, {"first": plate_id, "plates": [], "spellings": set()})
+        if plate not in entry["plates"]:
+            entry["plates"].append(plate)
+        entry["spellings"].add(phone_number)
+        plate_names[plate_id] = plate
+        parent[find(plate_id)] = find(entry["first"])
+
+    clusters = {}
+    for phone_key, entry in shared.items():
+        clusters.setdefault(find(entry["first"]), {"plates": set(), "phones": set()})["phones"].add(phone_key)
+    for plate_id, plate in plate_names.items():
+        clusters[find(plate_id)]["plates"].add(plate)
+
+    shared_list = sorted(({"phone_key": phone_key, "plates": entry["plates"], "exact": len(entry["spellings"]) == 1}
+                          for phone_key, entry in shared.items()),
+                         key=lambda entry: (-len(entry["plates"]), entry["phone_key"]))
+    cluster_list = sorted(({"plates": sorted(cluster["plates"]), "phones": sorted(cluster["phones"])}
+                           for cluster in clusters.values()),
+                          key=lambda cluster: (-len(cluster["plates"]), cluster["plates"]))
+    return shared_list[:limit], cluster_list[:limit], len(shared_list), len(cluster_list)
+
+def find_duplicates(limit: int = 1000) -> dict:
+    """Report duplicates without changing anything.
+
+    "within_plate" lists the merge preview: per plate and number, the contact to keep and
+    the differently formatted copies that merge() would fold into it. "shared_phones" and
+    "clusters" (plates connected by shared numbers) are informational and capped at limit.
+    """
+    start = time.perf_counter()
+    conn = database.get_read_connection()
+    try:
+        reformat = _load_formatted(conn)
+        within_plate = _find_within_plate(conn)
+        shared, clusters, shared_total, clusters_total = _find_shared_phones(conn, limit)
+        # Only the temp table changed, so this commit never touches the database file
+        conn.execute("DELETE FROM temp.formatted_phones")
+        conn.commit()
+    finally:
+        conn.close()
+    report = {
+        "within_plate": within_plate,
+        "shared_phones": shared,
+        "shared_phones_total": shared_total,
+        "clusters": clusters,
+        "clusters_total": clusters_total,
+        "to_reformat": reformat,
+        "seconds": time.perf_counter() - start,
+    }
+    logger.info("Duplicate scan: %d merge groups, %d shared numbers, %d clusters in %.2fs",
+                len(within_plate), shared_total, clusters_total, report["seconds"])
+    return report
+
+def _merged_note(keep_note, notes) -> str:
+    parts = []
+    for note in [keep_note] + notes:
+        if note and note not in parts:
+            parts.append(note)
+    return "; ".join(parts)
+
+def merge(preview: dict) -> dict:
+    """Apply a find_duplicates() preview in one transaction and normalize the remaining phones.
+
+    Each group's copies are deleted and their notes appended to the kept contact, which is
+    stored in digits-only form. If any contact in the preview changed since it was taken,
+    nothing is written and sqlite3.IntegrityError is raised; run find_duplicates() again.
+    """
+    groups = preview["within_plate"]
+    conn = database.get_connection()
+    cursor = conn.cursor()
+    removed, added = [], []
+    try:
+        cursor.execute("BEGIN IMMEDIATE")
+        expected = [(contact_id, phone_number) for group in groups for contact_id, phone_number, _ in [group["keep"]] + group["merge"]]
+        cursor.execute("CREATE TEMP TABLE IF NOT EXISTS merge_expected (id INTEGER PRIMARY KEY, phone_number TEXT)")
+        cursor.execute("DELETE FROM temp.merge_expected")
+        cursor.executemany("INSERT INTO temp.merge_expected VALUES (?, ?)", expected)
+        current = cursor.execute('''
+            SELECT COUNT(*) FROM temp.merge_expected
+            JOIN contacts ON contacts.id = merge_expected.id AND contacts.phone_number = merge_expected.phone_number
+        ''').fetchone()[0]
+        if current != len(expected):
+            raise sqlite3.IntegrityError("Contacts changed since the preview was taken")
+
+        delete_ids = [(contact_id,) for group in groups for contact_id, _, _ in group["merge"]]
+        database._execute_write_many(cursor, "DELETE FROM contacts WHERE id = ?", delete_ids)
+        database._execute_write_many(cursor, "UPDATE contacts SET phone_number = ?, note = ? WHERE id = ?", [
+            (group["phone_key"], _merged_note(group["keep"][2], [note for _, _, note in group["merge"]]), group["keep"][0])
+            for group in groups
+        ])
+        for group in groups:
+            part1, part2 = group["plate"].split("-", 1)
+            removed.extend((part1, part2, phone_number) for _, phone_number, _ in [group["keep"]] + group["merge"])
+            added.append((part1, part2, group["phone_key"]))
+
+        # With the copies gone, the digits-only form of every other phone is free to use
+        if database._write_listeners:
+            cursor.execute(f'''
+                SELECT plates.part1, plates.part2, contacts.phone_number, {PHONE_KEY}
+                FROM contacts JOIN plates ON plates.id = contacts.plate_id
+                WHERE contacts.phone_number GLOB '*[^0-9]*' AND contacts.phone_number != {PHONE_KEY}
+            ''')
+            for part1, part2, phone_number, phone_key in cursor.fetchall():
+                removed.append((part1, part2, phone_number))
+                added.append((part1, part2, phone_key))
+        database._execute_write(cursor, f'''
+            UPDATE contacts SET phone_number = {PHONE_KEY}
+            WHERE phone_number GLOB '*[^0-9]*' AND phone_number != {PHONE_KEY}
+        ''', ())
+        reformatted = cursor.rowcount
+        cursor.execute("DELETE FROM temp.merge_expected")
+        database._commit(conn)
+    except BaseException:
+        conn.rollback()
+        if database._mirror is not None:
+            database._mirror.invalidate()  # statements already replayed there were rolled back on disk
+        raise
+    finally:
+        conn.close()
+    result = {"merged_groups": len(groups), "deleted": len(delete_ids), "reformatted": max(reformatted, 0)}
+    logger.info("Merged duplicates: %s", result)
+    database._notify(removed, added)
+    return result
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Find and merge duplicate phone numbers.")
+    parser.add_argument("--db", default=database.DATABASE_FILE)
+    parser.add_argument("--limit", type=int, default=20, help="shared numbers and clusters to print")
+    parser.add_argument("--merge", action="store_true", help="apply the merge preview")
+    args = parser.parse_args(argv)
+    database.DATABASE_FILE = args.db
+
+    report = find_duplicates(limit=args.limit)
+    print(f"Scanned in {report['seconds']:.2f}s")
+    print(f"Same number in different formats on one plate: {len(report['within_plate'])} groups")
+    for group in report["within_plate"][:args.limit]:
+        print(f"  {group['plate']}: keep {group['keep'][1]!r} as {group['phone_key']}, merge {[phone for _, phone, _ in group['merge']]}")
+    print(f"Numbers used on several plates: {report['shared_phones_total']}")
+    for entry in report["shared_phones"]:
+        print(f"  {entry['phone_key']}{'' if entry['exact'] else ' (different formats)'}: {', '.join(entry['plates'])}")
+    print(f"Plate clusters joined by shared numbers: {report['clusters_total']}")
+    for cluster in report["clusters"]:
+        print(f"  {json.dumps(cluster, ensure_ascii=False)}")
+    print(f"Phones to store in digits-only form: {report['to_reformat']}")
+    if args.merge:
+        print(merge(report))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
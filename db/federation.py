@@ -0,0 +1,93 @@
+"""Search every branch database registered in config.json at once.
+
+filter_plate_info() here takes the same arguments as db.database.filter_plate_info()
+but runs the query on each branch file in parallel and returns (source, plate, phone,
+note) rows merged into one sorted list. open_federated_connection() instead ATTACHes
+the branches to one connection and exposes them as a single all_plate_info view for
+ad-hoc SQL.
+"""
+import pathlib
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from db import database
+from db.config import branch_databases
+from app.logger import logger
+
+def _read_only_uri(path: str) -> str:
+    # as_uri() only takes absolute paths; --db and config.json paths may be relative
+    return pathlib.Path(path).resolve().as_uri() + "?mode=ro"
+
+def _connect_read_only(path: str) -> sqlite3.Connection:
+    return sqlite3.connect(_read_only_uri(path), uri=True, check_same_thread=False)
+
+def _quote(text: str) -> str:
+    return "'" + text.replace("'", "''") + "'"
+
+def _sort_key(order_by: str):
+    """Python equivalent of SORT_COLUMNS for rows from different files, where plate ids mean nothing."""
+    def text(value):
+        return (value is not None, value or "")  # SQLite sorts NULL first
+    if order_by == "plate":
+        return lambda row: (row[1], row[2], row[0])
+    if order_by == "phone":
+        return lambda row: (row[2], row[1], row[0])
+    return lambda row: (text(row[3]), row[1], row[2], row[0])
+
+def _query_branch(source: str, path: str, sql: str, params: tuple) -> list:
+    conn = _connect_read_only(path)
+    try:
+        rows = conn.execute(sql, params).fetchall()
+    finally:
+        conn.close()
+    return [(source, f"{row[0]}-{row[1]}", row[2], row[3]) for row in rows]
+
+def filter_plate_info(part1_filter: str, part2_filter: str, phone_filter: str, search_mode: str,
+                      order_by: str = "plate", descending: bool = False, limit: int = None, offset: int = 0,
+                      branches: dict = None, max_workers: int = None, errors: dict = None, note_filter: str = "") -> list:
+    """Run filter_plate_info() on every branch in parallel and merge the rows, tagged with their source.
+
+    branches defaults to branch_databases(). A branch that cannot be read is skipped and
+    logged; pass a dict as errors to receive {source: exception} for those.
+    """
+    branches = branch_databases() if branches is None else branches
+    # bm25() scores and hit counts of different files cannot be compared, so those results merge in plate order
+    order_by = "plate" if order_by in ("relevance", "frequency") else order_by
+    where, params = database._filter_where(part1_filter, part2_filter, phone_filter, search_mode, note_filter)
+    # Every branch must return enough rows to fill the requested page after merging
+    order_clause, page_params = database._order_clause(order_by, descending, None if limit is None else limit + offset, 0)
+    sql = f"{database.PLATE_INFO_SELECT} {where} {order_clause}"
+    rows = []
+    with ThreadPoolExecutor(max_workers=max_workers or max(1, len(branches)), thread_name_prefix="branch_query") as executor:
+        futures = {source: executor.submit(_query_branch, source, path, sql, params + page_params)
+                   for source, path in branches.items()}
+        for source, future in futures.items():
+            try:
+                rows.extend(future.result())
+            except sqlite3.Error as e:
+                logger.warning("Skipping branch %s (%s): %s", source, branches[source], e)
+                if errors is not None:
+                    errors[source] = e
+    rows.sort(key=_sort_key(order_by), reverse=descending)
+    return rows[offset:] if limit is None else rows[offset:offset + limit]
+
+def open_federated_connection(branches: dict = None) -> sqlite3.Connection:
+    """Open an in-memory connection with every branch ATTACHed read-only and a temp view over all of them.
+
+    The all_plate_info view has the columns source, part1, part2, phone_number and note.
+    SQLite attaches at most 10 databases per connection by default.
+    """
+    branches = branch_databases() if branches is None else branches
+    if not branches:
+        raise ValueError("No branch databases are registered in config.json")
+    conn = sqlite3.connect(":memory:", uri=True)  # uri=True lets ATTACH open the branches read-only
+    selects = []
+    for index, (source, path) in enumerate(branches.items()):
+        schema = f"branch{index}"
+        conn.execute("ATTACH DATABASE ? AS " + schema, (_read_only_uri(path),))
+        selects.append(f'''
+            SELECT {_quote(source)} AS source, plates.part1, plates.part2, contacts.phone_number, contacts.note
+            FROM {schema}.contacts AS contacts JOIN {schema}.plates AS plates ON plates.id = contacts.plate_id
+        ''')
+    conn.execute("CREATE TEMP VIEW all_plate_info AS " + " UNION ALL ".join(selects))
+    return conn
+
@@ -0,0 +1,173 @@
+"""Lookup and selection counts per plate, and an in-memory cache of the most looked-up plates.
+
+A few regular customers make up most lookups. HitTracker counts each exact lookup
+(get_plate(), lookup_plates()) and each row the user picks in the table in memory, and adds
+the counts to the plate_hits table in one batch every flush_interval seconds instead of
+writing once per hit. After each flush the hot_size plates with the most hits are loaded
+into memory, and lookups of those plates are answered from there without a query.
+
+filter_plate_info(order_by="frequency") ranks results by the same counts.
+"""
+import threading
+import time
+from app.logger import logger
+from db import database
+
+# Adds one plate's batched counts; hits on plates that do not exist (e.g. misread camera plates) match no row
+_ADD_HITS = '''
+    INSERT INTO plate_hits (plate_id, lookups, selections, last_hit)
+    SELECT id, ?, ?, ? FROM plates WHERE part1 = ? AND part2 = ?
+    ON CONFLICT (plate_id) DO UPDATE SET
+        lookups = lookups + excluded.lookups,
+        selections = selections + excluded.selections,
+        last_hit = max(last_hit, excluded.last_hit)
+'''
+# A looked-up or selected plate counts as seen, which keeps db/archive.py from archiving it
+_TOUCH = f"UPDATE contacts SET last_seen_at = ? WHERE plate_id = {database.PLATE_ID}"
+
+class HitTracker:
+    """Write-coalescing hit counters plus the hot-set cache built from them."""
+
+    def __init__(self, flush_interval: float = 30.0, hot_size: int = 1000):
+        self.flush_interval = flush_interval
+        self.hot_size = hot_size
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._lock = threading.Lock()
+        self._pending = {}  # (part1, part2) -> [lookups, selections]
+        self._hot = {}  # (part1, part2) -> [(phone_number, note), ...] sorted by phone number
+        self._writes = 0  # bumped by every contacts write, so a refresh can tell its read went stale
+        self._stop = threading.Event()
+        self._thread = None
+        database.add_write_listener(self._on_write)
+
+    def record(self, part1: str, part2: str, selection: bool = False) -> None:
+        with self._lock:
+            counts = self._pending.setdefault((part1, part2), [0, 0])
+            counts[1 if selection else 0] += 1
+
+    def hot_contacts(self, part1: str, part2: str) -> list:
+        """The cached contacts of a hot plate, or None if the plate is not in the hot set."""
+        contacts = self._hot.get((part1, part2))
+        if contacts is None:
+            self.cache_misses += 1
+        else:
+            self.cache_hits += 1
+        return contacts
+
+    def flush(self) -> int:
+        """Add the pending counts to plate_hits in one transaction and reload the hot set. Returns plates written."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if pending:
+            now = database.now()
+            rows = [(lookups, selections, now, part1, part2) for (part1, part2), (lookups, selections) in pending.items()]
+            conn = database.get_connection()
+            try:
+                cursor = conn.cursor()
+                database._execute_write_many(cursor, _ADD_HITS, rows)
+                database._execute_write_many(cursor, _TOUCH, [(now, part1, part2) for part1, part2 in pending])
+                database._commit(conn)
+            except Exception:
+                database._rollback(conn)
+                with self._lock:  # keep the counts for the next flush
+                    for key, (lookups, selections) in pending.items():
+                        counts = self._pending.setdefault(key, [0, 0])
+                        counts[0] += lookups
+                        counts[1] += selections
+                raise
+            finally:
+                conn.close()
+        self.refresh()
+        return len(pending)
+
+    def refresh(self) -> None:
+        """Load the contacts of the hot_size most looked-up plates into memory."""
+        writes = self._writes
+        conn = database.get_read_connection()
+        try:
+            rows = conn.execute('''
+                SELECT plates.part1, plates.part2, contacts.phone_number, contacts.note
+                FROM (SELECT plate_id FROM plate_hits ORDER BY lookups + selections DESC LIMIT ?) AS hot
+                JOIN plates ON plates.id = hot.plate_id
+                JOIN contacts ON contacts.plate_id = hot.plate_id
+                ORDER BY contacts.plate_id, contacts.phone_number
+            ''', (self.hot_size,)).fetchall()
+        finally:
+            conn.close()
+        hot = {}
+        for part1, part2, phone_number, note in rows:
+            hot.setdefault((part1, part2), []).append((phone_number, note))
+        if writes != self._writes:
+            return  # a write landed while reading; the next flush loads a current copy
+        self._hot = hot
+
+    def _on_write(self, removed: list, added: list) -> None:
+        self._writes += 1
+        changed = {(part1, part2) for part1, part2, _ in removed + added}
+        hot = self._hot
+        if not changed.isdisjoint(hot):
+            # Dropped until the next refresh; readers keep using the dict they already have
+            self._hot = {key: value for key, value in hot.items() if key not in changed}
+
+    def start(self) -> None:
+        """Load the hot set and flush every flush_interval seconds on a background thread."""
+        self.refresh()
+        self._thread = threading.Thread(target=self._run, name="hit_tracker", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Writing plate hit counts failed")
+
+    def close(self) -> None:
+        """Stop the background thread and write the remaining counts."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        database.remove_write_listener(self._on_write)
+        self.flush()
+        logger.info("Hot plate cache: %d hits, %d misses", self.cache_hits, self.cache_misses)
+
+def benchmark(lookups: int = 20000, hot_share: float = 0.8) -> dict:
+    """Time get_plate() with and without the hot set on a copy of DATABASE_FILE, hot_share of lookups going to 200 regulars."""
+    import os
+    import random
+    import tempfile
+    original, mirror = database.DATABASE_FILE, database._mirror
+    database._mirror = None
+    copy = os.path.join(tempfile.mkdtemp(), "hits_benchmark.db")
+    database.backup_database(copy)  # the counts written below must not end up in the real database
+    database.DATABASE_FILE = copy
+    conn = database.get_connection()
+    plates = conn.execute("SELECT part1, part2 FROM plates ORDER BY random() LIMIT 20000").fetchall()
+    conn.close()
+    generator = random.Random(1)
+    regulars = plates[:200]
+    keys = [generator.choice(regulars) if generator.random() < hot_share else generator.choice(plates) for _ in range(lookups)]
+    tracker = HitTracker(hot_size=200)
+    database._hits = tracker
+    try:
+        start = time.perf_counter()
+        for part1, part2 in keys:
+            database.get_plate(part1, part2)
+        cold_ms = (time.perf_counter() - start) / lookups * 1000
+        tracker.flush()
+        tracker.cache_hits = tracker.cache_misses = 0
+        start = time.perf_counter()
+        for part1, part2 in keys:
+            database.get_plate(part1, part2)
+        warm_ms = (time.perf_counter() - start) / lookups * 1000
+    finally:
+        database._hits = None
+        tracker.close()
+        database.DATABASE_FILE, database._mirror = original, mirror
+        os.remove(copy)
+    return {"lookups": lookups, "ms_per_lookup_before": cold_ms, "ms_per_lookup_hot_set": warm_ms,
+            "cache_hit_rate": tracker.cache_hits / lookups}
+
+if __name__ == "__main__":
+    print(benchmark())
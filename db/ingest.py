@@ -0,0 +1,299 @@
+"""Match plate-recognition events from a camera's JSONL log against the database as they arrive.
+
+Each input line is a JSON object with either "plate" ("ABC-1234" or "ABC 1234") or
+"part1"/"part2", and optionally "ts" (epoch seconds when the camera saw the car).
+Each output line repeats the event with "matched", "contacts" and "latency_ms".
+
+    python -m db.ingest --source events.jsonl --simulate 5000 --rate 500
+"""
+import argparse
+import json
+import os
+import queue
+import random
+import string
+import sys
+import threading
+import time
+from collections import deque
+from db import database
+from app.logger import logger
+
+def normalize_plate(event: dict):
+    """Return (part1, part2) upper-cased like add_plate_info() stores them, or None if there is no plate."""
+    if not isinstance(event, dict):
+        return None  # valid JSON that is not an object, e.g. 123 or "ABC"
+    if event.get("part1") is not None and event.get("part2") is not None:
+        return str(event["part1"]).strip().upper(), str(event["part2"]).strip().upper()
+    plate = str(event.get("plate") or "").strip().upper()
+    for separator in ("-", " "):
+        if separator in plate:
+            part1, part2 = plate.split(separator, 1)
+            return part1.strip(), part2.strip()
+    return None
+
+def tail_jsonl(path: str, stop: threading.Event, poll_interval: float = 0.01, from_start: bool = False,
+               ready: threading.Event = None):
+    """Yield (event, read_time) for every line appended to path, like `tail -F`, until stop is set.
+
+    Lines already in the file are skipped unless from_start is set. Waits for the file to
+    appear, keeps a partially written last line until it is completed, and reads a
+    truncated or replaced file from its beginning. ready, if given, is set once the existing
+    lines are skipped or the file is found missing: every line written after that is read.
+    """
+    handle, inode, partial = None, None, ""
+    skip_existing = not from_start
+    while not stop.is_set():
+        if handle is None:
+            try:
+                handle = open(path, encoding="utf-8")
+                inode = os.fstat(handle.fileno()).st_ino
+            except FileNotFoundError:
+                skip_existing = False
+                if ready is not None:
+                    ready.set()
+                stop.wait(poll_interval)
+                continue
+            if skip_existing:
+                handle.seek(0, os.SEEK_END)
+                skip_existing = False
+            if ready is not None:
+                ready.set()
+        line = handle.readline()
+        if line:
+            partial += line
+            if not partial.endswith("\n"):
+                continue
+            text, partial = partial.strip(), ""
+            if not text:
+                continue
+            try:
+                yield json.loads(text), time.time()
+            except json.JSONDecodeError:
+                logger.warning("Skipping malformed event line: %.200s", text)
+            continue
+        try:
+            current = os.stat(path)
+            replaced = current.st_ino != inode or current.st_size < handle.tell()
+        except FileNotFoundError:
+            replaced = False
+        if replaced:
+            handle.close()
+            handle, partial = None, ""
+            continue
+        stop.wait(poll_interval)
+    if handle is not None:
+        handle.close()
+
+class IngestMetrics:
+    """Counters plus a bounded window of recent end-to-end latencies."""
+
+    def __init__(self, window: int = 10000):
+        self.started = time.monotonic()
+        self.events = 0
+        self.matched = 0
+        self.missed = 0
+        self.invalid = 0
+        self.failed = 0  # events in batches whose lookup raised
+        self.batches = 0
+        self.max_queue_depth = 0
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, matched: bool, latency: float) -> None:
+        with self._lock:
+            self.events += 1
+            if matched:
+                self.matched += 1
+            else:
+                self.missed += 1
+            self._latencies.append(latency)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            latencies = sorted(self._latencies)
+            elapsed = time.monotonic() - self.started
+
+            def percentile(p):
+                return latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000 if latencies else 0.0
+            return {
+                "events": self.events,
+                "matched": self.matched,
+                "missed": self.missed,
+                "invalid": self.invalid,
+                "failed": self.failed,
+                "batches": self.batches,
+                "events_per_second": self.events / elapsed if elapsed else 0.0,
+                "latency_ms_p50": percentile(0.50),
+                "latency_ms_p95": percentile(0.95),
+                "latency_ms_max": latencies[-1] * 1000 if latencies else 0.0,
+                "max_queue_depth": self.max_queue_depth,
+            }
+
+class IngestPipeline:
+    """Tail source_path on one thread and resolve its plates in micro-batches on another.
+
+    The two threads share a queue of at most queue_size events; when lookups fall behind
+    the reader blocks, so memory stays bounded and the unread events wait in the file.
+    A batch is sent once batch_size events are waiting or the oldest has waited max_delay seconds.
+    """
+
+    def __init__(self, source_path: str, output=None, batch_size: int = 256, max_delay: float = 0.02,
+                 queue_size: int = 4096, poll_interval: float = 0.01, from_start: bool = False):
+        self.source_path = source_path
+        self.from_start = from_start
+        self.output = output if output is not None else sys.stdout
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.poll_interval = poll_interval
+        self.metrics = IngestMetrics()
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._stop = threading.Event()
+        self._ready = threading.Event()
+        self._reader = threading.Thread(target=self._read_loop, name="ingest_reader", daemon=True)
+        self._matcher = threading.Thread(target=self._match_loop, name="ingest_matcher", daemon=True)
+
+    def start(self) -> None:
+        self._matcher.start()  # first, so the reader never sees it not yet running
+        self._reader.start()
+
+    def wait_ready(self) -> bool:
+        """Wait until every line written to the source from now on will be read; False if the reader ended first."""
+        while not self._ready.wait(self.poll_interval):
+            if not self._reader.is_alive():
+                return False
+        return True
+
+    def stop(self) -> None:
+        """Stop tailing and wait until every event already read has been written out."""
+        self._stop.set()
+        self._reader.join()
+        self._matcher.join()
+        self.output.flush()
+
+    def _read_loop(self) -> None:
+        for event, read_time in tail_jsonl(self.source_path, self._stop, self.poll_interval, self.from_start, self._ready):
+            # Also after stop() the event already read is queued: the matcher keeps draining until the reader ends
+            while True:
+                try:
+                    self._queue.put((event, read_time), timeout=self.poll_interval)
+                    break
+                except queue.Full:
+                    if not self._matcher.is_alive():
+                        logger.error("Matcher thread is gone; dropping camera event %.200s", event)
+                        return
+                    # backpressure: stop reading the file until the matcher catches up
+            self.metrics.max_queue_depth = max(self.metrics.max_queue_depth, self._queue.qsize())
+
+    def _next_batch(self) -> list:
+        try:
+            batch = [self._queue.get(timeout=self.poll_interval)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _match_loop(self) -> None:
+        while not (self._stop.is_set() and self._queue.empty() and not self._reader.is_alive()):
+            batch = self._next_batch()
+            if not batch:
+                continue
+            try:
+                self._match(batch)
+            except Exception:
+                # Drop this batch rather than the matcher thread, which would leave the reader blocked
+                logger.exception("Matching a batch of %d camera events failed", len(batch))
+                self.metrics.failed += len(batch)
+
+    def _match(self, batch: list) -> None:
+        plates = [normalize_plate(event) for event, _ in batch]
+        result = database.lookup_plates([plate for plate in plates if plate])
+        archived = set(result["archived"])
+        lines = []
+        now = time.time()
+        for (event, read_time), plate in zip(batch, plates):
+            if plate is None:
+                self.metrics.invalid += 1
+                continue
+            key = f"{plate[0]}-{plate[1]}"
+            contacts = result["found"].get(key, [])
+            seen = event.get("ts", read_time)
+            latency = max(0.0, now - seen) if isinstance(seen, (int, float)) else now - read_time
+            self.metrics.record(bool(contacts), latency)
+            lines.append(json.dumps({**event, "plate": key, "matched": bool(contacts),
+                                     "archived": key in archived, "contacts": contacts, "latency_ms": round(latency * 1000, 3)},
+                                    ensure_ascii=False))
+        self.metrics.batches += 1
+        if lines:
+            self.output.write("\n".join(lines) + "\n")
+            self.output.flush()
+
+def simulate_camera(path: str, count: int, rate: float, known_plates: list = None, hit_ratio: float = 0.5) -> None:
+    """Append count events to path at about rate events per second, as a stand-in for a camera system."""
+    known_plates = known_plates or []
+    interval = 1.0 / rate if rate else 0.0
+    start = time.monotonic()
+    with open(path, "a", encoding="utf-8") as f:
+        for i in range(count):
+            if known_plates and random.random() < hit_ratio:
+                part1, part2 = random.choice(known_plates)
+            else:
+                part1 = "".join(random.choices(string.ascii_uppercase, k=3))
+                part2 = "".join(random.choices(string.digits, k=4))
+            f.write(json.dumps({"camera": "sim", "plate": f"{part1.lower()}-{part2}", "ts": time.time()}) + "\n")
+            f.flush()
+            delay = start + (i + 1) * interval - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Match camera plate events against the database in real time.")
+    parser.add_argument("--db", default=database.DATABASE_FILE)
+    parser.add_argument("--source", required=True, help="JSONL event file to follow")
+    parser.add_argument("--output", help="write results here instead of stdout")
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--max-delay", type=float, default=0.02, help="seconds to wait for a batch to fill")
+    parser.add_argument("--queue-size", type=int, default=4096)
+    parser.add_argument("--from-start", action="store_true", help="also match events already in the file")
+    parser.add_argument("--simulate", type=int, default=0, help="write this many fake events to --source, then stop")
+    parser.add_argument("--rate", type=float, default=500, help="events per second for --simulate")
+    args = parser.parse_args(argv)
+    database.DATABASE_FILE = args.db
+
+    output = open(args.output, "a", encoding="utf-8") if args.output else sys.stdout
+    pipeline = IngestPipeline(args.source, output, args.batch_size, args.max_delay, args.queue_size,
+                              from_start=args.from_start)
+    pipeline.start()
+    try:
+        if args.simulate:
+            known = database.get_all_plate_info(limit=1000)
+            # Lines written before the reader has skipped to the end of the file would never be read
+            if not pipeline.wait_ready():
+                logger.error("Reading %s stopped before the simulation could start", args.source)
+                return 1
+            simulate_camera(args.source, args.simulate, args.rate, [tuple(plate.split("-", 1)) for plate, _, _ in known])
+            while pipeline.metrics.events + pipeline.metrics.invalid + pipeline.metrics.failed < args.simulate:
+                time.sleep(0.05)
+        else:
+            while True:
+                time.sleep(10)
+                logger.info("Ingest metrics: %s", pipeline.metrics.snapshot())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        pipeline.stop()
+        if output is not sys.stdout:
+            output.close()
+    print(json.dumps(pipeline.metrics.snapshot()), file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,19 +1,185 @@
+import os
 import sqlite3
+from app.logger import logger
+from db.config import database_path
+from db.note_search import NOTE_BIGRAM_FILL, NOTE_BIGRAM_TABLES, NOTE_BIGRAM_TRIGGERS, NOTE_FTS_TABLE, NOTE_FTS_TRIGGERS
+from db.storage import apply_file_settings, configured_profile, get_profile
 
-def initialize_database():
-    conn = sqlite3.connect('database.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS plate_info (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            part1 TEXT NOT NULL,
-            part2 TEXT NOT NULL,
-            phone_number TEXT NOT NULL,
-            note TEXT,
-            UNIQUE(part1, part2, phone_number)
-        )
+# Each plate is stored once in `plates`; its phone numbers and notes live in `contacts`.
+# `plate_info` is kept as a view with INSTEAD OF triggers so older scripts and SQL dumps
+# that read or write the flat table keep working.
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS plates (
+        id INTEGER PRIMARY KEY,
+        part1 TEXT NOT NULL,
+        part2 TEXT NOT NULL,
+        UNIQUE(part1, part2)
+    );
+    CREATE TABLE IF NOT EXISTS contacts (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        plate_id INTEGER NOT NULL REFERENCES plates(id),
+        phone_number TEXT NOT NULL,
+        note TEXT,
+        created_at TEXT,
+        last_seen_at TEXT,  -- last add, edit or lookup; db/archive.py moves plates idle for too long
+        UNIQUE(plate_id, phone_number)
+    );
+    -- Sorting by plate walks UNIQUE(part1, part2) and UNIQUE(plate_id, phone_number); these serve phone and note
+    CREATE INDEX IF NOT EXISTS idx_contacts_phone ON contacts (phone_number, plate_id);
+    CREATE INDEX IF NOT EXISTS idx_contacts_note ON contacts (note, plate_id, phone_number);
+
+    -- A plate without contacts is removed, so plate existence equals having at least one contact
+    CREATE TRIGGER IF NOT EXISTS contacts_remove_empty_plate AFTER DELETE ON contacts
+    BEGIN
+        DELETE FROM plates WHERE id = OLD.plate_id AND NOT EXISTS (SELECT 1 FROM contacts WHERE plate_id = OLD.plate_id);
+    END;
+    CREATE TRIGGER IF NOT EXISTS contacts_remove_moved_from_plate AFTER UPDATE OF plate_id ON contacts WHEN OLD.plate_id IS NOT NEW.plate_id
+    BEGIN
+        DELETE FROM plates WHERE id = OLD.plate_id AND NOT EXISTS (SELECT 1 FROM contacts WHERE plate_id = OLD.plate_id);
+    END;
+
+    -- How often each plate was looked up or picked from the results, written in batches by db/hits.py
+    CREATE TABLE IF NOT EXISTS plate_hits (
+        plate_id INTEGER PRIMARY KEY,
+        lookups INTEGER NOT NULL DEFAULT 0,
+        selections INTEGER NOT NULL DEFAULT 0,
+        last_hit TEXT
+    );
+    CREATE TRIGGER IF NOT EXISTS plates_remove_hits AFTER DELETE ON plates
+    BEGIN
+        DELETE FROM plate_hits WHERE plate_id = OLD.id;
+    END;
+'''
+
+COMPATIBILITY_VIEW = '''
+    CREATE VIEW IF NOT EXISTS plate_info AS
+        SELECT contacts.id AS id, plates.part1 AS part1, plates.part2 AS part2,
+               contacts.phone_number AS phone_number, contacts.note AS note
+        FROM contacts JOIN plates ON plates.id = contacts.plate_id;
+
+    CREATE TRIGGER IF NOT EXISTS plate_info_insert INSTEAD OF INSERT ON plate_info
+    BEGIN
+        INSERT OR IGNORE INTO plates (part1, part2) VALUES (NEW.part1, NEW.part2);
+        INSERT INTO contacts (plate_id, phone_number, note)
+            SELECT id, NEW.phone_number, NEW.note FROM plates WHERE part1 = NEW.part1 AND part2 = NEW.part2;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS plate_info_update INSTEAD OF UPDATE ON plate_info
+    BEGIN
+        INSERT OR IGNORE INTO plates (part1, part2) VALUES (NEW.part1, NEW.part2);
+        UPDATE contacts
+        SET plate_id = (SELECT id FROM plates WHERE part1 = NEW.part1 AND part2 = NEW.part2),
+            phone_number = NEW.phone_number, note = NEW.note
+        WHERE id = OLD.id;
+        DELETE FROM plates WHERE id = (SELECT id FROM plates WHERE part1 = OLD.part1 AND part2 = OLD.part2)
+            AND NOT EXISTS (SELECT 1 FROM contacts WHERE plate_id = plates.id);
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS plate_info_delete INSTEAD OF DELETE ON plate_info
+    BEGIN
+        DELETE FROM contacts WHERE id = OLD.id;
+    END;
+'''
+
+def _split(script: str):
+    """Yield the complete statements of an SQL script (trigger bodies included) one by one."""
+    statement = ''
+    for line in script.splitlines(keepends=True):
+        statement += line
+        if sqlite3.complete_statement(statement):
+            yield statement.strip()
+            statement = ''
+
+def _has_legacy_table(conn: sqlite3.Connection) -> bool:
+    row = conn.execute("SELECT type FROM sqlite_master WHERE name = 'plate_info'").fetchone()
+    return row is not None and row[0] == 'table'
+
+def migrate_legacy_plate_info(conn: sqlite3.Connection) -> int:
+    """Move rows from the old flat plate_info table into plates/contacts and drop it. Returns rows moved."""
+    conn.execute('''
+        INSERT OR IGNORE INTO plates (part1, part2)
+        SELECT part1, part2 FROM plate_info ORDER BY part1, part2
     ''')
-    conn.commit()
+    moved = conn.execute('''
+        INSERT OR IGNORE INTO contacts (id, plate_id, phone_number, note)
+        SELECT plate_info.id, plates.id, plate_info.phone_number, plate_info.note
+        FROM plate_info JOIN plates ON plates.part1 = plate_info.part1 AND plates.part2 = plate_info.part2
+        ORDER BY plate_info.id
+    ''').rowcount
+    conn.execute('DROP TABLE plate_info')
+    return moved
+
+def _add_contact_timestamps(conn: sqlite3.Connection) -> bool:
+    """Add created_at and last_seen_at to a contacts table from before they existed. Returns True if added.
+
+    The existing rows are left NULL (unknown); db/archive.py starts their idle time at its first run.
+    """
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(contacts)")}
+    if "last_seen_at" in columns:
+        return False
+    conn.execute("ALTER TABLE contacts ADD COLUMN created_at TEXT")
+    conn.execute("ALTER TABLE contacts ADD COLUMN last_seen_at TEXT")
+    return True
+
+def _create_note_index(conn: sqlite3.Connection) -> int:
+    """Create the note search indexes and their triggers; fill those that are new. Returns the notes indexed.
+
+    The earlier bigram index, whose triggers called a Python function only this application
+    registered, is dropped and replaced.
+    """
+    existing = conn.execute("SELECT sql FROM sqlite_master WHERE name = 'contacts_note_fts'").fetchone()
+    if existing is not None and "trigram" not in existing[0]:
+        for trigger in ("contacts_note_fts_insert", "contacts_note_fts_delete", "contacts_note_fts_update"):
+            conn.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        conn.execute("DROP TABLE contacts_note_fts")
+        existing = None
+    new_bigrams = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'contacts_note_bigrams'").fetchone() is None
+    conn.execute(NOTE_FTS_TABLE)
+    for statement in _split(NOTE_FTS_TRIGGERS + NOTE_BIGRAM_TABLES + NOTE_BIGRAM_TRIGGERS):
+        conn.execute(statement)
+    if new_bigrams:
+        for statement in _split(NOTE_BIGRAM_FILL):
+            conn.execute(statement)
+    if existing is None:
+        conn.execute("INSERT INTO contacts_note_fts (contacts_note_fts) VALUES ('rebuild')")
+    elif not new_bigrams:
+        return 0
+    return conn.execute("SELECT COUNT(*) FROM contacts WHERE note != ''").fetchone()[0]
+
+def initialize_database(database_file: str = None, storage_profile: str = None):
+    database_file = database_file or database_path()
+    storage_profile = storage_profile or configured_profile()
+    new_file = not os.path.exists(database_file)
+    conn = sqlite3.connect(database_file, isolation_level=None)
+    try:
+        if new_file:
+            # Existing files keep their settings until db.storage.apply_profile() converts them
+            apply_file_settings(conn, storage_profile)
+        # Only takes effect on a new file (or at the next VACUUM); lets maintenance release free pages
+        conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        conn.execute('BEGIN IMMEDIATE')
+        for statement in _split(SCHEMA):
+            conn.execute(statement)
+        if _add_contact_timestamps(conn):
+            logger.info("Added created_at and last_seen_at to the contacts in %s", database_file)
+        migrated = migrate_legacy_plate_info(conn) if _has_legacy_table(conn) else None
+        for statement in _split(COMPATIBILITY_VIEW):
+            conn.execute(statement)
+        indexed = _create_note_index(conn)
+        conn.execute('COMMIT')
+    except BaseException:
+        if conn.in_transaction:
+            conn.execute('ROLLBACK')
+        conn.close()
+        raise
+    if indexed:
+        logger.info("Indexed the notes of %d contacts in %s for note search", indexed, database_file)
+    if migrated is not None:
+        logger.info("Migrated %d plate_info rows in %s to the plates/contacts schema", migrated, database_file)
+        conn.execute('VACUUM')  # Give the space of the old table back to the file system
+    page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+    if page_size != get_profile(storage_profile)['page_size']:
+        logger.info("%s uses %d-byte pages; run 'python -m db.storage apply %s' to rebuild it", database_file, page_size, storage_profile)
     conn.close()
 
 if __name__ == "__main__":
@@ -0,0 +1,128 @@
+import os
+import pathlib
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from app.logger import logger
+
+def quick_check(database_file: str, max_errors: int = 10) -> list:
+    """Run PRAGMA quick_check and return the problems found; an empty list means the file is healthy.
+
+    Never modifies the file. A file that SQLite cannot open as a database at all is
+    reported as a single problem instead of raising.
+    """
+    try:
+        conn = sqlite3.connect(pathlib.Path(database_file).resolve().as_uri() + "?mode=ro", uri=True)
+        try:
+            rows = conn.execute(f"PRAGMA quick_check({int(max_errors)})").fetchall()
+        finally:
+            conn.close()
+    except sqlite3.DatabaseError as e:
+        return [str(e)]
+    problems = [row[0] for row in rows]
+    return [] if problems == ["ok"] else problems
+
+def set_aside(database_file: str) -> str:
+    """Rename an unreadable database file out of the way, keeping it for recovery. Returns the new path."""
+    kept_path = f"{database_file}.corrupt-{datetime.now().strftime('%Y%m%d%H%M%S')}"
+    os.replace(database_file, kept_path)
+    for suffix in ("-wal", "-shm", "-journal"):
+        if os.path.exists(database_file + suffix):
+            os.replace(database_file + suffix, kept_path + suffix)
+    logger.error("Moved unreadable database %s to %s", database_file, kept_path)
+    return kept_path
+
+def database_stats(conn: sqlite3.Connection, database_file: str) -> dict:
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    return {
+        "file_size": os.path.getsize(database_file),
+        "wal_size": os.path.getsize(database_file + "-wal") if os.path.exists(database_file + "-wal") else 0,
+        "page_size": page_size,
+        "page_count": conn.execute("PRAGMA page_count").fetchone()[0],
+        "free_pages": conn.execute("PRAGMA freelist_count").fetchone()[0],
+    }
+
+def run_maintenance(database_file: str, vacuum_pages: int = 1000, rebuild_free_ratio: float = 0.25) -> dict:
+    """Run PRAGMA optimize, reclaim free pages and checkpoint the WAL, returning sizes and time spent.
+
+    Databases created before auto_vacuum was enabled are rebuilt once with VACUUM when at
+    least rebuild_free_ratio of their pages are free; after that incremental_vacuum releases
+    up to vacuum_pages pages per run without rewriting the file.
+    """
+    start = time.perf_counter()
+    conn = sqlite3.connect(database_file, timeout=5, isolation_level=None)
+    try:
+        before = database_stats(conn, database_file)
+        conn.execute("PRAGMA optimize")
+        auto_vacuum = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+        if auto_vacuum == 2:  # INCREMENTAL
+            # executescript steps the pragma to completion; execute() would free a single page
+            conn.executescript(f"PRAGMA incremental_vacuum({int(vacuum_pages)});")
+        elif before["page_count"] and before["free_pages"] / before["page_count"] >= rebuild_free_ratio:
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.execute("VACUUM")
+        if conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal":
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+        after = database_stats(conn, database_file)
+    finally:
+        conn.close()
+    report = {
+        "file_size_before": before["file_size"] + before["wal_size"],
+        "file_size": after["file_size"] + after["wal_size"],
+        "free_pages_before": before["free_pages"],
+        "free_pages": after["free_pages"],
+        "page_count": after["page_count"],
+        "seconds": time.perf_counter() - start,
+    }
+    logger.info("Maintenance of %s: %d -> %d bytes, %d -> %d free pages in %.3fs", database_file,
+                report["file_size_before"], report["file_size"], report["free_pages_before"], report["free_pages"], report["seconds"])
+    return report
+
+class MaintenanceScheduler:
+    """Run run_maintenance() on a background thread once the application has been idle for a while.
+
+    Call touch() on user activity. Maintenance runs at most once per interval_seconds, and only
+    after idle_seconds without a touch(); on_report, if given, receives each report dict.
+    """
+
+    def __init__(self, database_file: str, idle_seconds: float = 120, interval_seconds: float = 6 * 3600, on_report=None):
+        self.database_file = database_file
+        self.idle_seconds = idle_seconds
+        self.interval_seconds = interval_seconds
+        self.on_report = on_report
+        self.last_report = None
+        self._last_activity = time.monotonic()
+        self._last_run = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name="db_maintenance", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def touch(self) -> None:
+        self._last_activity = time.monotonic()
+
+    def _due(self) -> bool:
+        now = time.monotonic()
+        if now - self._last_activity < self.idle_seconds:
+            return False
+        return self._last_run is None or now - self._last_run >= self.interval_seconds
+
+    def _loop(self) -> None:
+        while not self._stop.wait(min(self.idle_seconds, 30)):
+            if not self._due():
+                continue
+            self._last_run = time.monotonic()
+            try:
+                self.last_report = run_maintenance(self.database_file)
+            except sqlite3.Error as e:
+                logger.warning("Scheduled maintenance of %s skipped: %s", self.database_file, e)
+                continue
+            if self.on_report is not None:
+                self.on_report(self.last_report)
@@ -0,0 +1,112 @@
+import hashlib
+import sqlite3
+import threading
+from app.logger import logger
+from db.pool import PooledConnection
+
+class MemoryMirror:
+    """An in-memory copy of the database file that serves reads while writes go through to disk.
+
+    The copy is taken with the SQLite backup API. db/database.py replays each write on the
+    mirror inside the disk transaction, so the disk write lock keeps both in the same order.
+    Writes made by other processes are not seen; verify() reports such divergence.
+    """
+
+    def __init__(self, database_file: str):
+        self.database_file = database_file
+        self._lock = threading.RLock()
+        self._conn = None
+        self._stale = True
+
+    def load(self) -> None:
+        """(Re)build the mirror from the disk file."""
+        source = sqlite3.connect(self.database_file)
+        mirror = sqlite3.connect(":memory:", check_same_thread=False)
+        try:
+            source.backup(mirror)
+        finally:
+            source.close()
+        with self._lock:
+            old, self._conn = self._conn, mirror
+            self._stale = False
+        if old is not None:
+            old.close()
+        logger.info("Loaded in-memory mirror of %s", self.database_file)
+
+    def acquire(self) -> PooledConnection:
+        """Return the mirror connection for reading; close() on it releases the mirror."""
+        self._lock.acquire()
+        try:
+            if self._stale:
+                self.load()
+        except sqlite3.Error:
+            self._lock.release()
+            raise
+        return PooledConnection(self, self._conn)
+
+    def release(self, conn: sqlite3.Connection) -> None:
+        self._lock.release()
+
+    def apply(self, sql: str, params, many: bool = False) -> None:
+        """Replay a write statement that already ran on the disk connection."""
+        with self._lock:
+            if self._stale:
+                return  # the next read reloads from disk and picks the write up
+            try:
+                if many:
+                    self._conn.executemany(sql, params)
+                else:
+                    self._conn.execute(sql, params)
+                self._conn.commit()
+            except sqlite3.Error as e:
+                logger.error("In-memory mirror write failed, reloading from disk: %s", e)
+                self._stale = True
+
+    def invalidate(self) -> None:
+        """Mark the mirror out of date, e.g. after a disk commit failed."""
+        with self._lock:
+            self._stale = True
+
+    def verify(self) -> bool:
+        """Compare the mirror with the disk file table by table; True when they hold the same rows."""
+        disk = sqlite3.connect(self.database_file)
+        try:
+            with self._lock:
+                if self._stale:
+                    return True
+                mirror_digest = _digest(self._conn)
+            disk_digest = _digest(disk)
+        finally:
+            disk.close()
+        diverged = sorted(name for name in mirror_digest.keys() | disk_digest.keys()
+                          if mirror_digest.get(name) != disk_digest.get(name))
+        if diverged:
+            logger.warning("In-memory mirror diverged from %s in tables: %s", self.database_file, ", ".join(diverged))
+        return not diverged
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+            self._conn = None
+            self._stale = True
+
+def _digest(conn: sqlite3.Connection) -> dict:
+    digests = {}
+    tables = conn.execute("SELECT name, sql FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'").fetchall()
+    # Virtual tables such as the note index, and the shadow tables holding their data, are
+    # rebuilt from the tables they index, so comparing those tables covers them
+    virtual = tuple(name for name, sql in tables if sql.upper().startswith("CREATE VIRTUAL TABLE"))
+    for name, sql in tables:
+        if name.startswith(virtual):
+            continue
+        order = "rowid"
+        if sql.upper().rstrip().endswith("WITHOUT ROWID"):
+            # Such as the note bigrams: no rowid, so in primary key order
+            key = sorted((row[5], row[1]) for row in conn.execute(f'PRAGMA table_info("{name}")') if row[5])
+            order = ", ".join(f'"{column}"' for _, column in key)
+        digest = hashlib.sha1()
+        for row in conn.execute(f'SELECT * FROM "{name}" ORDER BY {order}'):
+            digest.update(repr(row).encode("utf-8"))
+        digests[name] = digest.hexdigest()
+    return digests
@@ -0,0 +1,190 @@
+"""Full-text search over contact notes (備註), including Chinese text without spaces.
+
+Notes are indexed in contacts_note_fts, an FTS5 table over contacts.note using SQLite's
+built-in trigram tokenizer: every three-character substring is indexed, so a search finds
+its text anywhere in a note whether or not the note has spaces, such as 白色豐田 in
+白色豐田靠電梯. The index triggers are plain SQL, so any SQLite client can still write
+contacts (older scripts through the plate_info view, the sqlite3 shell, DB Browser).
+
+A trigram index cannot look up fewer than three characters. Two-character words of CJK
+ideographs (白色, 豐田, 電梯), the most common searches, are looked up in contacts_note_bigrams
+instead: every pair of adjacent ideographs in a note, kept current by plain-SQL triggers that
+walk the note with the note_positions table. Other short words (B2, a single letter) are
+matched with LIKE.
+"""
+import html
+import re
+import sqlite3
+
+NOTE_FTS_TABLE = '''
+    CREATE VIRTUAL TABLE IF NOT EXISTS contacts_note_fts
+    USING fts5(note, content='contacts', content_rowid='id', tokenize='trigram')
+'''
+
+# Named like the triggers of the earlier bigram index, so a station still running an older
+# build finds them present and does not create its own again
+NOTE_FTS_TRIGGERS = '''
+    CREATE TRIGGER IF NOT EXISTS contacts_note_fts_insert AFTER INSERT ON contacts
+    BEGIN
+        INSERT INTO contacts_note_fts (rowid, note) VALUES (NEW.id, NEW.note);
+    END;
+
+    -- The index reads its text from contacts; deleting means passing the indexed text again
+    CREATE TRIGGER IF NOT EXISTS contacts_note_fts_delete AFTER DELETE ON contacts
+    BEGIN
+        INSERT INTO contacts_note_fts (contacts_note_fts, rowid, note) VALUES ('delete', OLD.id, OLD.note);
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS contacts_note_fts_update AFTER UPDATE OF note ON contacts WHEN OLD.note IS NOT NEW.note
+    BEGIN
+        INSERT INTO contacts_note_fts (contacts_note_fts, rowid, note) VALUES ('delete', OLD.id, OLD.note);
+        INSERT INTO contacts_note_fts (rowid, note) VALUES (NEW.id, NEW.note);
+    END;
+'''
+
+# Shortest word the trigram index can look up
+MIN_INDEXED_LENGTH = 3
+
+# CJK Unified Ideographs with Extension A, and the Compatibility Ideographs
+IDEOGRAPH_RANGES = ((0x3400, 0x9FFF), (0xF900, 0xFAFF))
+
+# Characters of a note walked by the bigram triggers: QLineEdit's default maxLength, the
+# longest note the dialogs accept. Pairs further into a longer note are not indexed.
+NOTE_POSITIONS = 32767
+
+def _ideograph_sql(character: str) -> str:
+    return "(" + " OR ".join(f"unicode({character}) BETWEEN {low} AND {high}" for low, high in IDEOGRAPH_RANGES) + ")"
+
+def _pairs_sql(note: str) -> str:
+    """Condition on note_positions.n selecting the positions where note has two ideographs in a row."""
+    return (f"n < length({note}) AND {_ideograph_sql(f'substr({note}, n, 1)')}"
+            f" AND {_ideograph_sql(f'substr({note}, n + 1, 1)')}")
+
+NOTE_BIGRAM_TABLES = '''
+    CREATE TABLE IF NOT EXISTS note_positions (n INTEGER PRIMARY KEY);
+
+    CREATE TABLE IF NOT EXISTS contacts_note_bigrams (
+        bigram TEXT NOT NULL,
+        contact_id INTEGER NOT NULL,
+        PRIMARY KEY (bigram, contact_id)
+    ) WITHOUT ROWID;
+'''
+
+NOTE_BIGRAM_TRIGGERS = f'''
+    CREATE TRIGGER IF NOT EXISTS contacts_note_bigrams_insert AFTER INSERT ON contacts
+    BEGIN
+        INSERT OR IGNORE INTO contacts_note_bigrams (bigram, contact_id)
+        SELECT substr(NEW.note, n, 2), NEW.id FROM note_positions WHERE {_pairs_sql("NEW.note")};
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS contacts_note_bigrams_delete AFTER DELETE ON contacts
+    BEGIN
+        DELETE FROM contacts_note_bigrams WHERE contact_id = OLD.id
+        AND bigram IN (SELECT substr(OLD.note, n, 2) FROM note_positions WHERE {_pairs_sql("OLD.note")});
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS contacts_note_bigrams_update AFTER UPDATE OF note ON contacts WHEN OLD.note IS NOT NEW.note
+    BEGIN
+        DELETE FROM contacts_note_bigrams WHERE contact_id = OLD.id
+        AND bigram IN (SELECT substr(OLD.note, n, 2) FROM note_positions WHERE {_pairs_sql("OLD.note")});
+        INSERT OR IGNORE INTO contacts_note_bigrams (bigram, contact_id)
+        SELECT substr(NEW.note, n, 2), NEW.id FROM note_positions WHERE {_pairs_sql("NEW.note")};
+    END;
+'''
+
+# Fill the new tables, the bigrams from the notes already there
+NOTE_BIGRAM_FILL = f'''
+    WITH RECURSIVE positions(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM positions WHERE n < {NOTE_POSITIONS})
+    INSERT OR IGNORE INTO note_positions (n) SELECT n FROM positions;
+
+    INSERT OR IGNORE INTO contacts_note_bigrams (bigram, contact_id)
+    SELECT substr(note, n, 2), id FROM contacts JOIN note_positions ON {_pairs_sql("note")};
+'''
+
+def is_bigram(word: str) -> bool:
+    """True if word is two ideographs, which contacts_note_bigrams can look up."""
+    return len(word) == 2 and all(any(low <= ord(character) <= high for low, high in IDEOGRAPH_RANGES)
+                                  for character in word)
+
+def search_terms(text: str) -> tuple:
+    """(MATCH expression, bigrams, LIKE patterns) finding notes that contain every word of text.
+
+    Words of three or more characters go into the MATCH expression, which is None if there
+    are none; two-ideograph words are bigrams for contacts_note_bigrams; other short words
+    become LIKE patterns escaped with a backslash.
+    """
+    phrases, bigrams, patterns = [], [], []
+    for word in (text or "").split():
+        if len(word) >= MIN_INDEXED_LENGTH:
+            phrases.append('"' + word.replace('"', '""') + '"')
+        elif is_bigram(word):
+            bigrams.append(word)
+        else:
+            patterns.append("%" + re.sub(r"([\\%_])", r"\\\1", word) + "%")
+    return " ".join(phrases) or None, bigrams, patterns
+
+def highlight(note: str, text: str, width: int = 40) -> str:
+    """HTML of note with the parts matching text in bold, cut to about width characters around the first match."""
+    note = note or ""
+    spans = []
+    for word in (text or "").split():
+        spans.extend(found.span() for found in re.finditer(re.escape(word), note, re.IGNORECASE))
+    spans.sort()
+    start, end = 0, len(note)
+    if spans and len(note) > width:
+        start = max(0, spans[0][0] - width // 4)
+        end = min(len(note), start + width)
+    parts = ["…" if start > 0 else ""]
+    position = start
+    for span_start, span_end in spans:
+        span_start, span_end = max(span_start, position), min(span_end, end)
+        if span_start >= span_end:
+            continue
+        parts.append(html.escape(note[position:span_start]))
+        parts.append(f"<b style='color: #c0392b;'>{html.escape(note[span_start:span_end])}</b>")
+        position = span_end
+    parts.append(html.escape(note[position:end]))
+    parts.append("…" if end < len(note) else "")
+    return "".join(parts)
+
+def benchmark(rows: int = 1_000_000, queries: int = 200) -> dict:
+    """Time note searches against LIKE on an in-memory database of generated notes."""
+    import random
+    import time
+    generator = random.Random(1)
+    # A few thousand two- to four-character words, three per note, like "白色豐田 靠電梯"
+    words = ["".join(chr(generator.randint(0x4e00, 0x62ff)) for _ in range(generator.randint(2, 4))) for _ in range(3000)]
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE contacts (id INTEGER PRIMARY KEY, note TEXT)")
+    conn.execute(NOTE_FTS_TABLE)
+    conn.executescript(NOTE_BIGRAM_TABLES)
+    start = time.perf_counter()
+    conn.executemany("INSERT INTO contacts (note) VALUES (?)",
+                     (("".join(generator.sample(words, 2)) + " " + generator.choice(words),) for _ in range(rows)))
+    conn.execute("INSERT INTO contacts_note_fts (contacts_note_fts) VALUES ('rebuild')")
+    conn.executescript(NOTE_BIGRAM_FILL)
+    build_seconds = time.perf_counter() - start
+
+    long_searches = [word for word in words if len(word) >= MIN_INDEXED_LENGTH][:queries]
+    short_searches = [word for word in words if is_bigram(word)][:queries]
+    start = time.perf_counter()
+    for text in long_searches:
+        conn.execute('''
+            SELECT rowid FROM contacts_note_fts WHERE contacts_note_fts MATCH ? ORDER BY bm25(contacts_note_fts) LIMIT 100
+        ''', (search_terms(text)[0],)).fetchall()
+    fts_ms = (time.perf_counter() - start) / len(long_searches) * 1000
+    start = time.perf_counter()
+    for text in short_searches:
+        conn.execute("SELECT contact_id FROM contacts_note_bigrams WHERE bigram = ? LIMIT 100", (text,)).fetchall()
+    bigram_ms = (time.perf_counter() - start) / len(short_searches) * 1000
+    start = time.perf_counter()
+    for text in long_searches[:5] + short_searches[:5]:
+        # Without an index every note is read, whatever the LIMIT of the page shown
+        conn.execute("SELECT COUNT(*) FROM contacts WHERE note LIKE ?", (f"%{text}%",)).fetchone()
+    like_ms = (time.perf_counter() - start) / 10 * 1000
+    conn.close()
+    return {"rows": rows, "build_seconds": build_seconds, "fts_ms_per_query": fts_ms,
+            "bigram_ms_per_query": bigram_ms, "like_scan_ms_per_query": like_ms}
+
+if __name__ == "__main__":
+    print(benchmark())
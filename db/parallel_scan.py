@@ -0,0 +1,355 @@
+"""Parallel filter_plate_info() over plate_info exported to shared-memory column partitions.
+
+The contacts are split into partitions of consecutive plates. Each partition is one
+multiprocessing.shared_memory block holding its columns as NUL-separated UTF-8 text with
+offset arrays, and worker processes run the LIKE filters as regular expressions directly
+on those buffers, so a query only sends the filter to the workers and gets row numbers
+back. Partitions touched by a write are re-exported from the database before the next query.
+
+    python -m db.parallel_scan --rows 10000000    # scaling benchmark on generated rows
+"""
+import argparse
+import atexit
+import bisect
+import os
+import random
+import re
+import struct
+import threading
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from itertools import accumulate
+from multiprocessing import get_context, shared_memory
+from app.logger import logger
+from db import database
+
+COLUMNS = ("part1", "part2", "phone_number", "note")
+_NULL = b"\x01"  # stored in place of a NULL note
+_NULL_TEXT = _NULL.decode()
+# Row count, position of the plate ids, then (offsets position, text position) per column
+_HEADER = struct.Struct("<qq" + "qq" * len(COLUMNS))
+
+_EXPORT_SELECT = '''
+    SELECT plates.id, plates.part1, plates.part2, contacts.phone_number, contacts.note
+    FROM contacts JOIN plates ON plates.id = contacts.plate_id
+'''
+
+def _like_pattern(text: str) -> bytes:
+    """Regex over UTF-8 bytes matching what LIKE '%text%' matches.
+
+    Like SQLite's LIKE the pattern is compiled with re.IGNORECASE, which on bytes only
+    folds ASCII letters. No wildcard can cross the NUL that ends each value.
+    """
+    parts = []
+    for character in text:
+        if character == "%":
+            parts.append(b"[^\x00]*")
+        elif character == "_":
+            parts.append(b"(?:[\x01-\x7f]|[\xc0-\xff][\x80-\xbf]*)")  # one UTF-8 encoded character
+        else:
+            parts.append(re.escape(character.encode()))
+    return b"".join(parts)
+
+def _filter_specs(part1_filter: str, part2_filter: str, phone_filter: str, search_mode: str) -> list:
+    """The same filters as database._filter_where(), as (column index, pattern) pairs."""
+    if search_mode == "電話查詢":
+        filters = [(2, phone_filter)]
+    else:
+        filters = [(0, part1_filter), (1, part2_filter)]
+    # An empty filter matches every row, as LIKE '%%' does
+    return [(column, _like_pattern(text)) for column, text in filters if text and text.strip("%")]
+
+def _align(position: int) -> int:
+    return (position + 7) & ~7
+
+def _export(rows: list) -> shared_memory.SharedMemory:
+    """Write (plate id, part1, part2, phone, note) rows to a new shared memory block."""
+    ids = array("q", (row[0] for row in rows))
+    columns = []
+    for column in range(1, len(COLUMNS) + 1):
+        values = [_NULL if row[column] is None else row[column].encode() for row in rows]
+        text = b"\x00".join(values) + b"\x00" if values else b""
+        if len(text) >= 2 ** 32:
+            raise ValueError("Partition too large; use a smaller partition_rows")
+        offsets = array("I", [0])
+        offsets.extend(accumulate(len(value) + 1 for value in values))
+        columns.append((offsets, text))
+
+    header = [len(rows)]
+    position = _align(_HEADER.size)
+    header.append(position)
+    position = _align(position + len(ids) * ids.itemsize)
+    for offsets, text in columns:
+        header.append(position)
+        position = _align(position + len(offsets) * offsets.itemsize)
+        header.append(position)
+        position = _align(position + len(text))
+
+    shm = shared_memory.SharedMemory(create=True, size=position)
+    _HEADER.pack_into(shm.buf, 0, *header)
+    shm.buf[header[1]:header[1] + len(ids) * ids.itemsize] = ids.tobytes()
+    for column, (offsets, text) in enumerate(columns):
+        offsets_position, text_position = header[2 + 2 * column], header[3 + 2 * column]
+        shm.buf[offsets_position:offsets_position + len(offsets) * offsets.itemsize] = offsets.tobytes()
+        shm.buf[text_position:text_position + len(text)] = text
+    return shm
+
+class _PartitionView:
+    """Zero-copy access to one exported partition; release() before closing the block."""
+
+    def __init__(self, shm: shared_memory.SharedMemory):
+        header = _HEADER.unpack_from(shm.buf, 0)
+        self.row_count = rows = header[0]
+        self.ids = shm.buf[header[1]:header[1] + rows * 8].cast("q")
+        self.columns = []
+        for column in range(len(COLUMNS)):
+            offsets_position, text_position = header[2 + 2 * column], header[3 + 2 * column]
+            offsets = shm.buf[offsets_position:offsets_position + (rows + 1) * 4].cast("I")
+            self.columns.append((offsets, shm.buf[text_position:text_position + offsets[rows]]))
+
+    def rows(self, matched) -> list:
+        """(plate id, part1, part2, phone, note) of the given row numbers, decoded straight from the block."""
+        ids = self.ids
+        (part1_offsets, part1s), (part2_offsets, part2s), (phone_offsets, phones), (note_offsets, notes) = self.columns
+        result = []
+        for row in matched:
+            note = str(notes[note_offsets[row]:note_offsets[row + 1] - 1], "utf-8")
+            result.append((ids[row],
+                           str(part1s[part1_offsets[row]:part1_offsets[row + 1] - 1], "utf-8"),
+                           str(part2s[part2_offsets[row]:part2_offsets[row + 1] - 1], "utf-8"),
+                           str(phones[phone_offsets[row]:phone_offsets[row + 1] - 1], "utf-8"),
+                           None if note == _NULL_TEXT else note))
+        return result
+
+    def match(self, specs: list, stop_after: int = None) -> array:
+        """Row numbers, in order, whose columns contain every pattern in specs."""
+        if not specs:
+            return array("q", range(self.row_count if stop_after is None else min(self.row_count, stop_after)))
+        patterns = [(self.columns[column], re.compile(pattern, re.IGNORECASE)) for column, pattern in specs]
+        (offsets, text), pattern = patterns[0]
+        others = patterns[1:]
+        matched = array("q")
+        position = 0
+        while stop_after is None or len(matched) < stop_after:
+            found = pattern.search(text, position)
+            if found is None:
+                break
+            row = bisect.bisect_right(offsets, found.start()) - 1
+            position = offsets[row + 1]  # at most one hit per row
+            if all(other.search(other_text, other_offsets[row], other_offsets[row + 1] - 1)
+                   for (other_offsets, other_text), other in others):
+                matched.append(row)
+        return matched
+
+    def release(self) -> None:
+        self.ids.release()
+        for offsets, text in self.columns:
+            offsets.release()
+            text.release()
+
+# Partitions attached by this worker process, by slot: (block name, SharedMemory, _PartitionView)
+_attached = {}
+
+def _detach_all() -> None:
+    # SharedMemory cannot be closed at interpreter exit while views on it are still alive
+    for _, shm, view in _attached.values():
+        view.release()
+        shm.close()
+    _attached.clear()
+
+def _scan(slot: int, name: str, specs: list, stop_after: int = None) -> bytes:
+    """Worker side of a query: match one partition and return the row numbers as int64 bytes."""
+    cached = _attached.get(slot)
+    if cached is None or cached[0] != name:
+        if cached is not None:
+            cached[2].release()
+            cached[1].close()
+        # Every process of the pool shares the parent's resource tracker, so attaching registers nothing new
+        shm = shared_memory.SharedMemory(name=name)
+        if not _attached:
+            atexit.register(_detach_all)
+        cached = _attached[slot] = (name, shm, _PartitionView(shm))
+    return cached[2].match(specs, stop_after).tobytes()
+
+class ParallelScanner:
+    """Serve filter_plate_info() from shared-memory partitions scanned by a process pool.
+
+    load() exports the whole table; afterwards only the partitions holding plates changed
+    through db.database are exported again, right before the next query. Partitions are
+    not rebalanced after that, so call load() again after large imports.
+    """
+
+    def __init__(self, processes: int = None, partition_rows: int = None):
+        self.processes = processes or os.cpu_count() or 1
+        self.partition_rows = partition_rows
+        self._lock = threading.Lock()
+        self._blocks = []  # (SharedMemory, _PartitionView) per partition, in plate order
+        self._bounds = []  # (part1, part2) of the first plate of every partition but the first
+        self._dirty = set()
+        # spawn: forking a process that runs Qt and other threads is not safe
+        self._executor = ProcessPoolExecutor(self.processes, mp_context=get_context("spawn"))
+        database.add_write_listener(self._on_write)
+
+    def load(self, rows=None, total: int = None) -> None:
+        """Export every contact; rows may instead supply (plate id, part1, part2, phone, note) sorted by plate."""
+        conn = None
+        if rows is None:
+            conn = database.get_read_connection()
+            total = conn.execute("SELECT COUNT(*) FROM contacts").fetchone()[0]
+            rows = conn.execute(f"{_EXPORT_SELECT} ORDER BY plates.part1, plates.part2, contacts.phone_number")
+        start = time.perf_counter()
+        # Several partitions per process so that uneven matches still spread over all of them
+        size = self.partition_rows or max(50000, -(-(total or 0) // (self.processes * 4)))
+        blocks, bounds, chunk, exported = [], [], [], 0
+        try:
+            for row in rows:
+                if len(chunk) >= size and row[1:3] != chunk[-1][1:3]:
+                    shm = _export(chunk)
+                    blocks.append((shm, _PartitionView(shm)))
+                    bounds.append((row[1], row[2]))
+                    exported += len(chunk)
+                    chunk = []
+                chunk.append(row)
+            shm = _export(chunk)
+            blocks.append((shm, _PartitionView(shm)))
+            exported += len(chunk)
+        except BaseException:
+            for shm, view in blocks:
+                self._free(shm, view)
+            raise
+        finally:
+            if conn is not None:
+                conn.close()
+        with self._lock:
+            old, self._blocks, self._bounds = self._blocks, blocks, bounds
+            self._dirty.clear()
+        for shm, view in old:
+            self._free(shm, view)
+        for slot, (shm, _) in enumerate(blocks):
+            self._executor.submit(_scan, slot, shm.name, [], 0)  # start the workers before the first query
+        logger.info("Exported %d rows to %d shared memory partitions in %.2fs",
+                    exported, len(blocks), time.perf_counter() - start)
+
+    @staticmethod
+    def _free(shm: shared_memory.SharedMemory, view: _PartitionView) -> None:
+        view.release()
+        shm.close()
+        shm.unlink()  # workers still holding it keep their mapping until they attach the replacement
+
+    def _on_write(self, removed: list, added: list) -> None:
+        with self._lock:
+            for part1, part2, _ in removed + added:
+                self._dirty.add(bisect.bisect_right(self._bounds, (part1, part2)))
+
+    def _refresh(self) -> None:
+        """Re-export the partitions changed since the last query. Call with self._lock held."""
+        if not self._dirty:
+            return
+        conn = database.get_read_connection()
+        try:
+            for index in sorted(self._dirty):
+                conditions, params = [], ()
+                if index > 0:
+                    conditions.append("(plates.part1, plates.part2) >= (?, ?)")
+                    params += self._bounds[index - 1]
+                if index < len(self._bounds):
+                    conditions.append("(plates.part1, plates.part2) < (?, ?)")
+                    params += self._bounds[index]
+                where = "WHERE " + " AND ".join(conditions) if conditions else ""
+                rows = conn.execute(f"{_EXPORT_SELECT} {where} ORDER BY plates.part1, plates.part2, contacts.phone_number",
+                                    params).fetchall()
+                shm = _export(rows)
+                old = self._blocks[index]
+                self._blocks[index] = (shm, _PartitionView(shm))
+                self._free(*old)
+        finally:
+            conn.close()
+        logger.debug("Re-exported %d shared memory partitions", len(self._dirty))
+        self._dirty.clear()
+
+    def filter_plate_info(self, part1_filter: str, part2_filter: str, phone_filter: str, search_mode: str,
+                          order_by: str = "plate", descending: bool = False, limit: int = None, offset: int = 0) -> list:
+        """Same arguments and result as database.filter_plate_info()."""
+        database._order_clause(order_by, descending, limit, offset)  # validates order_by
+        specs = _filter_specs(part1_filter, part2_filter, phone_filter, search_mode)
+        # Partitions are stored in plate order, so that page needs no more than limit + offset rows from each
+        in_order = order_by == "plate" and not descending
+        stop_after = limit + offset if in_order and limit is not None else None
+        rows = []
+        with self._lock:
+            self._refresh()
+            futures = [self._executor.submit(_scan, slot, shm.name, specs, stop_after)
+                       for slot, (shm, _) in enumerate(self._blocks)]
+            for (_, view), future in zip(self._blocks, futures):
+                matched = array("q")
+                matched.frombytes(future.result())
+                if in_order and limit is not None and len(rows) >= limit + offset:
+                    continue  # earlier partitions already fill the page
+                rows.extend(view.rows(matched))
+        if not in_order:
+            rows.sort(key=_sort_key(order_by), reverse=descending)
+        rows = rows[offset:] if limit is None else rows[offset:offset + limit]
+        return [(f"{part1}-{part2}", phone_number, note) for _, part1, part2, phone_number, note in rows]
+
+    def close(self) -> None:
+        database.remove_write_listener(self._on_write)
+        self._executor.shutdown()
+        with self._lock:
+            for shm, view in self._blocks:
+                self._free(shm, view)
+            self._blocks, self._bounds = [], []
+
+def _sort_key(order_by: str):
+    """database.SORT_COLUMNS for (plate id, part1, part2, phone, note) rows."""
+    if order_by == "plate":
+        return lambda row: (row[1], row[2], row[3])
+    if order_by == "phone":
+        return lambda row: (row[3], row[0])
+    return lambda row: (row[4] is not None, row[4] or "", row[0], row[3])  # SQLite sorts NULL first
+
+def _generated_rows(count: int, seed: int = 1):
+    """count synthetic rows sorted by plate, one contact per plate."""
+    generator = random.Random(seed)
+    notes = [None, "", "VIP", "月租", "訪客"]
+    for plate_id in range(count):
+        # Fixed-width upper-case hex keeps the plates in sorted order
+        yield (plate_id + 1, f"{plate_id // 10000:04X}", f"{plate_id % 10000:04d}",
+               f"09{generator.randrange(10 ** 8):08d}", generator.choice(notes))
+
+def benchmark(rows: int = 10_000_000, process_counts: list = None, repeat: int = 5) -> list:
+    """Time full scans of generated rows with growing process counts; returns one result per count."""
+    process_counts = process_counts or sorted({1, 2, 4, os.cpu_count() or 1})
+    queries = [("", "", "5678", "電話查詢"), ("0A", "12", "", "車牌查詢"), ("F", "", "", "車牌查詢")]
+    scanner = ParallelScanner(processes=max(process_counts))
+    results = []
+    try:
+        start = time.perf_counter()
+        scanner.load(_generated_rows(rows), total=rows)
+        print(f"Exported {rows} rows in {time.perf_counter() - start:.1f}s")
+        full_pool = scanner._executor
+        for processes in process_counts:
+            scanner._executor = ProcessPoolExecutor(processes, mp_context=get_context("spawn"))
+            scanner.filter_plate_info(*queries[0])  # start the workers and attach the partitions
+            start = time.perf_counter()
+            matched = 0
+            for _ in range(repeat):
+                for query in queries:
+                    matched += len(scanner.filter_plate_info(*query))
+            elapsed = time.perf_counter() - start
+            scanner._executor.shutdown()
+            results.append({"processes": processes, "queries_per_second": repeat * len(queries) / elapsed,
+                            "rows_per_second": repeat * len(queries) * rows / elapsed, "matched": matched})
+            print(results[-1])
+        scanner._executor = full_pool
+    finally:
+        scanner.close()
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the shared-memory parallel scan.")
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--processes", type=int, nargs="+")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    benchmark(args.rows, args.processes, args.repeat)
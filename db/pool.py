@@ -0,0 +1,82 @@
+import queue
+import sqlite3
+import threading
+
+
+class PooledConnection:
+    """Wrap a pooled sqlite3 connection so that close() returns it to the pool."""
+
+    def __init__(self, pool, conn: sqlite3.Connection):
+        self._pool = pool
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def close(self) -> None:
+        """Roll back any unfinished transaction and hand the connection back."""
+        if self._conn is None:
+            return
+        if self._conn.in_transaction:
+            self._conn.rollback()
+        self._pool.release(self._conn)
+        self._conn = None
+
+
+class ConnectionPool:
+    """A fixed-size pool of WAL-mode connections to one database file."""
+
+    def __init__(self, database_file: str, size: int = 4, timeout: float = 30.0, on_connect=None):
+        self.database_file = database_file
+        self.size = size
+        self.timeout = timeout
+        self.on_connect = on_connect
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._lock = threading.Lock()
+        self._created = 0
+        self._closed = False
+
+    def _open(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.database_file, timeout=self.timeout, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        if self.on_connect is not None:
+            self.on_connect(conn)
+        return conn
+
+    def acquire(self) -> PooledConnection:
+        """Take an idle connection, opening a new one while below the pool size."""
+        if self._closed:
+            raise sqlite3.ProgrammingError("Connection pool is closed.")
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_open = self._created < self.size
+                if can_open:
+                    self._created += 1
+            if not can_open:
+                conn = self._idle.get(timeout=self.timeout)
+            else:
+                try:
+                    conn = self._open()
+                except sqlite3.Error:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+        return PooledConnection(self, conn)
+
+    def release(self, conn: sqlite3.Connection) -> None:
+        if self._closed:
+            conn.close()
+        else:
+            self._idle.put_nowait(conn)
+
+    def close(self) -> None:
+        """Close every idle connection; connections still in use close on release."""
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
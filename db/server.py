@@ -0,0 +1,115 @@
+import argparse
+import json
+import socketserver
+import sqlite3
+import threading
+from db import database
+from db.pool import ConnectionPool
+from app.logger import logger
+
+# Functions a client may call, and whether they write to the database.
+METHODS = {
+    "add_plate_info": True,
+    "add_plate_infos": True,
+    "update_plate_info": True,
+    "move_plate_info": True,
+    "delete_plate_info": True,
+    "delete_plate_infos": True,
+    "update_plate_infos": True,
+    "get_all_plate_info": False,
+    "get_plate": False,
+    "lookup_plates": False,
+    "filter_plate_info": False,
+    "plate_exists": False,
+    "plate_and_phone_exists": False,
+    "plate_and_phone_note_exists": False,
+}
+
+# SQLite allows one writer at a time; serializing writes here means clients never see "database is locked".
+_write_lock = threading.Lock()
+
+def handle_request(request: dict) -> dict:
+    """Run one decoded request against db.database and build the response.
+
+    Any exception becomes an error response, so a bad request never drops the client's connection.
+    """
+    if not isinstance(request, dict):
+        return {"id": None, "error": {"type": "ProgrammingError", "message": "Request must be a JSON object"}}
+    request_id = request.get("id")
+    method = request.get("method")
+    if not isinstance(method, str) or method not in METHODS:
+        return {"id": request_id, "error": {"type": "ProgrammingError", "message": f"Unknown method: {method}"}}
+    func = getattr(database, method)
+    try:
+        if METHODS[method]:
+            with _write_lock:
+                result = func(*request.get("args", []), **request.get("kwargs", {}))
+        else:
+            result = func(*request.get("args", []), **request.get("kwargs", {}))
+    except (sqlite3.Error, TypeError, ValueError) as e:
+        logger.error("Request %s failed: %s", method, e)
+        return {"id": request_id, "error": {"type": type(e).__name__, "message": str(e)}}
+    except Exception as e:
+        # e.g. AttributeError from malformed arguments or queue.Empty when no pooled connection is free
+        logger.exception("Request %s failed", method)
+        return {"id": request_id, "error": {"type": type(e).__name__, "message": str(e)}}
+    return {"id": request_id, "result": result}
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    """Answer newline-delimited JSON requests in the order they arrive, so clients may pipeline."""
+
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+            except json.JSONDecodeError as e:
+                response = {"id": None, "error": {"type": "ProgrammingError", "message": f"Invalid JSON: {e}"}}
+            else:
+                response = handle_request(request)
+            self.wfile.write(json.dumps(response, ensure_ascii=False).encode("utf-8") + b"\n")
+            self.wfile.flush()
+
+class ThreadingTCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+if hasattr(socketserver, "UnixStreamServer"):
+    class ThreadingUnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+
+def create_server(database_file: str, host: str = "127.0.0.1", port: int = 8765, unix_socket: str = None, pool_size: int = 4):
+    """Create a query server that owns database_file through a WAL-mode connection pool."""
+    pool = ConnectionPool(database_file, size=pool_size, on_connect=database.configure_connection)
+    database.DATABASE_FILE = database_file
+    database.use_connection_pool(pool)
+    if unix_socket:
+        server = ThreadingUnixServer(unix_socket, RequestHandler)
+    else:
+        server = ThreadingTCPServer((host, port), RequestHandler)
+    server.pool = pool
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve database.db to several stations over a local socket.")
+    parser.add_argument("--db", default=database.DATABASE_FILE, help="database file to serve")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--unix", dest="unix_socket", help="listen on this Unix socket path instead of TCP")
+    parser.add_argument("--pool-size", type=int, default=4)
+    args = parser.parse_args()
+
+    server = create_server(args.db, args.host, args.port, args.unix_socket, args.pool_size)
+    logger.info("Query server for %s listening on %s", args.db, server.server_address)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        database.use_connection_pool(None)
+        server.pool.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,433 @@
+"""Read-only plate lookups from a memory-mapped snapshot file, for kiosk and read-only stations.
+
+export() writes every plate in the database to one binary file:
+
+    header      _HEADER: magic, format version, key widths, counts, generation, CRC-32
+    keys        one fixed-width key per plate, part1 and part2 each NUL-padded, sorted
+    offsets     plates + 1 uint32 offsets into the heap; plate i owns heap[offsets[i]:offsets[i + 1]]
+    heap        per plate: uint16 contact count, then per contact a uint16 length + UTF-8 phone
+                number and a uint32 length + UTF-8 note (_NULL_NOTE for NULL), by phone number
+
+Snapshot maps the file and answers exact and prefix plate lookups by binary search over
+the keys in place; opening one reads only the header, so a station can start answering
+lookups without loading anything.
+
+Each export that changes anything writes a new generation file next to the snapshot path,
+database.snapshot.<generation>, and then points the small text file at the snapshot path
+itself to it. A generation file is never rewritten, so readers keep their map until
+changed() sees the pointer move on; Windows cannot replace or delete a file while a
+process has it mapped, which rules out swapping the mapped file in place. Generations older
+than the previous one are deleted by the next export, and one still mapped on Windows is
+left for a later export to delete.
+
+    python -m db.snapshot export                  # database.snapshot next to the database
+    python -m db.snapshot lookup ABC 1234
+    python -m db.snapshot benchmark
+    python -m db.snapshot check                   # lookups on a snapshot of known plates
+"""
+import argparse
+import bisect
+import json
+import mmap
+import os
+import re
+import struct
+import sys
+import time
+import zlib
+from app.logger import logger
+from db import database
+from db.config import snapshot_path
+
+MAGIC = b"NADBSNAP"
+FORMAT_VERSION = 1
+# Magic, format version, part1 width, part2 width, reserved, plates, contacts, heap size, generation, built at, CRC-32 of the rest
+_HEADER = struct.Struct("<8sHHHHQQQQdI4x")
+_COUNT = struct.Struct("<H")
+_PHONE_LENGTH = struct.Struct("<H")
+_NOTE_LENGTH = struct.Struct("<I")
+_OFFSET = struct.Struct("<I")
+_NULL_NOTE = 0xFFFFFFFF
+# The current generation and the one before it, which a reader may have just read the pointer to
+KEEP_GENERATIONS = 2
+
+def _align(position: int) -> int:
+    return (position + 7) & ~7
+
+def _encode_contacts(contacts: list) -> bytes:
+    parts = [_COUNT.pack(len(contacts))]
+    for phone_number, note in sorted(contacts, key=lambda contact: contact[0]):
+        phone = phone_number.encode()
+        parts += [_PHONE_LENGTH.pack(len(phone)), phone]
+        if note is None:
+            parts.append(_NOTE_LENGTH.pack(_NULL_NOTE))
+        else:
+            text = note.encode()
+            parts += [_NOTE_LENGTH.pack(len(text)), text]
+    return b"".join(parts)
+
+def _generation_path(path: str, generation: int) -> str:
+    return f"{path}.{generation}"
+
+def current_file(path: str) -> str:
+    """The generation file the snapshot pointer at path names, or None if nothing was exported yet."""
+    try:
+        with open(path, encoding="utf-8") as file:
+            name = file.read().strip()
+    except FileNotFoundError:
+        return None
+    return os.path.join(os.path.dirname(os.path.abspath(path)), name) if name else None
+
+def _read_header(path: str):
+    if path is None:
+        return None
+    try:
+        with open(path, "rb") as file:
+            data = file.read(_HEADER.size)
+    except FileNotFoundError:
+        return None
+    if len(data) < _HEADER.size or data[:8] != MAGIC:
+        return None
+    return _HEADER.unpack(data)
+
+def _replace(source: str, target: str, attempts: int = 20) -> None:
+    # On Windows the replace fails while a reader has the pointer open; readers hold it only briefly
+    for attempt in range(attempts):
+        try:
+            os.replace(source, target)
+            return
+        except PermissionError:
+            if attempt == attempts - 1:
+                raise
+            time.sleep(0.05)
+
+def _remove_old_generations(path: str, generation: int) -> None:
+    directory = os.path.dirname(os.path.abspath(path))
+    pattern = re.compile(re.escape(os.path.basename(path)) + r"\.(\d+)")
+    for name in os.listdir(directory):
+        found = pattern.fullmatch(name)
+        if found is None or int(found.group(1)) > generation - KEEP_GENERATIONS:
+            continue
+        try:
+            os.remove(os.path.join(directory, name))
+        except PermissionError:
+            # Still mapped by a reader on Windows; the next export tries again
+            logger.info("Snapshot %s is still in use, leaving it for the next export", name)
+        except FileNotFoundError:
+            pass
+
+def export(path: str = None, batch_size: int = 5000) -> dict:
+    """Write a snapshot of all plate info as a new generation and point path at it;
+    nothing is written if nothing changed since the last export."""
+    path = path or snapshot_path()
+    plates = {}  # (part1, part2) -> [(phone_number, note), ...]
+    for batch in database.iter_all_plate_info(batch_size):
+        for plate, phone_number, note in batch:
+            part1, part2 = plate.split("-", 1)
+            plates.setdefault((part1.encode(), part2.encode()), []).append((phone_number, note))
+    # Byte order of the NUL-padded keys, the same as SQLite's BINARY collation on (part1, part2)
+    keys = sorted(plates)
+    part1_width = max((len(part1) for part1, _ in keys), default=0)
+    part2_width = max((len(part2) for _, part2 in keys), default=0)
+    key_bytes = b"".join(part1.ljust(part1_width, b"\0") + part2.ljust(part2_width, b"\0") for part1, part2 in keys)
+    heap = bytearray()
+    offsets = [0]
+    for key in keys:
+        heap += _encode_contacts(plates[key])
+        offsets.append(len(heap))
+    if len(heap) > 0xFFFFFFFF:
+        raise ValueError("snapshot heap is larger than 4 GiB")
+    offset_bytes = b"".join(_OFFSET.pack(offset) for offset in offsets)
+    key_end = _HEADER.size + len(key_bytes)
+    padding = b"\0" * (_align(key_end) - key_end)
+    crc = zlib.crc32(heap, zlib.crc32(offset_bytes, zlib.crc32(key_bytes)))
+    contacts = sum(len(value) for value in plates.values())
+
+    previous_file = current_file(path)
+    previous = _read_header(previous_file)
+    if previous is not None and previous[1] == FORMAT_VERSION and previous[10] == crc \
+            and previous[5:8] == (len(keys), contacts, len(heap)):
+        logger.info("Snapshot %s is up to date (generation %d)", path, previous[8])
+        return {"path": path, "file": previous_file, "generation": previous[8], "plates": len(keys),
+                "contacts": contacts, "written": False}
+    generation = previous[8] + 1 if previous is not None else 1
+    generation_file = _generation_path(path, generation)
+    header = _HEADER.pack(MAGIC, FORMAT_VERSION, part1_width, part2_width, 0, len(keys), contacts,
+                          len(heap), generation, time.time(), crc)
+    temporary = generation_file + ".tmp"
+    with open(temporary, "wb") as file:
+        file.write(header)
+        file.write(key_bytes)
+        file.write(padding)
+        file.write(offset_bytes)
+        file.write(heap)
+    # A new name that no reader has mapped yet, so this works on Windows too
+    os.replace(temporary, generation_file)
+    with open(path + ".tmp", "w", encoding="utf-8") as file:
+        file.write(os.path.basename(generation_file) + "\n")
+    _replace(path + ".tmp", path)
+    _remove_old_generations(path, generation)
+    logger.info("Wrote snapshot %s: %d plates, %d contacts, generation %d", generation_file, len(keys), contacts, generation)
+    return {"path": path, "file": generation_file, "generation": generation, "plates": len(keys),
+            "contacts": contacts, "written": True}
+
+class _Keys:
+    """The sorted keys cut to their first length bytes, as a sequence bisect can search."""
+
+    def __init__(self, buffer, start: int, width: int, count: int, length: int):
+        self._buffer = buffer
+        self._start = start
+        self._width = width
+        self._count = count
+        self._length = length
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, index: int) -> bytes:
+        position = self._start + index * self._width
+        return self._buffer[position:position + self._length]
+
+class Snapshot:
+    """The current generation of the snapshot at path, mapped read-only. Lookups take (part1, part2) as stored: upper case."""
+
+    def __init__(self, path: str = None):
+        self.path = path or snapshot_path()
+        self.file = current_file(self.path)
+        if self.file is None:
+            raise FileNotFoundError(f"{self.path} does not exist; run python -m db.snapshot export")
+        with open(self.file, "rb") as file:
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, self.part1_width, self.part2_width, _, self.plates, self.contacts,
+         heap_size, self.generation, self.built_at, _) = _HEADER.unpack_from(self._map)
+        if magic != MAGIC:
+            self._map.close()
+            raise ValueError(f"{self.file} is not a plate snapshot")
+        if version != FORMAT_VERSION:
+            self._map.close()
+            raise ValueError(f"{self.file} has snapshot format {version}, this version reads {FORMAT_VERSION}")
+        self._width = self.part1_width + self.part2_width
+        offsets_start = _align(_HEADER.size + self.plates * self._width)
+        self._heap = offsets_start + (self.plates + 1) * _OFFSET.size
+        if self._heap + heap_size != len(self._map):
+            self._map.close()
+            raise ValueError(f"{self.file} is truncated")
+        self._offsets = memoryview(self._map)[offsets_start:self._heap]
+        if sys.byteorder == "little":
+            self._offsets = self._offsets.cast("I")  # read in place; the file is little-endian
+
+    def _offset(self, index: int) -> int:
+        if self._offsets.format == "I":
+            return self._offsets[index]
+        return _OFFSET.unpack_from(self._offsets, index * _OFFSET.size)[0]
+
+    def _range(self, prefix: bytes) -> range:
+        keys = _Keys(self._map, _HEADER.size, self._width, self.plates, len(prefix))
+        return range(bisect.bisect_left(keys, prefix), bisect.bisect_right(keys, prefix))
+
+    def _plate(self, index: int) -> str:
+        position = _HEADER.size + index * self._width
+        part1 = self._map[position:position + self.part1_width].rstrip(b"\0")
+        part2 = self._map[position + self.part1_width:position + self._width].rstrip(b"\0")
+        return f"{part1.decode()}-{part2.decode()}"
+
+    def _contacts(self, index: int) -> list:
+        position = self._heap + self._offset(index)
+        buffer = self._map
+        count, = _COUNT.unpack_from(buffer, position)
+        position += _COUNT.size
+        contacts = []
+        for _ in range(count):
+            length, = _PHONE_LENGTH.unpack_from(buffer, position)
+            position += _PHONE_LENGTH.size
+            phone_number = buffer[position:position + length].decode()
+            position += length
+            length, = _NOTE_LENGTH.unpack_from(buffer, position)
+            position += _NOTE_LENGTH.size
+            if length == _NULL_NOTE:
+                note = None
+            else:
+                note = buffer[position:position + length].decode()
+                position += length
+            contacts.append((phone_number, note))
+        return contacts
+
+    def lookup(self, part1: str, part2: str) -> list:
+        """[(phone_number, note), ...] of one plate by phone number, or None if it is not in the snapshot."""
+        if len(part1.encode()) > self.part1_width or len(part2.encode()) > self.part2_width:
+            return None
+        key = part1.encode().ljust(self.part1_width, b"\0") + part2.encode().ljust(self.part2_width, b"\0")
+        keys = _Keys(self._map, _HEADER.size, self._width, self.plates, self._width)
+        index = bisect.bisect_left(keys, key)
+        return self._contacts(index) if index < self.plates and keys[index] == key else None
+
+    def prefix(self, part1: str, part2: str = None, limit: int = None) -> list:
+        """[(plate, phone_number, note), ...] in plate order of the plates whose part1 starts with part1,
+        or with part2 given, whose part1 is part1 and whose part2 starts with part2."""
+        if len(part1.encode()) > self.part1_width:
+            return []  # longer than every part1; a shorter key would run on into the part2 bytes
+        if part2 is None:
+            key = part1.encode()
+        else:
+            key = part1.encode().ljust(self.part1_width, b"\0") + part2.encode()
+        rows = []
+        for index in self._range(key):
+            plate = self._plate(index)
+            rows += [(plate, phone_number, note) for phone_number, note in self._contacts(index)]
+            if limit is not None and len(rows) >= limit:
+                return rows[:limit]
+        return rows
+
+    def changed(self) -> bool:
+        """True once export() has pointed path at a newer generation than the one mapped; reopen to read it."""
+        try:
+            latest = current_file(self.path)
+        except PermissionError:
+            # Being replaced by export() on Windows; the next check sees the result
+            return False
+        return latest is not None and latest != self.file
+
+    def close(self) -> None:
+        self._offsets.release()
+        self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def benchmark(lookups: int = 20000, path: str = None) -> dict:
+    """Time opening and exact and prefix lookups on a snapshot of DATABASE_FILE against the same lookups in SQLite."""
+    import random
+    import tempfile
+    if path is None:
+        with tempfile.TemporaryDirectory() as directory:
+            return benchmark(lookups, os.path.join(directory, "benchmark.snapshot"))
+    start = time.perf_counter()
+    exported = export(path)
+    export_s = time.perf_counter() - start
+    start = time.perf_counter()
+    conn = database.get_read_connection()
+    conn.execute(f"{database.PLATE_INFO_SELECT} WHERE plates.part1 = ? AND plates.part2 = ?", ("", "")).fetchall()
+    open_ms = (time.perf_counter() - start) * 1000
+    plates = conn.execute("SELECT part1, part2 FROM plates ORDER BY random() LIMIT ?", (lookups,)).fetchall()
+    exact_sql = f"{database.PLATE_INFO_SELECT} WHERE plates.part1 = ? AND plates.part2 = ? ORDER BY contacts.phone_number"
+    prefix_sql = f"{database.PLATE_INFO_SELECT} WHERE plates.part1 = ? AND plates.part2 GLOB ? ORDER BY plates.part2, contacts.phone_number"
+    generator = random.Random(1)
+    prefixes = [(part1, part2[:max(1, len(part2) - 2)]) for part1, part2 in generator.sample(plates, min(2000, len(plates)))]
+    result = {"plates": len(plates), "export_s": export_s, "snapshot_bytes": os.path.getsize(exported["file"]),
+              "sqlite_open_ms": open_ms}
+    try:
+        start = time.perf_counter()
+        for part1, part2 in plates:
+            conn.execute(exact_sql, (part1, part2)).fetchall()
+        result["sqlite_exact_us"] = (time.perf_counter() - start) / len(plates) * 1e6
+        start = time.perf_counter()
+        for part1, part2 in prefixes:
+            conn.execute(prefix_sql, (part1, part2 + "*")).fetchall()
+        result["sqlite_prefix_us"] = (time.perf_counter() - start) / len(prefixes) * 1e6
+    finally:
+        conn.close()
+
+    start = time.perf_counter()
+    snapshot = Snapshot(path)
+    snapshot.lookup(*plates[0])
+    result["snapshot_open_ms"] = (time.perf_counter() - start) * 1000
+    try:
+        start = time.perf_counter()
+        for part1, part2 in plates:
+            snapshot.lookup(part1, part2)
+        result["snapshot_exact_us"] = (time.perf_counter() - start) / len(plates) * 1e6
+        start = time.perf_counter()
+        for part1, part2 in prefixes:
+            snapshot.prefix(part1, part2)
+        result["snapshot_prefix_us"] = (time.perf_counter() - start) / len(prefixes) * 1e6
+    finally:
+        snapshot.close()
+    return result
+
+# Plates for check(): part1 of different lengths, so the shorter one is NUL-padded, and a NULL note
+_CHECK_ROWS = [
+    ("ABC", "D123", "0911000001", "白色豐田"),
+    ("ABC", "D123", "0911000002", None),
+    ("AB", "1234", "0922000001", ""),
+]
+
+_CHECK_CASES = [
+    ("lookup", ("ABC", "D123"), [("0911000001", "白色豐田"), ("0911000002", None)]),
+    ("lookup", ("AB", "1234"), [("0922000001", "")]),
+    ("lookup", ("ABC", "D12"), None),
+    ("lookup", ("ABCD", "123"), None),
+    ("prefix", ("AB",), [("AB-1234", "0922000001", ""), ("ABC-D123", "0911000001", "白色豐田"), ("ABC-D123", "0911000002", None)]),
+    ("prefix", ("ABC", "D"), [("ABC-D123", "0911000001", "白色豐田"), ("ABC-D123", "0911000002", None)]),
+    ("prefix", ("AB", "12"), [("AB-1234", "0922000001", "")]),
+    # Longer than every part1: must not run on into the part2 bytes and find ABC-D123
+    ("prefix", ("ABCD",), []),
+    ("prefix", ("ABCD", "123"), []),
+]
+
+def check() -> list:
+    """Export _CHECK_ROWS to a temporary database and snapshot and return the lookups that answered wrong."""
+    import tempfile
+    from db.initialize_db import initialize_database
+    failures = []
+    saved = database.DATABASE_FILE
+    with tempfile.TemporaryDirectory() as directory:
+        database.DATABASE_FILE = os.path.join(directory, "check.db")
+        try:
+            initialize_database(database.DATABASE_FILE)
+            database.add_plate_infos(_CHECK_ROWS)
+            with Snapshot(export(os.path.join(directory, "check.snapshot"))["path"]) as snapshot:
+                for method, args, expected in _CHECK_CASES:
+                    result = getattr(snapshot, method)(*args)
+                    if result != expected:
+                        failures.append(f"{method}{args}: expected {expected}, got {result}")
+        finally:
+            database.DATABASE_FILE = saved
+    return failures
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Export the plate database to a memory-mapped snapshot and read it.")
+    parser.add_argument("--db", default=database.DATABASE_FILE)
+    parser.add_argument("--snapshot", help='snapshot file (default: "snapshot_file" in config.json)')
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("export", help="write the snapshot if the database changed since the last export")
+    lookup_parser = subparsers.add_parser("lookup", help="look up one plate; with --prefix, every plate starting with it")
+    lookup_parser.add_argument("part1")
+    lookup_parser.add_argument("part2", nargs="?")
+    lookup_parser.add_argument("--prefix", action="store_true")
+    benchmark_parser = subparsers.add_parser("benchmark", help="compare lookup latency with SQLite")
+    benchmark_parser.add_argument("--lookups", type=int, default=20000)
+    subparsers.add_parser("check", help="verify exact and prefix lookups on a snapshot of known plates")
+    args = parser.parse_args(argv)
+    database.DATABASE_FILE = args.db
+
+    if args.command == "export":
+        print(json.dumps(export(args.snapshot), ensure_ascii=False))
+    elif args.command == "lookup":
+        part1, part2 = args.part1.upper(), args.part2.upper() if args.part2 is not None else None
+        with Snapshot(args.snapshot) as snapshot:
+            if args.prefix:
+                rows = snapshot.prefix(part1, part2)
+            else:
+                contacts = snapshot.lookup(part1, part2 or "")
+                rows = [(f"{part1}-{part2 or ''}", phone_number, note) for phone_number, note in contacts or []]
+        if not rows:
+            print(f"{part1}-{part2 or ''} is not in the snapshot", file=sys.stderr)
+            return 1
+        for plate, phone_number, note in rows:
+            print(f"{plate}\t{phone_number}\t{note or ''}")
+    elif args.command == "check":
+        failures = check()
+        for failure in failures:
+            print(f"FAIL: {failure}")
+        if failures:
+            return 1
+        print(f"{len(_CHECK_CASES)} lookups answered correctly")
+    else:
+        print(json.dumps(benchmark(args.lookups, args.snapshot), indent=2))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,182 @@
+"""Named storage profiles (page size, cache, mmap, journal mode, temp store) and their calibration.
+
+Pick a profile with "storage_profile" in config.json. Per-connection settings are applied by
+db.database.get_connection(), file settings by initialize_database() and apply_profile().
+
+    python -m db.storage calibrate          # time the lookup workload under every profile
+    python -m db.storage apply read_heavy   # rebuild/convert database.db and save the choice
+"""
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from app.logger import logger
+from db.config import database_path, load_config, save_config
+
+# "default" is what SQLite does out of the box and stays the default: WAL and mmap are unsafe
+# when database.db lives on a network share, which is how some stations share it.
+PROFILES = {
+    "default": {"page_size": 4096, "cache_size": -2000, "mmap_size": 0, "journal_mode": "delete", "temp_store": "default"},
+    "wal": {"page_size": 4096, "cache_size": -8000, "mmap_size": 0, "journal_mode": "wal", "temp_store": "memory"},
+    "read_heavy": {"page_size": 8192, "cache_size": -16000, "mmap_size": 256 * 1024 * 1024, "journal_mode": "wal", "temp_store": "memory"},
+    "low_memory": {"page_size": 4096, "cache_size": -512, "mmap_size": 0, "journal_mode": "delete", "temp_store": "file"},
+    "network_share": {"page_size": 4096, "cache_size": -4000, "mmap_size": 0, "journal_mode": "delete", "temp_store": "memory"},
+}
+
+# SQLite's own per-connection defaults; PRAGMAs equal to these are not sent
+_CONNECTION_DEFAULTS = {"cache_size": -2000, "mmap_size": 0, "temp_store": "default"}
+
+def configured_profile() -> str:
+    return load_config().get("storage_profile", "default")
+
+def get_profile(name: str) -> dict:
+    if name not in PROFILES:
+        raise ValueError(f"Unknown storage profile {name!r}; expected one of {', '.join(PROFILES)}")
+    return PROFILES[name]
+
+def connection_pragmas(name: str) -> list:
+    """PRAGMA statements every new connection needs under the given profile."""
+    profile = get_profile(name)
+    return [f"PRAGMA {key} = {profile[key]}" for key, default in _CONNECTION_DEFAULTS.items() if profile[key] != default]
+
+def apply_file_settings(conn: sqlite3.Connection, name: str) -> None:
+    """Set the page size (effective only before the first table exists) and journal mode of a database."""
+    profile = get_profile(name)
+    conn.execute(f"PRAGMA page_size = {profile['page_size']}")
+    conn.execute(f"PRAGMA journal_mode = {profile['journal_mode']}").fetchall()
+
+def rebuild_with_page_size(database_file: str, page_size: int) -> None:
+    """Rewrite the database with a new page size through VACUUM INTO and swap it in place.
+
+    The copy is checked with quick_check before it replaces the original. No other
+    connection may be using the file while this runs.
+    """
+    from db.maintenance import quick_check
+    rebuilt_file = database_file + ".rebuild"
+    if os.path.exists(rebuilt_file):
+        os.remove(rebuilt_file)
+    conn = sqlite3.connect(database_file, isolation_level=None)
+    try:
+        if conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal":
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+        conn.execute(f"PRAGMA page_size = {int(page_size)}")
+        conn.execute("VACUUM INTO ?", (rebuilt_file,))
+    finally:
+        conn.close()
+    problems = quick_check(rebuilt_file)
+    if problems:
+        os.remove(rebuilt_file)
+        raise sqlite3.DatabaseError(f"Rebuilt copy failed quick_check: {problems}")
+    for suffix in ("-wal", "-shm"):
+        if os.path.exists(database_file + suffix):
+            os.remove(database_file + suffix)
+    os.replace(rebuilt_file, database_file)
+    logger.info("Rebuilt %s with page size %d", database_file, page_size)
+
+def apply_profile(database_file: str, name: str) -> None:
+    """Convert an existing database to a profile, rebuilding it if the page size differs."""
+    profile = get_profile(name)
+    conn = sqlite3.connect(database_file, isolation_level=None)
+    try:
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    finally:
+        conn.close()
+    if page_size != profile["page_size"]:
+        rebuild_with_page_size(database_file, profile["page_size"])
+    conn = sqlite3.connect(database_file, isolation_level=None)
+    try:
+        apply_file_settings(conn, name)
+    finally:
+        conn.close()
+
+def _lookup_workload(database, plates: list, misses: list) -> None:
+    """The GUI's read pattern: exact plate checks, partial plate searches and a phone search."""
+    for part1, part2 in plates:
+        database.plate_exists(part1, part2)
+        database.filter_plate_info(part1, part2, "", "車牌查詢", limit=100)
+    for part1, part2 in misses:
+        database.plate_exists(part1, part2)
+    for part1, _ in plates[:len(plates) // 10]:
+        database.filter_plate_info(part1[:2], "", "", "車牌查詢", limit=100)
+    database.filter_plate_info("", "", "09", "電話查詢", limit=100)
+
+def calibrate(database_file: str = None, profiles: list = None, lookups: int = 500, repeats: int = 3) -> list:
+    """Time the lookup workload on a copy of the database under each profile, fastest first.
+
+    Returns [{"profile", "seconds", "lookups_per_second"}]; seconds is the best of repeats runs.
+    """
+    from db import database
+    database_file = database_file or database_path()
+    profiles = profiles or list(PROFILES)
+    conn = sqlite3.connect(database_file)
+    try:
+        plates = conn.execute("SELECT part1, part2 FROM plates ORDER BY random() LIMIT ?", (lookups,)).fetchall()
+    finally:
+        conn.close()
+    misses = [(f"ZZ{i}", "MISS") for i in range(len(plates))]
+    previous_file, previous_pragmas = database.DATABASE_FILE, database._connection_pragmas
+    results = []
+    scratch = tempfile.mkdtemp(prefix="storage_calibrate_")
+    try:
+        for name in profiles:
+            copy = os.path.join(scratch, f"{name}.db")
+            source, target = sqlite3.connect(database_file), sqlite3.connect(copy)
+            try:
+                source.backup(target)  # unlike a file copy, this includes pages still in the WAL
+            finally:
+                target.close()
+                source.close()
+            apply_profile(copy, name)
+            database.DATABASE_FILE, database._connection_pragmas = copy, connection_pragmas(name)
+            best = None
+            for _ in range(repeats):
+                random.shuffle(plates)
+                start = time.perf_counter()
+                _lookup_workload(database, plates, misses)
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            calls = len(plates) * 2 + len(misses) + len(plates) // 10 + 1
+            results.append({"profile": name, "seconds": best, "lookups_per_second": calls / best if best else 0.0})
+    finally:
+        database.DATABASE_FILE, database._connection_pragmas = previous_file, previous_pragmas
+        shutil.rmtree(scratch, ignore_errors=True)
+    results.sort(key=lambda result: result["seconds"])
+    return results
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Storage profiles for the plate database.")
+    parser.add_argument("--db", default=database_path())
+    commands = parser.add_subparsers(dest="command", required=True)
+    calibrate_parser = commands.add_parser("calibrate", help="benchmark every profile on a copy of the database")
+    calibrate_parser.add_argument("--lookups", type=int, default=500)
+    calibrate_parser.add_argument("--repeats", type=int, default=3)
+    calibrate_parser.add_argument("--apply", action="store_true", help="apply and save the fastest profile")
+    apply_parser = commands.add_parser("apply", help="convert the database to a profile and save it in config.json")
+    apply_parser.add_argument("profile", choices=list(PROFILES))
+    commands.add_parser("list", help="show the profiles")
+    args = parser.parse_args(argv)
+
+    if args.command == "list":
+        current = configured_profile()
+        for name, profile in PROFILES.items():
+            print(f"{'*' if name == current else ' '} {name}\t{profile}")
+        return 0
+    if args.command == "calibrate":
+        results = calibrate(args.db, lookups=args.lookups, repeats=args.repeats)
+        for result in results:
+            print(f"{result['profile']}\t{result['seconds']:.3f}s\t{result['lookups_per_second']:.0f} lookups/s")
+        print(f"Recommended profile: {results[0]['profile']}")
+        if not args.apply:
+            return 0
+        args.profile = results[0]["profile"]
+    apply_profile(args.db, args.profile)
+    save_config({"storage_profile": args.profile})
+    print(f"Applied storage profile {args.profile} to {args.db}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,341 @@
+"""Delta sync between stations that each keep their own database, through a shared folder.
+
+After install(), triggers record every change to contacts in sync_rows: the latest state of
+each (part1, part2, phone_number) contact, deletions included, stamped with a Lamport
+clock and the id of the station that made it. export_bundle() writes this station's
+changes since its last export as a small gzip file to <folder>/<station>/, and
+import_bundles() applies the other stations' new files. For the same contact the version
+with the higher (clock, station) wins everywhere, so stations converge whatever order the
+bundles arrive in, and applying a bundle twice changes nothing.
+
+    python -m db.sync install --station 本店
+    python -m db.sync sync \\\\server\\share\\new_again_sync
+"""
+import argparse
+import gzip
+import json
+import os
+import socket
+import sqlite3
+import sys
+import uuid
+from app.logger import logger
+from db import database
+from db.config import load_config
+
+SYNC_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS sync_state (key TEXT PRIMARY KEY, value);
+    CREATE TABLE IF NOT EXISTS sync_rows (
+        part1 TEXT NOT NULL,
+        part2 TEXT NOT NULL,
+        phone_number TEXT NOT NULL,
+        note TEXT,
+        deleted INTEGER NOT NULL DEFAULT 0,
+        clock INTEGER NOT NULL,
+        station TEXT NOT NULL,
+        UNIQUE(part1, part2, phone_number)
+    );
+    -- export_bundle() reads this station's rows above the last exported clock
+    CREATE INDEX IF NOT EXISTS idx_sync_rows_station ON sync_rows (station, clock);
+'''
+
+# The triggers stand aside while import_bundles() writes remote changes ('applying' = 1)
+_RECORD = '''
+    INSERT INTO sync_rows (part1, part2, phone_number, note, deleted, clock, station)
+        SELECT plates.part1, plates.part2, {phone}, {note}, {deleted},
+               (SELECT value FROM sync_state WHERE key = 'clock'), (SELECT value FROM sync_state WHERE key = 'station')
+        FROM plates WHERE plates.id = {plate_id}{condition}
+    ON CONFLICT (part1, part2, phone_number) DO UPDATE
+        SET note = excluded.note, deleted = excluded.deleted, clock = excluded.clock, station = excluded.station;
+'''
+_TICK = "UPDATE sync_state SET value = value + 1 WHERE key = 'clock';"
+_LOCAL = "(SELECT value FROM sync_state WHERE key = 'applying') = 0"
+
+SYNC_TRIGGERS = f'''
+    CREATE TRIGGER IF NOT EXISTS sync_contacts_insert AFTER INSERT ON contacts WHEN {_LOCAL}
+    BEGIN
+        {_TICK}
+        {_RECORD.format(phone="NEW.phone_number", note="NEW.note", deleted=0, plate_id="NEW.plate_id", condition="")}
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS sync_contacts_update AFTER UPDATE OF plate_id, phone_number, note ON contacts
+    WHEN {_LOCAL} AND (OLD.plate_id IS NOT NEW.plate_id OR OLD.phone_number IS NOT NEW.phone_number OR OLD.note IS NOT NEW.note)
+    BEGIN
+        {_TICK}
+        -- A new plate or phone is a new contact; the old one is recorded as deleted
+        {_RECORD.format(phone="OLD.phone_number", note="NULL", deleted=1, plate_id="OLD.plate_id",
+                        condition=" AND (OLD.plate_id != NEW.plate_id OR OLD.phone_number != NEW.phone_number)")}
+        {_RECORD.format(phone="NEW.phone_number", note="NEW.note", deleted=0, plate_id="NEW.plate_id", condition="")}
+    END;
+
+    -- BEFORE, because deleting a plate's last contact also deletes the plate
+    CREATE TRIGGER IF NOT EXISTS sync_contacts_delete BEFORE DELETE ON contacts WHEN {_LOCAL}
+    BEGIN
+        {_TICK}
+        {_RECORD.format(phone="OLD.phone_number", note="NULL", deleted=1, plate_id="OLD.plate_id", condition="")}
+    END;
+'''
+
+def _split(script: str):
+    statement = ''
+    for line in script.splitlines(keepends=True):
+        statement += line
+        if sqlite3.complete_statement(statement):
+            yield statement.strip()
+            statement = ''
+
+def _state(cursor, key: str, default=None):
+    row = cursor.execute("SELECT value FROM sync_state WHERE key = ?", (key,)).fetchone()
+    return default if row is None else row[0]
+
+def _set_state(cursor, key: str, value) -> None:
+    database._execute_write(cursor, '''
+        INSERT INTO sync_state (key, value) VALUES (?, ?)
+        ON CONFLICT (key) DO UPDATE SET value = excluded.value
+    ''', (key, value))
+
+def install(station: str = None) -> str:
+    """Add the change log to the database and record the existing contacts as this station's. Returns the station id."""
+    conn = database.get_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("BEGIN IMMEDIATE")
+        for statement in _split(SYNC_SCHEMA):
+            cursor.execute(statement)
+        current = _state(cursor, "station")
+        if current is None:
+            station = station or f"{socket.gethostname()}-{uuid.uuid4().hex[:6]}"
+            if os.sep in station or "/" in station:
+                raise ValueError(f"Station id {station!r} cannot contain path separators")
+            cursor.executemany("INSERT INTO sync_state (key, value) VALUES (?, ?)",
+                               [("station", station), ("clock", 1), ("applying", 0), ("exported", 0)])
+            # Every existing contact goes out with the first bundle
+            cursor.execute('''
+                INSERT OR IGNORE INTO sync_rows (part1, part2, phone_number, note, deleted, clock, station)
+                SELECT plates.part1, plates.part2, contacts.phone_number, contacts.note, 0, 1, ?
+                FROM contacts JOIN plates ON plates.id = contacts.plate_id
+            ''', (station,))
+            logger.info("Installed sync for station %s with %d existing contacts", station, cursor.rowcount)
+        elif station is not None and station != current:
+            raise ValueError(f"Sync is already installed as station {current!r}")
+        for statement in _split(SYNC_TRIGGERS):
+            cursor.execute(statement)
+        database._commit(conn)
+        return current or station
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+def _bundle_range(file_name: str):
+    """(first clock, last clock) from a bundle file name, or None for other files."""
+    if not file_name.endswith(".jsonl.gz"):
+        return None
+    try:
+        first, last = file_name[:-len(".jsonl.gz")].split("-")
+        return int(first), int(last)
+    except ValueError:
+        return None
+
+def export_bundle(folder: str) -> str:
+    """Write this station's changes since the last export to folder. Returns the file, or None without changes."""
+    conn = database.get_connection()
+    cursor = conn.cursor()
+    try:
+        # Holding the write lock keeps local changes from slipping under the new export mark
+        cursor.execute("BEGIN IMMEDIATE")
+        station = _state(cursor, "station")
+        if station is None:
+            raise RuntimeError("Sync is not installed; run 'python -m db.sync install' first")
+        rows = cursor.execute('''
+            SELECT part1, part2, phone_number, note, deleted, clock FROM sync_rows
+            WHERE station = ? AND clock > ? ORDER BY clock
+        ''', (station, _state(cursor, "exported", 0))).fetchall()
+        if not rows:
+            conn.rollback()
+            return None
+        directory = os.path.join(folder, station)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{rows[0][5]:012d}-{rows[-1][5]:012d}.jsonl.gz")
+        # Readers only pick up complete files: write under a temporary name, then rename
+        temporary = path + ".tmp"
+        with gzip.open(temporary, "wt", encoding="utf-8") as f:
+            f.write(json.dumps({"station": station, "first": rows[0][5], "last": rows[-1][5], "rows": len(rows)}) + "\n")
+            for row in rows:
+                f.write(json.dumps(row, ensure_ascii=False) + "\n")
+        os.replace(temporary, path)
+        _set_state(cursor, "exported", rows[-1][5])
+        database._commit(conn)
+        logger.info("Exported %d changes to %s", len(rows), path)
+        return path
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+def _read_bundle(path: str) -> tuple:
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        header = json.loads(f.readline())
+        rows = [json.loads(line) for line in f if line.strip()]
+    if len(rows) != header["rows"]:
+        raise ValueError(f"{path} is incomplete: {len(rows)} of {header['rows']} rows")
+    return header, rows
+
+def apply_bundle(station: str, last: int, rows: list) -> dict:
+    """Apply one station's [part1, part2, phone, note, deleted, clock] rows in one transaction."""
+    conn = database.get_connection()
+    cursor = conn.cursor()
+    removed, added = [], []
+    try:
+        cursor.execute("BEGIN IMMEDIATE")
+        if _state(cursor, "station") is None:
+            raise RuntimeError("Sync is not installed; run 'python -m db.sync install' first")
+        cursor.execute('''
+            CREATE TEMP TABLE IF NOT EXISTS sync_incoming (
+                part1 TEXT, part2 TEXT, phone_number TEXT, note TEXT, deleted INTEGER, clock INTEGER, station TEXT
+            )
+        ''')
+        cursor.execute("DELETE FROM temp.sync_incoming")
+        cursor.executemany("INSERT INTO temp.sync_incoming VALUES (?, ?, ?, ?, ?, ?, ?)", [row + [station] for row in rows])
+        # Only versions newer than what this station already has win; contact_id shows whether the contact exists here
+        winners = cursor.execute('''
+            SELECT incoming.part1, incoming.part2, incoming.phone_number, incoming.note, incoming.deleted,
+                   incoming.clock, incoming.station, contacts.id, contacts.note
+            FROM temp.sync_incoming AS incoming
+            LEFT JOIN sync_rows AS known
+                ON known.part1 = incoming.part1 AND known.part2 = incoming.part2 AND known.phone_number = incoming.phone_number
+            LEFT JOIN plates ON plates.part1 = incoming.part1 AND plates.part2 = incoming.part2
+            LEFT JOIN contacts ON contacts.plate_id = plates.id AND contacts.phone_number = incoming.phone_number
+            WHERE known.clock IS NULL OR (incoming.clock, incoming.station) > (known.clock, known.station)
+        ''').fetchall()
+        cursor.execute("DELETE FROM temp.sync_incoming")
+
+        _set_state(cursor, "applying", 1)
+        deletes = [(part1, part2, phone_number) for part1, part2, phone_number, _, deleted, _, _, contact_id, _ in winners
+                   if deleted and contact_id is not None]
+        upserts = [(part1, part2, phone_number, note) for part1, part2, phone_number, note, deleted, _, _, _, _ in winners
+                   if not deleted]
+        database._execute_write_many(cursor, f"DELETE FROM contacts WHERE plate_id = {database.PLATE_ID} AND phone_number = ?", deletes)
+        database._execute_write_many(cursor, "INSERT OR IGNORE INTO plates (part1, part2) VALUES (?, ?)",
+                                     sorted({(part1, part2) for part1, part2, _, _ in upserts}))
+        added_at = database.now()
+        database._execute_write_many(cursor, f'''
+            INSERT INTO contacts (plate_id, phone_number, note, created_at, last_seen_at) VALUES ({database.PLATE_ID}, ?, ?, ?, ?)
+            ON CONFLICT (plate_id, phone_number) DO UPDATE SET note = excluded.note
+        ''', [upsert + (added_at, added_at) for upsert in upserts])
+        database._execute_write_many(cursor, '''
+            INSERT INTO sync_rows (part1, part2, phone_number, note, deleted, clock, station) VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (part1, part2, phone_number) DO UPDATE
+                SET note = excluded.note, deleted = excluded.deleted, clock = excluded.clock, station = excluded.station
+        ''', [winner[:7] for winner in winners])
+        # Lamport clock: later local changes must order after everything seen so far
+        database._execute_write(cursor, "UPDATE sync_state SET value = MAX(value, ?) WHERE key = 'clock'", (last,))
+        _set_state(cursor, "applying", 0)
+        _set_state(cursor, f"peer:{station}", last)
+        database._commit(conn)
+    except BaseException:
+        conn.rollback()
+        if database._mirror is not None:
+            database._mirror.invalidate()
+        raise
+    finally:
+        conn.close()
+
+    for part1, part2, phone_number, note, deleted, _, _, contact_id, old_note in winners:
+        if contact_id is not None and (deleted or note != old_note):
+            removed.append((part1, part2, phone_number))
+        if not deleted and (contact_id is None or note != old_note):
+            added.append((part1, part2, phone_number))
+    database._notify(removed, added)
+    return {"rows": len(rows), "applied": len(winners), "added": len(added), "removed": len(removed)}
+
+def import_bundles(folder: str) -> dict:
+    """Apply every bundle from other stations that this station has not applied yet."""
+    conn = database.get_connection()
+    try:
+        cursor = conn.cursor()
+        station = _state(cursor, "station")
+        peers = {key[len("peer:"):]: value for key, value in cursor.execute("SELECT key, value FROM sync_state WHERE key LIKE 'peer:%'")}
+    finally:
+        conn.close()
+    if station is None:
+        raise RuntimeError("Sync is not installed; run 'python -m db.sync install' first")
+    totals = {"bundles": 0, "rows": 0, "applied": 0, "added": 0, "removed": 0}
+    if not os.path.isdir(folder):
+        return totals
+    for peer in sorted(os.listdir(folder)):
+        directory = os.path.join(folder, peer)
+        if peer == station or not os.path.isdir(directory):
+            continue
+        # Files named after their clock range, so everything at or below the mark was applied before
+        bundles = sorted((clock_range, name) for name in os.listdir(directory)
+                         if (clock_range := _bundle_range(name)) is not None and clock_range[1] > peers.get(peer, 0))
+        for (_, last), name in bundles:
+            header, rows = _read_bundle(os.path.join(directory, name))
+            result = apply_bundle(header["station"], last, rows)
+            logger.info("Applied %s/%s: %s", peer, name, result)
+            totals["bundles"] += 1
+            for key in ("rows", "applied", "added", "removed"):
+                totals[key] += result[key]
+    return totals
+
+def sync(folder: str) -> dict:
+    """Export this station's changes to folder, then apply the other stations' new bundles."""
+    exported = export_bundle(folder)
+    result = import_bundles(folder)
+    result["exported"] = exported
+    return result
+
+def status() -> dict:
+    conn = database.get_connection()
+    try:
+        cursor = conn.cursor()
+        if cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'sync_state'").fetchone() is None:
+            return {"installed": False}
+        station = _state(cursor, "station")
+        exported = _state(cursor, "exported", 0)
+        pending = cursor.execute("SELECT COUNT(*) FROM sync_rows WHERE station = ? AND clock > ?", (station, exported)).fetchone()[0]
+        return {
+            "installed": True,
+            "station": station,
+            "clock": _state(cursor, "clock"),
+            "pending_changes": pending,
+            "peers": dict(cursor.execute("SELECT substr(key, 6), value FROM sync_state WHERE key LIKE 'peer:%' ORDER BY key").fetchall()),
+        }
+    finally:
+        conn.close()
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Delta sync between stations through a shared folder.")
+    parser.add_argument("--db", default=database.DATABASE_FILE)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    install_parser = subparsers.add_parser("install", help="start recording changes in this database")
+    install_parser.add_argument("--station", help="id of this station (default: computer name and a random suffix)")
+    for command in ("export", "import", "sync"):
+        command_parser = subparsers.add_parser(command)
+        command_parser.add_argument("folder", nargs="?", default=load_config().get("sync_folder"),
+                                    help='exchange folder (default: "sync_folder" in config.json)')
+    subparsers.add_parser("status")
+    args = parser.parse_args(argv)
+    database.DATABASE_FILE = args.db
+
+    if args.command == "install":
+        print(f"Station: {install(args.station)}")
+        return 0
+    if args.command == "status":
+        print(json.dumps(status(), ensure_ascii=False, indent=2))
+        return 0
+    if not args.folder:
+        parser.error("no folder given and no \"sync_folder\" in config.json")
+    if args.command == "export":
+        print(export_bundle(args.folder) or "No changes to export")
+    elif args.command == "import":
+        print(json.dumps(import_bundles(args.folder)))
+    else:
+        print(json.dumps(sync(args.folder), ensure_ascii=False))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
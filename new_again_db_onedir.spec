@@ -0,0 +1,75 @@
+# -*- mode: python ; coding: utf-8 -*-
+# One-directory build: nothing is unpacked at launch, so it starts much faster than
+# new_again_db.spec's one-file executable. Build with `pyinstaller new_again_db_onedir.spec`
+# and ship the whole dist/new_again_db folder.
+
+# Qt modules the application never imports; excluding them also drops their libraries and plugins
+QT_EXCLUDES = [
+    'PyQt5.QtBluetooth', 'PyQt5.QtDBus', 'PyQt5.QtDesigner', 'PyQt5.QtHelp', 'PyQt5.QtLocation',
+    'PyQt5.QtMultimedia', 'PyQt5.QtMultimediaWidgets', 'PyQt5.QtNetwork', 'PyQt5.QtNfc', 'PyQt5.QtOpenGL',
+    'PyQt5.QtPositioning', 'PyQt5.QtPrintSupport', 'PyQt5.QtQml', 'PyQt5.QtQuick', 'PyQt5.QtQuick3D',
+    'PyQt5.QtQuickWidgets', 'PyQt5.QtRemoteObjects', 'PyQt5.QtSensors', 'PyQt5.QtSerialPort', 'PyQt5.QtSql',
+    'PyQt5.QtSvg', 'PyQt5.QtTest', 'PyQt5.QtTextToSpeech', 'PyQt5.QtWebChannel', 'PyQt5.QtWebEngine',
+    'PyQt5.QtWebEngineCore', 'PyQt5.QtWebEngineWidgets', 'PyQt5.QtWebSockets', 'PyQt5.QtXml',
+    'PyQt5.QtXmlPatterns',
+]
+# Plugin folders a widgets application needs; every other Qt plugin folder is left out
+QT_PLUGINS = ('platforms', 'platformthemes', 'styles', 'imageformats')
+# Large libraries the widgets do not load: software OpenGL and the Qt translations (the UI text is built in)
+QT_UNUSED = ('opengl32sw.dll',)
+
+
+def needed(entry):
+    dest = entry[0].replace('\\', '/')
+    if '/Qt5/translations/' in dest:
+        return False
+    if '/Qt5/plugins/' in dest:
+        return dest.split('/Qt5/plugins/', 1)[1].split('/', 1)[0] in QT_PLUGINS
+    return dest.rsplit('/', 1)[-1].lower() not in QT_UNUSED
+
+
+a = Analysis(
+    ['start.py'],
+    pathex=[],
+    binaries=[],
+    datas=[],
+    # Imported lazily, only when the feature is used; listed so they are always bundled
+    hiddenimports=['db.memory_mirror', 'db.parallel_scan', 'app.startup_profile'],
+    hookspath=[],
+    hooksconfig={},
+    runtime_hooks=[],
+    excludes=QT_EXCLUDES + ['tkinter', 'unittest', 'pydoc'],
+    noarchive=False,
+    optimize=0,
+)
+a.binaries = [entry for entry in a.binaries if needed(entry)]
+a.datas = [entry for entry in a.datas if needed(entry)]
+pyz = PYZ(a.pure)
+
+exe = EXE(
+    pyz,
+    a.scripts,
+    [],
+    exclude_binaries=True,
+    name='new_again_db',
+    debug=False,
+    bootloader_ignore_signals=False,
+    strip=False,
+    # UPX-compressed Qt libraries have to be decompressed in memory on every launch
+    upx=False,
+    console=False,
+    disable_windowed_traceback=False,
+    argv_emulation=False,
+    target_arch=None,
+    codesign_identity=None,
+    entitlements_file=None,
+)
+coll = COLLECT(
+    exe,
+    a.binaries,
+    a.datas,
+    strip=False,
+    upx=False,
+    upx_exclude=[],
+    name='new_again_db',
+)
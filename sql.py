@@ -1,6 +1,8 @@
 import sqlite3
+import time
+from db.config import database_path
 
-DATABASE_FILE = "database.db"
+DATABASE_FILE = database_path()
 
 def query_by_plate(part1: str, part2: str) -> list:
     """Query the database by plate part1 and part2."""
@@ -15,10 +17,37 @@ def query_by_plate(part1: str, part2: str) -> list:
     conn.close()
     return [(f"{row[0]}-{row[1]}", row[2], row[3]) for row in data]
 
+def benchmark_lookup(count: int = 5000) -> dict:
+    """Time looking up count plates one by one with query_by_plate() against one lookup_plates() call."""
+    from db import database
+    database.DATABASE_FILE = DATABASE_FILE
+    conn = sqlite3.connect(DATABASE_FILE)
+    pairs = conn.execute("SELECT part1, part2 FROM plates ORDER BY random() LIMIT ?", (count // 2,)).fetchall()
+    conn.close()
+    # Half known plates, half misses, like a day of camera reads
+    pairs += [(f"ZZ{i}", "MISS") for i in range(count - len(pairs))]
+
+    start = time.perf_counter()
+    for part1, part2 in pairs:
+        query_by_plate(part1, part2)
+    loop_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    result = database.lookup_plates(pairs)
+    batch_seconds = time.perf_counter() - start
+    return {
+        "plates": len(pairs),
+        "found": len(result["found"]),
+        "missing": len(result["missing"]),
+        "loop_per_second": len(pairs) / loop_seconds,
+        "batch_per_second": len(pairs) / batch_seconds,
+    }
+
 # Example usage
 if __name__ == "__main__":
     part1 = "TZR"
     part2 = "L6QA"
     results = query_by_plate(part1, part2)
     for result in results:
-        print(result)
\ No newline at end of file
+        print(result)
+    print(benchmark_lookup())
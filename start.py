@@ -1,18 +1,21 @@
+import time
+SCRIPT_STARTED = time.time()  # before the other imports, for --startup-profile
 import os
 from datetime import datetime
 from PyQt5 import QtCore, QtGui, QtWidgets
 from app.main_ui import UiMainWindow
 from app.add_plate_dialog import AddPlateDialog
 from app.table_view_handler import TableViewHandler
-from app.logger import logger
-from db.database import add_plate_info, get_all_plate_info, update_plate_info, delete_plate_info
+from app.plate_completer import PlateCompleter
+from app.logger import logger, set_log_level
+from app.style_engine import FontStyleEngine
+from db.config import load_config, save_config
+from db.database import DATABASE_FILE, add_plate_info, backup_database, get_all_plate_info, update_plate_info, move_plate_info, delete_plate_info, enable_memory_mirror, disable_memory_mirror, enable_parallel_scan, disable_parallel_scan, enable_hit_tracking, disable_hit_tracking, NOTE_SEARCH
 from db.initialize_db import initialize_database
+from db.archive import archive_idle, restore
+from db.maintenance import MaintenanceScheduler, quick_check, run_maintenance, set_aside
 import sqlite3
-import shutil
-import json
-
-DATABASE_FILE = "database.db"
-CONFIG_FILE = "config.json"
+IMPORTS_DONE = time.time()
 
 class MainWindow(QtWidgets.QMainWindow, UiMainWindow):
     def __init__(self, parent=None):
@@ -20,8 +23,12 @@ class MainWindow(QtWidgets.QMainWindow, UiMainWindow):
         self.button_font_size = 20  # Initialize button font size
         self.table_font_size = 25  # Initialize table font size
         self.input_font_size = 30  # Initialize input field font size
+        self.memory_mirror = False  # Serve reads from an in-memory copy of the database
+        self.parallel_scan = False  # Run searches on shared-memory partitions in worker processes
+        self.hit_tracking = True  # Count lookups per plate, rank search results by them and cache the hottest plates
         self.load_font_size_config()  # Load font size config before applying style
         self.setup_ui(self)
+        self.style_engine = FontStyleEngine(self.central_widget, self.font_sizes)
         self.adjust_window_size()
         self.apply_modern_style()
         self.add_button.clicked.connect(self.show_add_plate_dialog)
@@ -29,43 +36,67 @@ class MainWindow(QtWidgets.QMainWindow, UiMainWindow):
         self.connect_button.clicked.connect(self.check_database_location)
         self.delete_button.clicked.connect(self.confirm_delete_selected_row)
         self.backup_button.clicked.connect(self.backup_database)
+        self.restore_button.clicked.connect(self.restore_selected_rows)
         self.pre_check_database()
+        self.maintenance_scheduler = MaintenanceScheduler(DATABASE_FILE)
+        self.maintenance_scheduler.start()
+        QtWidgets.QApplication.instance().installEventFilter(self)  # Postpones maintenance while the user is active
+        if self.memory_mirror:
+            enable_memory_mirror()
+        if self.parallel_scan:
+            enable_parallel_scan()
+        if self.hit_tracking:
+            enable_hit_tracking()
         self.initialize_table_handler()
+        self.plate_completer = PlateCompleter()
+        self.plate_completer.attach(
+            self.plate_line_edit, lambda: {"電話查詢": "phone", NOTE_SEARCH: None}.get(self.search_combo_box.currentText(), "part1"))
+        self.plate_completer.attach(self.plate_line_edit2, "part2")
         self.set_background_color()
         self.action_adjust_font_size.triggered.connect(self.show_font_size_dialog)
+        self.action_maintenance.triggered.connect(self.run_database_maintenance)
+        self.action_archive.triggered.connect(self.archive_idle_plates)
 
     def pre_check_database(self):
         if not os.path.exists(DATABASE_FILE):
-            initialize_database()
+            initialize_database(DATABASE_FILE)
             QtWidgets.QMessageBox.information(
                 self, '資料庫初始化', f'資料庫已創建於: {os.path.abspath(DATABASE_FILE)}',
                 QtWidgets.QMessageBox.Ok
             )
-        else:
-            try:
-                conn = sqlite3.connect(DATABASE_FILE)
-                cursor = conn.cursor()
-                cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='plate_info'")
-                if cursor.fetchone() is None:
-                    raise sqlite3.OperationalError("Table 'plate_info' does not exist.")
-                conn.close()
-            except sqlite3.OperationalError as e:
-                logger.error(f"Database error: {e}")
-                os.remove(DATABASE_FILE)
-                initialize_database()
-                QtWidgets.QMessageBox.information(
-                    self, '資料庫初始化', f'資料庫已創建於: {os.path.abspath(DATABASE_FILE)}',
-                    QtWidgets.QMessageBox.Ok
-                )
+            return
+        # quick_check only reads the file; nothing here ever deletes data
+        problems = quick_check(DATABASE_FILE)
+        if problems:
+            logger.error("Database check failed: %s", problems)
+        try:
+            initialize_database(DATABASE_FILE)  # Creates missing tables, migrates older databases and adds new indexes
+        except sqlite3.DatabaseError as e:
+            logger.error("Database error: %s", e)
+            kept_path = set_aside(DATABASE_FILE)
+            initialize_database(DATABASE_FILE)
+            QtWidgets.QMessageBox.critical(
+                self, '資料庫錯誤',
+                f'無法開啟資料庫，原檔案已保留於: {os.path.abspath(kept_path)}\n'
+                f'已建立新的資料庫: {os.path.abspath(DATABASE_FILE)}',
+                QtWidgets.QMessageBox.Ok
+            )
+            return
+        if problems:
+            QtWidgets.QMessageBox.warning(
+                self, '資料庫檢查',
+                '資料庫檢查發現問題，請盡快備份資料庫：\n' + '\n'.join(problems),
+                QtWidgets.QMessageBox.Ok
+            )
 
     def initialize_table_handler(self):
         try:
             self.table_handler = TableViewHandler(
                 self.table_view, self.plate_line_edit, self.plate_line_edit2, self.search_combo_box)
-            self.table_handler.load_data()  # Ensure data is loaded and columns are resized
-            self.table_view.sortByColumn(0, QtCore.Qt.AscendingOrder)  # Sort by the first column in ascending order
+            self.table_handler.on_archive_shown = self.show_archive_controls
+            self.table_handler.load_data()  # Ensure data is loaded and columns are resized, sorted by plate in the query
         except sqlite3.OperationalError as e:
-            logger.error(f"Database error: {e}")
+            logger.error("Database error: %s", e)
             QtWidgets.QMessageBox.critical(
                 self, '資料庫錯誤', '資料庫不存在或無法訪問。請點擊連接按鈕初始化資料庫。',
                 QtWidgets.QMessageBox.Ok
@@ -76,23 +107,21 @@ class MainWindow(QtWidgets.QMainWindow, UiMainWindow):
         self.setGeometry(0, 0, int(screen.width() * 0.8), int(screen.height() * 0.8))
         self.setMinimumSize(int(screen.width() * 0.6), int(screen.height() * 0.6))
 
-    def adjust_font_size(self):
+    def font_sizes(self):
         screen = QtWidgets.QDesktopWidget().screenGeometry()
         base_font_size = min(screen.width(), screen.height()) // 50
-        self.set_font_size(self.central_widget, base_font_size)
-        self.set_font_size(self.table_view, base_font_size + 2)  # Make table view font size larger
-        self.set_font_size(self.plate_line_edit, base_font_size + 10)  # Increase font size for line edits
-        self.set_font_size(self.plate_line_edit2, base_font_size + 10)  # Increase font size for line edits
-
-    def set_font_size(self, widget, font_size):
-        font = widget.font()
-        font.setPointSize(font_size)
-        widget.setFont(font)
-        for child in widget.findChildren(QtWidgets.QWidget):
-            self.set_font_size(child, font_size)
+        return base_font_size, {
+            self.table_view: base_font_size + 2,  # Make table view font size larger
+            self.plate_line_edit: base_font_size + 10,  # Increase font size for line edits
+            self.plate_line_edit2: base_font_size + 10,
+        }
+
+    def adjust_font_size(self):
+        self.style_engine.apply_fonts()
 
     def resizeEvent(self, event):
-        self.adjust_font_size()
+        start = time.perf_counter()
+        self.style_engine.request_update()  # Fonts follow once the resizing pauses
         margin = 5
         bottom_margin = 20
         self.grid_layout_widget.setGeometry(margin, margin, int(self.width() * 0.8) - margin, int(self.height() * 0.8) - margin)
@@ -100,6 +129,83 @@ class MainWindow(QtWidgets.QMainWindow, UiMainWindow):
         self.grid_layout_widget_3.setGeometry(margin, int(self.height() * 0.8) + margin, int(self.width() * 0.8) - margin, int(self.height() * 0.2) - bottom_margin)
         self.grid_layout_widget_6.setGeometry(int(self.width() * 0.8) + margin, int(self.height() * 0.8) + margin, int(self.width() * 0.2) - margin, int(self.height() * 0.2) - bottom_margin)
         super(MainWindow, self).resizeEvent(event)
+        self.style_engine.record_frame(time.perf_counter() - start)
+
+    def eventFilter(self, watched, event):
+        if event.type() in (QtCore.QEvent.KeyPress, QtCore.QEvent.MouseButtonPress):
+            self.maintenance_scheduler.touch()
+        return super(MainWindow, self).eventFilter(watched, event)
+
+    def run_database_maintenance(self):
+        QtWidgets.QApplication.setOverrideCursor(QtCore.Qt.WaitCursor)
+        try:
+            report = run_maintenance(DATABASE_FILE)
+        except sqlite3.Error as e:
+            QtWidgets.QMessageBox.critical(self, '錯誤', f'資料庫維護失敗: {e}', QtWidgets.QMessageBox.Ok)
+            return
+        finally:
+            QtWidgets.QApplication.restoreOverrideCursor()
+        QtWidgets.QMessageBox.information(
+            self, '資料庫維護',
+            f"檔案大小: {report['file_size_before'] / 1024:.0f} KB → {report['file_size'] / 1024:.0f} KB\n"
+            f"可用頁面: {report['free_pages_before']} → {report['free_pages']}\n"
+            f"耗時: {report['seconds']:.2f} 秒",
+            QtWidgets.QMessageBox.Ok
+        )
+
+    def archive_idle_plates(self):
+        days = load_config().get("archive_after_days", 730)
+        answer = QtWidgets.QMessageBox.question(
+            self, '封存資料', f'將超過 {days} 天未來店的車牌移到封存資料庫，查詢不到時仍會自動搜尋封存資料。是否繼續？',
+            QtWidgets.QMessageBox.Yes | QtWidgets.QMessageBox.No
+        )
+        if answer != QtWidgets.QMessageBox.Yes:
+            return
+        QtWidgets.QApplication.setOverrideCursor(QtCore.Qt.WaitCursor)
+        try:
+            result = archive_idle(days)
+        except sqlite3.Error as e:
+            QtWidgets.QMessageBox.critical(self, '錯誤', f'封存失敗: {e}', QtWidgets.QMessageBox.Ok)
+            return
+        finally:
+            QtWidgets.QApplication.restoreOverrideCursor()
+        self.table_handler.filter_table()
+        QtWidgets.QMessageBox.information(
+            self, '封存完成', f"已封存 {result['plates']} 個車牌的 {result['contacts']} 筆資料。", QtWidgets.QMessageBox.Ok
+        )
+
+    def show_archive_controls(self, showing_archive):
+        # Archived rows live in the archive database; they can only be restored, not edited or deleted
+        self.restore_button.setVisible(showing_archive)
+        self.modify_button.setEnabled(not showing_archive)
+        self.delete_button.setEnabled(not showing_archive)
+
+    def restore_selected_rows(self):
+        rows = self.table_handler.selected_rows()
+        if not rows:
+            QtWidgets.QMessageBox.warning(self, '還原資料', '請先選擇要還原的資料。', QtWidgets.QMessageBox.Ok)
+            return
+        plates = {self.table_handler.row_key(row)[:2] for row in rows}
+        try:
+            restored = restore(plates)
+        except sqlite3.Error as e:
+            QtWidgets.QMessageBox.critical(self, '錯誤', f'還原失敗: {e}', QtWidgets.QMessageBox.Ok)
+            return
+        self.table_handler.filter_table()
+        QtWidgets.QMessageBox.information(self, '還原完成', f'已還原 {restored} 筆資料。', QtWidgets.QMessageBox.Ok)
+
+    def closeEvent(self, event):
+        logger.debug("Resize timings (ms): %s", self.style_engine.frame_stats())
+        self.maintenance_scheduler.stop()
+        self.plate_completer.close()
+        disable_parallel_scan()
+        disable_hit_tracking()  # writes the counts not yet flushed, before the mirror is dropped
+        if self.memory_mirror and not disable_memory_mirror():
+            QtWidgets.QMessageBox.warning(
+                self, '資料庫警告', '記憶體快取與資料庫檔案不一致，請確認資料是否完整。',
+                QtWidgets.QMessageBox.Ok
+            )
+        super(MainWindow, self).closeEvent(event)
 
     def keyPressEvent(self, event):
         if event.key() == QtCore.Qt.Key_Escape:
@@ -127,31 +233,37 @@ class MainWindow(QtWidgets.QMainWindow, UiMainWindow):
         dialog = AddPlateDialog(self, 'add')
         while dialog.exec_() == QtWidgets.QDialog.Accepted:
             plate_info = dialog.get_plate_info()
-            logger.debug(f"Adding plate info: {plate_info}")
+            logger.debug("Adding plate info: %s", plate_info)
             add_plate_info(
                 part1=plate_info[0],
                 part2=plate_info[1],
                 phone_number=plate_info[2],
                 note=plate_info[3]
             )
-            logger.info(f"新增車牌號碼: {plate_info}")
+            logger.info("新增車牌號碼: %s", plate_info)
             self.table_handler.load_data()
             dialog = AddPlateDialog(self, 'add')
 
     def confirm_delete_selected_row(self):
-        selected_row = self.table_view.currentRow()
-        if selected_row >= 0:
-            plate_info = self.table_view.item(selected_row, 0).text()
-            phone_number = self.table_view.item(selected_row, 1).text()
+        selected_rows = self.table_handler.selected_rows()
+        if selected_rows:
             msg_box = QtWidgets.QMessageBox()
             msg_box.setIcon(QtWidgets.QMessageBox.Question)
             msg_box.setWindowTitle('確認刪除')
-            msg_box.setText(f"確定要刪除車牌號碼 {plate_info} 和電話號碼 {phone_number} 嗎？")
+            if len(selected_rows) == 1:
+                plate_info = self.table_view.item(selected_rows[0], 0).text()
+                phone_number = self.table_view.item(selected_rows[0], 1).text()
+                msg_box.setText(f"確定要刪除車牌號碼 {plate_info} 和電話號碼 {phone_number} 嗎？")
+            else:
+                msg_box.setText(f"確定要刪除所選的 {len(selected_rows)} 筆資料嗎？")
             yes_button = msg_box.addButton("是", QtWidgets.QMessageBox.YesRole)
             no_button = msg_box.addButton("否", QtWidgets.QMessageBox.NoRole)
             msg_box.exec_()
             if msg_box.clickedButton() == yes_button:
-                self.table_handler.delete_selected_row()
+                deleted = self.table_handler.delete_selected_rows()
+                QtWidgets.QMessageBox.information(
+                    self, '刪除完成', f'已刪除 {deleted} 筆資料。', QtWidgets.QMessageBox.Ok
+                )
 
     def update_line_edits(self):
         self.plate_line_edit.clear()
@@ -163,6 +275,11 @@ class MainWindow(QtWidgets.QMainWindow, UiMainWindow):
             self.grid_layout_5.addWidget(self.plate_line_edit, 0, 1, 1, 2)
             self.plate_line_edit.setMaxLength(10)
             self.plate_line_edit.setValidator(QtGui.QIntValidator())
+        elif self.search_combo_box.currentText() == NOTE_SEARCH:
+            self.plate_line_edit2.hide()
+            self.grid_layout_5.addWidget(self.plate_line_edit, 0, 1, 1, 2)
+            self.plate_line_edit.setMaxLength(100)
+            self.plate_line_edit.setValidator(None)  # free text, e.g. 白色 豐田
         else:
             self.plate_line_edit2.show()
             self.grid_layout_5.addWidget(self.plate_line_edit, 0, 1, 1, 1)
@@ -184,10 +301,13 @@ class MainWindow(QtWidgets.QMainWindow, UiMainWindow):
         )
 
     def modify_selected_row(self):
+        if len(self.table_handler.selected_rows()) > 1:
+            self.modify_selected_rows()
+            return
         selected_row = self.table_view.currentRow()
         if selected_row >= 0:
             plate_info = self.table_view.item(selected_row, 0).text()
-            phone_number = self.table_view.item(selected_row, 1).text().replace('-', '')
+            phone_number = self.table_view.item(selected_row, 1).data(QtCore.Qt.UserRole)
             note = self.table_view.item(selected_row, 2).text()
             part1, part2 = plate_info.split('-')
 
@@ -199,8 +319,55 @@ class MainWindow(QtWidgets.QMainWindow, UiMainWindow):
 
             if dialog.exec_() == QtWidgets.QDialog.Accepted:
                 new_part1, new_part2, new_phone_number, new_note = dialog.get_plate_info()
-                update_plate_info(new_part1, new_part2, new_phone_number, new_note)
-                self.table_handler.update_row(selected_row, f"{new_part1}-{new_part2}", new_phone_number, new_note)
+                if (new_part1.upper(), new_part2.upper()) == (part1, part2):
+                    if not update_plate_info(part1, part2, new_phone_number, new_note, old_phone_number=phone_number):
+                        QtWidgets.QMessageBox.warning(
+                            self, '修改資料',
+                            f'無法修改 {part1}-{part2}：該車牌已有此電話號碼，或原資料已被刪除。',
+                            QtWidgets.QMessageBox.Ok
+                        )
+                        return
+                elif not move_plate_info(part1, part2, phone_number, new_part1, new_part2, new_phone_number, new_note):
+                    QtWidgets.QMessageBox.warning(
+                        self, '修改資料',
+                        f'無法將資料移到 {new_part1.upper()}-{new_part2.upper()}：該車牌已有此電話號碼，或原資料已被刪除。',
+                        QtWidgets.QMessageBox.Ok
+                    )
+                    return
+                self.table_handler.update_row(selected_row, f"{new_part1.upper()}-{new_part2.upper()}", new_phone_number, new_note)
+
+    def modify_selected_rows(self):
+        count = len(self.table_handler.selected_rows())
+        batch_dialog = QtWidgets.QDialog(self)
+        batch_dialog.setWindowTitle(f"批次修改 {count} 筆資料")
+        layout = QtWidgets.QFormLayout(batch_dialog)
+        phone_number_line_edit = QtWidgets.QLineEdit()
+        phone_number_line_edit.setMaxLength(10)
+        phone_number_line_edit.setValidator(QtGui.QIntValidator())
+        phone_number_line_edit.setPlaceholderText("留空表示不變更")
+        note_line_edit = QtWidgets.QLineEdit()
+        note_line_edit.setPlaceholderText("留空表示不變更")
+        layout.addRow("電話號碼:", phone_number_line_edit)
+        layout.addRow("備註:", note_line_edit)
+        button_box = QtWidgets.QDialogButtonBox(QtWidgets.QDialogButtonBox.Ok | QtWidgets.QDialogButtonBox.Cancel)
+        button_box.accepted.connect(batch_dialog.accept)
+        button_box.rejected.connect(batch_dialog.reject)
+        layout.addRow(button_box)
+
+        if batch_dialog.exec_() == QtWidgets.QDialog.Accepted:
+            new_phone_number = phone_number_line_edit.text() or None
+            new_note = note_line_edit.text() or None
+            if new_phone_number is None and new_note is None:
+                return
+            updated = self.table_handler.update_selected_rows(new_phone_number, new_note)
+            if updated:
+                QtWidgets.QMessageBox.information(
+                    self, '修改完成', f'已修改 {updated} 筆資料。', QtWidgets.QMessageBox.Ok
+                )
+            else:
+                QtWidgets.QMessageBox.critical(
+                    self, '錯誤', '修改失敗：同一車牌不可有重複的電話號碼。', QtWidgets.QMessageBox.Ok
+                )
 
     def backup_database(self):
         options = QtWidgets.QFileDialog.Options()
@@ -218,7 +385,7 @@ class MainWindow(QtWidgets.QMainWindow, UiMainWindow):
                     None, "Backup Database", default_filename, "SQLite Database Files (*.db);;All Files (*)", options=options)
                 if file_path:
                     try:
-                        shutil.copyfile(DATABASE_FILE, file_path)
+                        backup_database(file_path)  # Also copies pages still in the WAL with WAL profiles
                         QtWidgets.QMessageBox.information(None, '成功', '資料庫備份成功。', QtWidgets.QMessageBox.Ok)
                     except Exception as e:
                         QtWidgets.QMessageBox.critical(None, '錯誤', f'資料庫備份失敗: {e}', QtWidgets.QMessageBox.Ok)
@@ -246,21 +413,24 @@ class MainWindow(QtWidgets.QMainWindow, UiMainWindow):
         self.setPalette(palette)
 
     def load_font_size_config(self):
-        if os.path.exists(CONFIG_FILE):
-            with open(CONFIG_FILE, 'r') as file:
-                config = json.load(file)
-                self.button_font_size = config.get("button_font_size", self.button_font_size)
-                self.table_font_size = config.get("table_font_size", self.table_font_size)
-                self.input_font_size = config.get("input_font_size", self.input_font_size)
+        config = load_config()
+        self.button_font_size = config.get("button_font_size", self.button_font_size)
+        self.table_font_size = config.get("table_font_size", self.table_font_size)
+        self.input_font_size = config.get("input_font_size", self.input_font_size)
+        self.memory_mirror = config.get("memory_mirror", self.memory_mirror)
+        self.parallel_scan = config.get("parallel_scan", self.parallel_scan)
+        self.hit_tracking = config.get("hit_tracking", self.hit_tracking)
+        if "log_level" in config:
+            set_log_level(config["log_level"])
 
     def save_font_size_config(self):
-        config = {
+        # save_config keeps the other keys, such as database_file and branches
+        save_config({
             "button_font_size": self.button_font_size,
             "table_font_size": self.table_font_size,
-            "input_font_size": self.input_font_size
-        }
-        with open(CONFIG_FILE, 'w') as file:
-            json.dump(config, file)
+            "input_font_size": self.input_font_size,
+            "memory_mirror": self.memory_mirror
+        })
 
     def show_font_size_dialog(self):
         font_size_dialog = QtWidgets.QDialog(self)
@@ -342,15 +512,26 @@ class MainWindow(QtWidgets.QMainWindow, UiMainWindow):
             font-size: {self.table_font_size}px;
         }}
         """
-        self.setStyleSheet(style_sheet)
+        self.style_engine.set_style_sheet(self, style_sheet)
         self.adjust_font_size()
 
 if __name__ == "__main__":
+    import multiprocessing
     import sys
+    multiprocessing.freeze_support()  # the parallel scan's worker processes start through this entry point when frozen
     app = QtWidgets.QApplication(sys.argv)
+    startup_profile = None
+    if "--startup-profile" in sys.argv:
+        # Measures launch to first paint, records it and quits
+        from app.startup_profile import StartupProfile
+        startup_profile = StartupProfile(SCRIPT_STARTED, IMPORTS_DONE)
     main_window = MainWindow()
+    if startup_profile is not None:
+        startup_profile.watch_first_paint(main_window)
     main_window.show()
     main_window.showMaximized()  # Maximize the window by default
+    if startup_profile is not None:
+        startup_profile.mark("window_shown")
     
     # Ensure the application exits cleanly
     exit_code = app.exec_()
@@ -0,0 +1,291 @@
+"""Concurrent write/read stress test: several processes sharing one database file, like counter PCs on one share.
+
+Each worker process runs a random mix of adds, note updates, deletes and plate searches
+through db/database.py for a fixed time, retrying an operation that fails with
+"database is locked" after a short random backoff. Every worker only writes plates of its
+own (W<worker>-<5 digits>), keeps its own record of what those plates should hold, and
+checks each search of one of them against it. At the end the database is compared with
+every worker's record, so a write that was reported as done but did not survive, or one
+that was reported as failed but did, shows up as lost or phantom.
+
+    python stress.py                                  # 4 processes, 10 seconds, default profile
+    python stress.py --processes 8 --profiles default wal --busy-timeout 100
+    python stress.py --db database.db --json          # on a copy of an existing database
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import queue
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from app.logger import set_log_level
+from db import database
+from db.storage import PROFILES, apply_profile
+
+OPERATIONS = ("add", "update", "delete", "filter")
+DEFAULT_MIX = {"add": 30, "update": 25, "delete": 10, "filter": 35}
+
+def _is_locked(error: sqlite3.OperationalError) -> bool:
+    message = str(error).lower()
+    return "locked" in message or "busy" in message
+
+def _percentiles(samples: list) -> dict:
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+    pick = lambda share: ordered[min(len(ordered) - 1, int(len(ordered) * share))] * 1000
+    return {"count": len(ordered), "p50": pick(0.5), "p95": pick(0.95), "p99": pick(0.99), "max": ordered[-1] * 1000}
+
+class _Worker:
+    """One process's workload and what it believes its plates hold."""
+
+    def __init__(self, index: int, max_retries: int, seed: int):
+        self.index = index
+        self.max_retries = max_retries
+        self.random = random.Random(seed * 1000 + index)
+        self.contacts = {}  # (part1, part2) -> {phone_number: note}
+        self.next_plate = 0
+        self.next_phone = 0
+        self.latencies = {operation: [] for operation in OPERATIONS}
+        self.stats = {"attempts": 0, "locked": 0, "retries": 0, "gave_up": 0, "errors": 0,
+                      "mismatches": 0, "stale_reads": 0}
+        self.error_messages = {}
+
+    def _call(self, func, *args):
+        """Run func, retrying on 'database is locked'. Returns (True, result), or (False, None) when it gave up."""
+        for attempt in range(self.max_retries + 1):
+            self.stats["attempts"] += 1
+            try:
+                return True, func(*args)
+            except sqlite3.OperationalError as e:
+                if not _is_locked(e):
+                    raise
+                self.stats["locked"] += 1
+                if attempt == self.max_retries:
+                    self.stats["gave_up"] += 1
+                    return False, None
+                self.stats["retries"] += 1
+                time.sleep(self.random.uniform(0, min(0.01 * 2 ** attempt, 0.2)))
+
+    def _pick_contact(self):
+        plate = self.random.choice(list(self.contacts))
+        return plate, self.random.choice(list(self.contacts[plate]))
+
+    def add(self) -> None:
+        if self.contacts and self.random.random() < 0.3:
+            plate = self.random.choice(list(self.contacts))  # another phone number for a known plate
+        else:
+            plate = (f"W{self.index:02d}", f"{self.next_plate:05d}")
+            self.next_plate += 1
+        phone_number = f"09{self.index:02d}{self.next_phone:06d}"
+        self.next_phone += 1
+        note = f"add {self.next_phone}"
+        done, added = self._call(database.add_plate_info, *plate, phone_number, note)
+        if done:
+            if added:
+                self.contacts.setdefault(plate, {})[phone_number] = note
+            else:
+                self.stats["mismatches"] += 1
+
+    def update(self) -> None:
+        if not self.contacts:
+            return self.add()
+        plate, phone_number = self._pick_contact()
+        note = f"update {self.random.random():.6f}"
+        done, updated = self._call(database.update_plate_infos, [plate + (phone_number,)], None, note)
+        if done:
+            if updated == 1:
+                self.contacts[plate][phone_number] = note
+            else:
+                self.stats["mismatches"] += 1
+
+    def delete(self) -> None:
+        if not self.contacts:
+            return self.add()
+        plate, phone_number = self._pick_contact()
+        done, deleted = self._call(database.delete_plate_infos, [plate + (phone_number,)])
+        if done:
+            if deleted == 1:
+                del self.contacts[plate][phone_number]
+                if not self.contacts[plate]:
+                    del self.contacts[plate]
+            else:
+                self.stats["mismatches"] += 1
+
+    def filter(self) -> None:
+        if not self.contacts or self.random.random() < 0.2:
+            # A search across everybody's rows, like typing the start of a phone number
+            self._call(database.filter_plate_info, "", "", f"09{self.random.randrange(100):02d}", "電話查詢", "plate", False, 50)
+            return
+        plate = self.random.choice(list(self.contacts))
+        done, rows = self._call(database.filter_plate_info, *plate, "", "車牌查詢")
+        if done:
+            expected = sorted((f"{plate[0]}-{plate[1]}", phone_number, note) for phone_number, note in self.contacts[plate].items())
+            if sorted(rows) != expected:
+                self.stats["stale_reads"] += 1
+
+    def run(self, seconds: float) -> None:
+        operations = list(DEFAULT_MIX)
+        weights = [DEFAULT_MIX[operation] for operation in operations]
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            operation = self.random.choices(operations, weights)[0]
+            start = time.perf_counter()
+            try:
+                getattr(self, operation)()
+            except sqlite3.Error as e:
+                self.stats["errors"] += 1
+                self.error_messages[str(e)] = self.error_messages.get(str(e), 0) + 1
+            self.latencies[operation].append(time.perf_counter() - start)
+
+def _run_worker(index: int, database_file: str, profile: str, busy_timeout: int, seconds: float,
+                max_retries: int, seed: int, log_level: str, ready, start, results) -> None:
+    set_log_level(log_level)
+    database.DATABASE_FILE = database_file
+    database.set_storage_profile(profile)
+    if busy_timeout is not None:
+        database._connection_pragmas = database._connection_pragmas + [f"PRAGMA busy_timeout = {int(busy_timeout)}"]
+    worker = _Worker(index, max_retries, seed)
+    ready.release()
+    start.wait()
+    worker.run(seconds)
+    results.put({
+        "index": index,
+        "latencies": worker.latencies,
+        "stats": worker.stats,
+        "error_messages": worker.error_messages,
+        "contacts": [[part1, part2, phone_number, note] for (part1, part2), phones in worker.contacts.items()
+                     for phone_number, note in phones.items()],
+    })
+
+def _verify(database_file: str, results: list) -> dict:
+    """Compare the rows of every worker's plates in the database with what the worker recorded."""
+    expected = {tuple(row) for result in results for row in result["contacts"]}
+    conn = sqlite3.connect(database_file)
+    try:
+        # Worker plates have a five-digit part2, which keeps them apart from the seeded rows
+        actual = set(conn.execute(f'''
+            {database.PLATE_INFO_SELECT}
+            WHERE plates.part1 GLOB 'W[0-9][0-9]' AND length(plates.part2) = 5
+        ''').fetchall())
+        integrity = conn.execute("PRAGMA quick_check").fetchone()[0]
+    finally:
+        conn.close()
+    return {"expected_rows": len(expected), "lost": len(expected - actual), "phantom": len(actual - expected),
+            "integrity": integrity}
+
+def run(database_file: str, processes: int = 4, seconds: float = 10.0, profile: str = "default",
+        busy_timeout: int = None, max_retries: int = 3, seed: int = 1, log_level: str = "WARNING") -> dict:
+    """Run the workload in processes worker processes against database_file and return the measurements."""
+    context = multiprocessing.get_context("spawn")  # what Windows does, so both behave the same
+    ready, start, results = context.Semaphore(0), context.Event(), context.Queue()
+    workers = [context.Process(target=_run_worker, args=(index, database_file, profile, busy_timeout, seconds,
+                                                         max_retries, seed, log_level, ready, start, results))
+               for index in range(processes)]
+    for worker in workers:
+        worker.start()
+    for _ in workers:
+        ready.acquire()  # start everybody at once, after the imports
+    began = time.perf_counter()
+    start.set()
+    collected = []
+    while len(collected) < len(workers):
+        try:
+            collected.append(results.get(timeout=1))
+        except queue.Empty:
+            if any(worker.exitcode not in (None, 0) for worker in workers):
+                for worker in workers:
+                    worker.terminate()
+                raise RuntimeError("a stress worker process failed; see its traceback above")
+    elapsed = time.perf_counter() - began
+    for worker in workers:
+        worker.join()
+
+    latencies = {operation: [] for operation in OPERATIONS}
+    stats = dict.fromkeys(collected[0]["stats"], 0)
+    error_messages = {}
+    for result in collected:
+        for operation, samples in result["latencies"].items():
+            latencies[operation] += samples
+        for key, value in result["stats"].items():
+            stats[key] += value
+        for message, count in result["error_messages"].items():
+            error_messages[message] = error_messages.get(message, 0) + count
+    operations = sum(len(samples) for samples in latencies.values())
+    return {
+        "profile": profile,
+        "processes": processes,
+        "busy_timeout_ms": busy_timeout,
+        "seconds": elapsed,
+        "operations": operations,
+        "ops_per_second": operations / elapsed,
+        "latency_ms": {operation: _percentiles(samples) for operation, samples in latencies.items()},
+        **stats,
+        "locked_rate": stats["locked"] / stats["attempts"] if stats["attempts"] else 0.0,
+        "error_messages": error_messages,
+        **_verify(database_file, collected),
+    }
+
+def _prepare(path: str, source: str, records: int, profile: str) -> None:
+    if source:
+        target = sqlite3.connect(path)
+        conn = sqlite3.connect(source)
+        try:
+            conn.backup(target)  # never stress the real file
+        finally:
+            conn.close()
+            target.close()
+    else:
+        from test import generate_data
+        generate_data(records, path)
+    apply_profile(path, profile)
+
+def _print_result(result: dict) -> None:
+    print(f"{result['profile']}: {result['processes']} processes, {result['operations']} operations in "
+          f"{result['seconds']:.1f} s ({result['ops_per_second']:.0f}/s)")
+    for operation, latency in result["latency_ms"].items():
+        if latency["count"]:
+            print(f"  {operation:8} {latency['count']:7}  p50 {latency['p50']:8.2f} ms  p95 {latency['p95']:8.2f} ms"
+                  f"  p99 {latency['p99']:8.2f} ms  max {latency['max']:8.2f} ms")
+    print(f"  locked {result['locked']} of {result['attempts']} attempts ({result['locked_rate']:.2%}), "
+          f"{result['retries']} retries, {result['gave_up']} gave up, {result['errors']} other errors")
+    for message, count in result["error_messages"].items():
+        print(f"    {count} x {message}")
+    print(f"  {result['expected_rows']} rows expected: {result['lost']} lost, {result['phantom']} phantom, "
+          f"{result['mismatches']} unexpected results, {result['stale_reads']} stale reads, quick_check {result['integrity']}")
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Multi-process write/read stress test on one database file.")
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--profiles", nargs="+", default=["default"], choices=list(PROFILES),
+                        help="storage profiles (journal mode etc.) to compare, each on a fresh copy")
+    parser.add_argument("--busy-timeout", type=int, help="PRAGMA busy_timeout in ms (default: the 5 s sqlite3.connect timeout)")
+    parser.add_argument("--retries", type=int, default=3, help="retries of an operation that hit 'database is locked'")
+    parser.add_argument("--records", type=int, default=10000, help="rows generated for the starting database")
+    parser.add_argument("--db", help="start from a copy of this database instead of generated rows")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="stress_")
+    results = []
+    for profile in args.profiles:
+        database_file = os.path.join(workdir, f"{profile}.db")
+        _prepare(database_file, args.db, args.records, profile)
+        result = run(database_file, args.processes, args.seconds, profile, args.busy_timeout, args.retries, args.seed)
+        results.append(result)
+        if not args.json:
+            _print_result(result)
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+    failed = [result for result in results
+              if result["lost"] or result["phantom"] or result["mismatches"] or result["integrity"] != "ok"]
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
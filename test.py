@@ -1,6 +1,7 @@
 import random
 import string
 import sqlite3
+from db.initialize_db import initialize_database
 
 def generate_random_string(length=6):
     return ''.join(random.choices(string.ascii_uppercase + string.digits, k=length))
@@ -22,15 +23,10 @@ def generate_data(num_records=10000, db_path='database.db'):
             note = generate_random_string(10)
             data.append((part1, part2, phone_number, note))
 
+    initialize_database(db_path)
     conn = sqlite3.connect(db_path)
     cursor = conn.cursor()
-    cursor.execute('''CREATE TABLE IF NOT EXISTS plate_info (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        part1 TEXT NOT NULL,
-                        part2 TEXT NOT NULL,
-                        phone_number TEXT NOT NULL,
-                        note TEXT,
-                        UNIQUE(part1, part2, phone_number))''')
+    # plate_info is a view over plates/contacts; its triggers split each row
     cursor.executemany("INSERT OR IGNORE INTO plate_info (part1, part2, phone_number, note) VALUES (?, ?, ?, ?)", data)
     conn.commit()
     conn.close()
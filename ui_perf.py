@@ -0,0 +1,196 @@
+"""Headless UI performance check: drives MainWindow offscreen and fails when it gets slower.
+
+For each database size a child process generates a database, starts MainWindow with
+QT_QPA_PLATFORM=offscreen, types plates, switches the search mode, adds and deletes
+through the dialogs and resizes the window, timing each event until the UI is idle.
+
+    python ui_perf.py                               # 1000, 10000 and 50000 records
+    python ui_perf.py --sizes 20000 --save-baseline ui_baseline.json
+    python ui_perf.py --baseline ui_baseline.json   # also fail on >25% p95 regressions
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+# p95 latency limits in milliseconds per event type, and the peak RSS limit in MB
+THRESHOLDS = {
+    "startup": 5000,
+    "type_plate": 250,
+    "switch_search_mode": 500,
+    "add_dialog": 1000,
+    "delete_dialog": 1000,
+    "resize": 100,
+    "peak_rss_mb": 500,
+}
+
+def _percentiles(samples: list) -> dict:
+    ordered = sorted(samples)
+    return {
+        "count": len(ordered),
+        "p50": ordered[len(ordered) // 2] * 1000,
+        "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000,
+        "max": ordered[-1] * 1000,
+    }
+
+def _peak_rss_mb() -> float:
+    try:
+        import resource
+    except ImportError:  # Windows
+        return 0.0
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KB on Linux
+
+def run_scenario(records: int, rounds: int = 20) -> dict:
+    """Run the UI scenario in this process against a fresh database and config.json of the given size."""
+    # Windows refuses to delete the database while a connection is still open; leave it for the system then
+    with tempfile.TemporaryDirectory(prefix="ui_perf_", ignore_cleanup_errors=True) as workdir:
+        return _run_scenario(workdir, records, rounds)
+
+def _run_scenario(workdir: str, records: int, rounds: int) -> dict:
+    database_file = os.path.join(workdir, "database.db")
+    os.environ["QT_QPA_PLATFORM"] = "offscreen"
+    os.environ["NEW_AGAIN_DB"] = database_file
+    # MainWindow saves its settings on close; keep them away from the real config.json
+    os.environ["NEW_AGAIN_CONFIG"] = os.path.join(workdir, "config.json")
+    os.environ.setdefault("NEW_AGAIN_LOG_LEVEL", "WARNING")
+
+    from test import generate_data
+    generate_data(records, database_file)
+    from PyQt5 import QtCore, QtTest, QtWidgets
+    from app.add_plate_dialog import AddPlateDialog
+    from start import MainWindow
+
+    app = QtWidgets.QApplication.instance() or QtWidgets.QApplication(sys.argv)
+    timings = {}
+    pending_adds = []
+
+    def settle():
+        app.processEvents()
+        app.processEvents()
+
+    def timed(name, action):
+        start = time.perf_counter()
+        action()
+        settle()
+        timings.setdefault(name, []).append(time.perf_counter() - start)
+
+    def answer_modal():
+        """Stand in for the user on whatever modal dialog is open."""
+        dialog = app.activeModalWidget()
+        if isinstance(dialog, AddPlateDialog):
+            if pending_adds:
+                part1, part2, phone_number, note = pending_adds.pop()
+                dialog.plate_part1_line_edit.setText(part1)
+                dialog.plate_part2_line_edit.setText(part2)
+                dialog.phone_number_line_edit.setText(phone_number)
+                dialog.note_line_edit.setText(note)
+                dialog.accept()
+            else:
+                dialog.reject()  # show_add_plate_dialog reopens the dialog after each add
+        elif isinstance(dialog, QtWidgets.QMessageBox):
+            yes = [button for button in dialog.buttons() if button.text() == "是"]
+            (yes[0] if yes else dialog.buttons()[0]).click()
+
+    responder = QtCore.QTimer()
+    responder.timeout.connect(answer_modal)
+    responder.start(5)
+
+    start = time.perf_counter()
+    window = MainWindow()
+    window.show()
+    settle()
+    timings["startup"] = [time.perf_counter() - start]
+
+    for i in range(rounds):
+        plate = f"T{i % 10}{chr(65 + i % 26)}"
+        window.plate_line_edit.clear()
+        settle()
+        for character in plate:
+            timed("type_plate", lambda: QtTest.QTest.keyClicks(window.plate_line_edit, character))
+        timed("switch_search_mode", lambda: window.search_combo_box.setCurrentIndex(1))
+        timed("switch_search_mode", lambda: window.search_combo_box.setCurrentIndex(0))
+
+        pending_adds.append((f"UI{i:02d}", "PERF", f"09{i:08d}", "ui_perf"))
+        timed("add_dialog", window.show_add_plate_dialog)
+        window.plate_line_edit.setText(f"UI{i:02d}")
+        settle()
+        window.table_view.selectRow(0)
+        timed("delete_dialog", window.confirm_delete_selected_row)
+
+        width, height = 800 + (i % 5) * 100, 600 + (i % 4) * 80
+        timed("resize", lambda: window.resize(width, height))
+
+    responder.stop()
+    window.close()
+    settle()
+    result = {name: _percentiles(samples) for name, samples in timings.items()}
+    result["font_passes"] = window.style_engine.frame_stats()["font_pass"]
+    result["peak_rss_mb"] = _peak_rss_mb()
+    result["records"] = records
+    return result
+
+def check(results: list, thresholds: dict, baseline: dict = None, tolerance: float = 0.25) -> list:
+    """Return a description of every threshold or baseline regression."""
+    failures = []
+    for result in results:
+        records = str(result["records"])
+        for name, limit in thresholds.items():
+            if name == "peak_rss_mb":
+                value = result["peak_rss_mb"]
+            elif name in result:
+                value = result[name]["p95"]
+            else:
+                continue
+            if value > limit:
+                failures.append(f"{records} records: {name} {value:.1f} > limit {limit}")
+            previous = (baseline or {}).get(records, {}).get(name)
+            if previous is not None:
+                previous_value = previous if name == "peak_rss_mb" else previous["p95"]
+                if previous_value and value > previous_value * (1 + tolerance):
+                    failures.append(f"{records} records: {name} {value:.1f} regressed from baseline {previous_value:.1f}")
+    return failures
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Offscreen UI performance check.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare against")
+    parser.add_argument("--save-baseline", help="write this run's results here")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed p95 growth over the baseline")
+    parser.add_argument("--run-one", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.run_one is not None:
+        print(json.dumps(run_scenario(args.run_one, args.rounds)))
+        return 0
+
+    results = []
+    for records in args.sizes:
+        # One process per size so that peak RSS and Qt state do not carry over
+        output = subprocess.run([sys.executable, os.path.abspath(__file__), "--run-one", str(records), "--rounds", str(args.rounds)],
+                                check=True, capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        results.append(result)
+        print(f"{records} records, peak RSS {result['peak_rss_mb']:.0f} MB")
+        for name in THRESHOLDS:
+            if name in result and name != "peak_rss_mb":
+                print(f"  {name:20} p50 {result[name]['p50']:8.1f} ms  p95 {result[name]['p95']:8.1f} ms  max {result[name]['max']:8.1f} ms")
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump({str(result["records"]): result for result in results}, f, indent=2)
+
+    failures = check(results, THRESHOLDS, baseline, args.tolerance)
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())